@@ -13,7 +13,16 @@ class OscarOdinAppConfig(OscarConfig):
     def ready(self):
         """Hook that Django apps have been loaded."""
 
-        # Register the default prefetches for the product queryset
-        from oscar_odin.mappings.prefetching.prefetch import register_default_prefetches
+        # Register the default prefetches for the product and order querysets
+        from oscar_odin.mappings.prefetching.prefetch import (
+            register_default_order_prefetches,
+            register_default_prefetches,
+        )
 
         register_default_prefetches()
+        register_default_order_prefetches()
+
+        # Invalidate cached product resources when the products change
+        from oscar_odin.cache import connect_signals
+
+        connect_signals()
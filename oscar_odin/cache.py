@@ -0,0 +1,210 @@
+# pylint: disable=W0613
+"""Cache for mapped product resources.
+
+Resources are stored in the Django cache per product, mapper, strategy, whether
+children are included and the projected fields. Every product has a version token that is part of the cache
+key, invalidating a product replaces its token so all its cached resources are
+ignored from then on. Changes to tables that are shared by many products, like
+categories, replace a global token instead.
+"""
+import hashlib
+from typing import Dict, Iterable, Optional
+from uuid import uuid4
+
+from django.core.cache import caches
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from oscar.core.loading import get_model
+
+from . import settings as odin_settings
+
+__all__ = (
+    "ProductResourceCache",
+    "get_product_resource_cache",
+    "invalidate_product_resources",
+    "invalidate_all_product_resources",
+    "connect_signals",
+)
+
+ProductModel = get_model("catalogue", "Product")
+ProductCategoryModel = get_model("catalogue", "ProductCategory")
+ProductImageModel = get_model("catalogue", "ProductImage")
+ProductAttributeValueModel = get_model("catalogue", "ProductAttributeValue")
+ProductRecommendationModel = get_model("catalogue", "ProductRecommendation")
+ProductClassModel = get_model("catalogue", "ProductClass")
+CategoryModel = get_model("catalogue", "Category")
+StockRecordModel = get_model("partner", "StockRecord")
+PartnerModel = get_model("partner", "Partner")
+
+KEY_PREFIX = "oscar_odin:product"
+GLOBAL_VERSION_KEY = f"{KEY_PREFIX}:version"
+
+
+def get_cache():
+    return caches[odin_settings.PRODUCT_RESOURCE_CACHE_ALIAS]
+
+
+def get_version_key(pk) -> str:
+    return f"{KEY_PREFIX}:{pk}:version"
+
+
+def get_strategy_key(stock_strategy) -> str:
+    """
+    Identify the strategy the prices were resolved with.
+
+    Strategies that price differently per request or user should define a
+    ``cache_key`` attribute that tells those prices apart.
+    """
+    cache_key = getattr(stock_strategy, "cache_key", None)
+    if cache_key is not None:
+        return str(cache_key)
+    strategy_type = type(stock_strategy)
+    return f"{strategy_type.__module__}.{strategy_type.__qualname__}"
+
+
+class ProductResourceCache:
+    """Get and set the resources of one mapper, strategy, include_children and fields."""
+
+    def __init__(
+        self, product_mapper, stock_strategy, include_children=False, fields=None
+    ):
+        self.cache = get_cache()
+        variant = ":".join(
+            [
+                f"{product_mapper.__module__}.{product_mapper.__qualname__}",
+                get_strategy_key(stock_strategy),
+                str(include_children),
+                "*" if fields is None else ",".join(sorted(fields)),
+            ]
+        )
+        self.variant = hashlib.md5(variant.encode()).hexdigest()
+
+    def get_versions(self, pks) -> Dict[str, str]:
+        """Get the version tokens of the products, missing tokens are created."""
+        keys = [GLOBAL_VERSION_KEY] + [get_version_key(pk) for pk in pks]
+        versions = self.cache.get_many(keys)
+        missing = {key: uuid4().hex for key in keys if key not in versions}
+        if missing:
+            self.cache.set_many(missing, timeout=None)
+            versions.update(missing)
+        return versions
+
+    def get_keys(self, pks) -> Dict[str, int]:
+        versions = self.get_versions(pks)
+        global_version = versions[GLOBAL_VERSION_KEY]
+        return {
+            f"{KEY_PREFIX}:{pk}:{global_version}:{versions[get_version_key(pk)]}:{self.variant}": pk
+            for pk in pks
+        }
+
+    def get_many(self, pks: Iterable[int]) -> Dict[int, object]:
+        """Return the cached resources by product pk, misses are left out."""
+        keys = self.get_keys(set(pks))
+        return {keys[key]: value for key, value in self.cache.get_many(keys).items()}
+
+    def set_many(self, resources: Dict[int, object]):
+        """Cache resources by product pk."""
+        if not resources:
+            return
+        keys = self.get_keys(resources.keys())
+        self.cache.set_many(
+            {key: resources[pk] for key, pk in keys.items()},
+            timeout=odin_settings.PRODUCT_RESOURCE_CACHE_TIMEOUT,
+        )
+
+
+def get_product_resource_cache(
+    product_mapper, stock_strategy, include_children=False, use_cache=True, fields=None
+) -> Optional[ProductResourceCache]:
+    """
+    Return the resource cache, or None when caching is disabled.
+
+    The cache is only used when the ``PRODUCT_RESOURCE_CACHE_ENABLED`` setting is
+    on, as the cached resources are not invalidated otherwise. ``use_cache=False``
+    bypasses it.
+    """
+    if not (odin_settings.PRODUCT_RESOURCE_CACHE_ENABLED and use_cache):
+        return None
+    return ProductResourceCache(
+        product_mapper, stock_strategy, include_children, fields
+    )
+
+
+def invalidate_product_resources(pks: Iterable[int]):
+    """
+    Invalidate the cached resources of products, including their parents as those
+    contain the price and availability (and optionally the resources) of their children,
+    and their children as those inherit the title, images, attributes and categories
+    of their parent.
+    """
+    if not odin_settings.PRODUCT_RESOURCE_CACHE_ENABLED:
+        return
+
+    pks = {pk for pk in pks if pk is not None}
+    if not pks:
+        return
+
+    # The products with their parents, and the children of the products
+    for pk, parent_id in ProductModel.objects.filter(
+        Q(pk__in=list(pks)) | Q(parent_id__in=list(pks))
+    ).values_list("pk", "parent_id"):
+        pks.update((pk, parent_id))
+    pks.discard(None)
+    get_cache().set_many({get_version_key(pk): uuid4().hex for pk in pks}, timeout=None)
+
+
+def invalidate_all_product_resources():
+    """Invalidate all cached resources, eg. after a category was changed."""
+    if odin_settings.PRODUCT_RESOURCE_CACHE_ENABLED:
+        get_cache().set(GLOBAL_VERSION_KEY, uuid4().hex, timeout=None)
+
+
+def product_changed(sender, instance, **kwargs):
+    invalidate_product_resources([instance.pk, instance.parent_id])
+
+
+def product_relation_changed(sender, instance, **kwargs):
+    invalidate_product_resources([instance.product_id])
+
+
+def product_recommendation_changed(sender, instance, **kwargs):
+    invalidate_product_resources([instance.primary_id])
+
+
+def product_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+
+    if reverse:
+        # The products are changed from the other side, eg. category.product_set
+        if pk_set is None:
+            invalidate_all_product_resources()
+        else:
+            invalidate_product_resources(pk_set)
+    else:
+        invalidate_product_resources([instance.pk])
+
+
+def shared_table_changed(sender, instance, **kwargs):
+    invalidate_all_product_resources()
+
+
+def connect_signals():
+    """Invalidate cached resources when the models they are mapped from change."""
+    for signal in (post_save, post_delete):
+        signal.connect(product_changed, sender=ProductModel)
+        for model in (
+            StockRecordModel,
+            ProductImageModel,
+            ProductAttributeValueModel,
+            ProductCategoryModel,
+        ):
+            signal.connect(product_relation_changed, sender=model)
+        signal.connect(
+            product_recommendation_changed, sender=ProductRecommendationModel
+        )
+        for model in (CategoryModel, ProductClassModel, PartnerModel):
+            signal.connect(shared_table_changed, sender=model)
+
+    m2m_changed.connect(product_m2m_changed, sender=ProductCategoryModel)
+    m2m_changed.connect(product_m2m_changed, sender=ProductRecommendationModel)
@@ -1,2 +1,6 @@
 class OscarOdinException(TypeError):
     pass
+
+
+class NPlusOneQueryError(OscarOdinException):
+    pass
@@ -5,6 +5,8 @@ from oscar.core.loading import get_model, get_class, get_classes
 __all__ = (
     "BillingAddressToResource",
     "ShippingAddressToResource",
+    "BillingAddressToModel",
+    "ShippingAddressToModel",
 )
 
 BillingAddressModel = get_model("order", "BillingAddress")
@@ -13,6 +15,7 @@ CountryModel = get_model("address", "Country")
 
 # mappings
 OscarBaseMapping = get_class("oscar_odin.mappings.common", "OscarBaseMapping")
+ModelMapping = get_class("oscar_odin.mappings.model_mapper", "ModelMapping")
 
 # resources
 CountryResource, BillingAddressResource, ShippingAddressResource = get_classes(
@@ -26,6 +29,7 @@ class CountryToResource(OscarBaseMapping):
 
     from_obj = CountryModel
     to_obj = CountryResource
+    intern_resources = True
 
 
 class BillingAddressToResource(OscarBaseMapping):
@@ -33,11 +37,12 @@ class BillingAddressToResource(OscarBaseMapping):
 
     from_obj = BillingAddressModel
     to_obj = BillingAddressResource
+    select_related = {"country": CountryToResource}
 
     @odin.assign_field
     def country(self) -> CountryResource:
         """Map country."""
-        return CountryToResource.apply(self.source.country)
+        return CountryToResource.apply(self.source.country, context=self.context)
 
 
 class ShippingAddressToResource(OscarBaseMapping):
@@ -45,8 +50,63 @@ class ShippingAddressToResource(OscarBaseMapping):
 
     from_obj = ShippingAddressModel
     to_obj = ShippingAddressResource
+    select_related = {"country": CountryToResource}
 
     @odin.assign_field
     def country(self) -> CountryResource:
         """Map country."""
-        return CountryToResource.apply(self.source.country)
+        return CountryToResource.apply(self.source.country, context=self.context)
+
+
+def get_search_text(address) -> str:
+    """Oscar sets the search text of an address on save, which bulk saving skips."""
+    return " ".join(
+        filter(
+            bool,
+            [
+                address.first_name,
+                address.last_name,
+                address.line1,
+                address.line2,
+                address.line3,
+                address.line4,
+                address.state,
+                address.postcode,
+                address.country.name,
+            ],
+        )
+    )
+
+
+class BillingAddressToModel(ModelMapping):
+    """Mapping from billing address resource to model."""
+
+    from_obj = BillingAddressResource
+    to_obj = BillingAddressModel
+
+    @odin.map_field
+    def country(self, value: CountryResource) -> CountryModel:
+        """Countries are referenced by their code."""
+        return CountryModel(iso_3166_1_a2=value.iso_3166_1_a2)
+
+    @odin.assign_field
+    def search_text(self) -> str:
+        """Map search text."""
+        return get_search_text(self.source)
+
+
+class ShippingAddressToModel(ModelMapping):
+    """Mapping from shipping address resource to model."""
+
+    from_obj = ShippingAddressResource
+    to_obj = ShippingAddressModel
+
+    @odin.map_field
+    def country(self, value: CountryResource) -> CountryModel:
+        """Countries are referenced by their code."""
+        return CountryModel(iso_3166_1_a2=value.iso_3166_1_a2)
+
+    @odin.assign_field
+    def search_text(self) -> str:
+        """Map search text."""
+        return get_search_text(self.source)
@@ -17,3 +17,4 @@ class UserToResource(OscarBaseMapping):
 
     from_obj = UserModel
     to_obj = UserResource
+    intern_resources = True
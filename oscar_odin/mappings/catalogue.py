@@ -3,23 +3,37 @@
 import odin
 
 from decimal import Decimal
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 from django.contrib.auth.models import AbstractUser
-from django.db.models import QuerySet
+from django.db.models import QuerySet, prefetch_related_objects
 from django.db.models.fields.files import ImageFieldFile
 from django.http import HttpRequest
-from odin.mapping import ImmediateResult
 from oscar.apps.partner.strategy import Default as DefaultStrategy
 from oscar.core.loading import get_class, get_classes, get_model
 
 from datetime import datetime
 
-from .prefetching.prefetch import prefetch_product_queryset
+from .prefetching.prefetch import STOCK_PRICE_FIELDS, prefetch_product_queryset
+from .prefetching.registry import DEFAULT_PROFILE
 
 from . import constants
 from .context import ProductModelMapperContext
-from ..settings import RESOURCES_TO_DB_CHUNK_SIZE
+from ..cache import get_product_resource_cache, invalidate_product_resources
+from ..settings import QUERYSET_TO_RESOURCES_CHUNK_SIZE, RESOURCES_TO_DB_CHUNK_SIZE
+from ..strategy import fetch_stock_prices, purchase_info_to_stock_price
+from ..utils import chunked_queryset, keyset_page
 
 __all__ = (
     "ProductImageToResource",
@@ -28,6 +42,8 @@ __all__ = (
     "ProductToResource",
     "product_to_resource",
     "product_queryset_to_resources",
+    "product_queryset_to_resources_iterator",
+    "product_queryset_to_resource_pages",
 )
 
 
@@ -36,14 +52,15 @@ CategoryModel = get_model("catalogue", "Category")
 ProductClassModel = get_model("catalogue", "ProductClass")
 ProductModel = get_model("catalogue", "Product")
 StockRecordModel = get_model("partner", "StockRecord")
+ProductAttributeModel = get_model("catalogue", "ProductAttribute")
 ProductAttributeValueModel = get_model("catalogue", "ProductAttributeValue")
 
 resources_to_db = get_class("oscar_odin.mappings.resources", "resources_to_db")
 
 # mappings
 ModelMapping = get_class("oscar_odin.mappings.model_mapper", "ModelMapping")
-map_queryset, OscarBaseMapping = get_classes(
-    "oscar_odin.mappings.common", ["map_queryset", "OscarBaseMapping"]
+map_queryset, OscarBaseMapping, ResourcePage = get_classes(
+    "oscar_odin.mappings.common", ["map_queryset", "OscarBaseMapping", "ResourcePage"]
 )
 StockRecordToModel = get_class("oscar_odin.mappings.partner", "StockRecordToModel")
 
@@ -159,6 +176,7 @@ class ProductClassToResource(OscarBaseMapping):
 
     from_obj = ProductClassModel
     to_obj = ProductClassResource
+    intern_resources = True
 
 
 class ProductClassToModel(OscarBaseMapping):
@@ -174,6 +192,25 @@ class ProductToResource(OscarBaseMapping):
     from_obj = ProductModel
     to_obj = ProductResource
 
+    # The prefetch profile that is applied when mapping querysets with this mapper
+    prefetch_profile = DEFAULT_PROFILE
+
+    # The product columns that are only read to map these fields, the columns are
+    # deferred when mapping a queryset with none of their fields requested.
+    field_columns = {
+        "code": ("code",),
+        "upc": ("upc",),
+        "title": ("title",),
+        "slug": ("slug",),
+        "description": ("description",),
+        "meta_title": ("meta_title", "title"),
+        "meta_description": ("meta_description",),
+        "rating": ("rating",),
+        "priority": ("priority",),
+        "date_created": ("date_created",),
+        "date_updated": ("date_updated",),
+    }
+
     @odin.assign_field
     def title(self) -> str:
         """Map title field."""
@@ -195,11 +232,17 @@ class ProductToResource(OscarBaseMapping):
         """Map related categories."""
         items = self.source.get_categories()
         # Note: categories are prefetched with the 'to_attr' method, this means it's a list and not a queryset.
-        return list(
-            CategoryToResource.apply(
-                items, context=self.context, mapping_result=ImmediateResult
-            )
-        )
+        # Every category is only mapped once, products in the same category share its resource.
+        category_resources = self.context.setdefault("category_resources", {})
+        resources = []
+        for item in items:
+            resource = category_resources.get(item.pk)
+            if resource is None:
+                resource = category_resources[item.pk] = CategoryToResource.apply(
+                    item, context=self.context
+                )
+            resources.append(resource)
+        return resources
 
     @odin.assign_field
     def product_class(self) -> str:
@@ -207,41 +250,57 @@ class ProductToResource(OscarBaseMapping):
         item = self.source.get_product_class()
         return ProductClassToResource.apply(item, context=self.context)
 
-    @staticmethod
-    def _attribute_value_to_native_type(item):
+    # Conversion of a ProductAttributeValue to a native type, per attribute type.
+    # Attribute types without a converter use the value as stored in the correct type.
+    attribute_value_converters = {
+        ProductAttributeModel.OPTION: lambda item: item.value_option.option,
+        ProductAttributeModel.MULTI_OPTION: lambda item: [
+            option.option for option in item.value_multi_option.all()
+        ],
+        ProductAttributeModel.FILE: lambda item: item.value_file.url,
+        ProductAttributeModel.IMAGE: lambda item: item.value_image.url,
+        ProductAttributeModel.ENTITY: lambda item: (
+            item.value_entity.json()
+            if hasattr(item.value_entity, "json")
+            else f"{repr(item.value_entity)} has no json method, can not convert to json"
+        ),
+    }
+
+    @classmethod
+    def _attribute_value_to_native_type(cls, item):
         """Handle ProductAttributeValue to native type conversion."""
         try:
-            obj_type = item.attribute.type
-            if obj_type == item.attribute.OPTION:
-                return item.value.option
-
-            elif obj_type == item.attribute.MULTI_OPTION:
-                return item.value.values_list("option", flat=True)
-
-            elif obj_type == item.attribute.FILE:
-                return item.value.url
-
-            elif obj_type == item.attribute.IMAGE:
-                return item.value.url
-
-            elif obj_type == item.attribute.ENTITY:
-                if hasattr(item.value, "json"):
-                    return item.value.json()
-                else:
-                    return f"{repr(item.value)} has no json method, can not convert to json"
-
-            # return the value as stored on ProductAttributeValue in the correct type
-            return item.value
+            converter = cls.attribute_value_converters.get(item.attribute.type)
+            if converter is None:
+                return getattr(item, f"value_{item.attribute.type}")
+            return converter(item)
         except AttributeError:
             return item.value_as_text
 
     @odin.assign_field
     def attributes(self) -> Dict[str, Any]:
         """Map attributes."""
+        attribute_values = self.source.get_attribute_values()
+        if isinstance(attribute_values, QuerySet):
+            attribute_values = attribute_values.select_related("attribute")
+        attribute_values = list(attribute_values)
+
+        # Multi option values are prefetched along with the attribute values of a
+        # queryset, otherwise fetch the options of all values in a single query.
+        multi_option_values = [
+            item
+            for item in attribute_values
+            if item.attribute.type == ProductAttributeModel.MULTI_OPTION
+            and "value_multi_option"
+            not in getattr(item, "_prefetched_objects_cache", {})
+        ]
+        if multi_option_values:
+            prefetch_related_objects(multi_option_values, "value_multi_option")
+
         attribute_value_to_native_type = self._attribute_value_to_native_type
         return {
             item.attribute.code: attribute_value_to_native_type(item)
-            for item in self.source.get_attribute_values()
+            for item in attribute_values
         }
 
     @odin.assign_field
@@ -257,23 +316,21 @@ class ProductToResource(OscarBaseMapping):
             )
         return (None,)
 
-    @odin.assign_field(
-        to_field=("price", "currency", "availability", "is_available_to_buy")
-    )
+    @odin.assign_field(to_field=STOCK_PRICE_FIELDS)
     def map_stock_price(self) -> Tuple[Decimal, str, int, bool]:
         """Resolve stock price using strategy and decompose into price/currency/availability."""
+        # Stock prices resolved for the whole batch by the strategy
+        stock_prices = self.context.get("stock_prices")
+        if stock_prices is not None and self.source.pk in stock_prices:
+            return stock_prices[self.source.pk]
+
         stock_strategy: DefaultStrategy = self.context["stock_strategy"]
 
         if self.source.is_parent:
             price_info = stock_strategy.fetch_for_parent(self.source)
         else:
             price_info = stock_strategy.fetch_for_product(self.source)
-        return (
-            getattr(price_info.price, "incl_tax", Decimal(0)),
-            getattr(price_info.price, "currency", ""),
-            getattr(price_info.availability, "num_available", 0),
-            price_info.availability.is_available_to_buy,
-        )
+        return purchase_info_to_stock_price(price_info.price, price_info.availability)
 
 
 class ProductToModel(ModelMapping):
@@ -428,11 +485,63 @@ class ParentToModel(OscarBaseMapping):
         return ProductModel.PARENT
 
 
+def get_projected_fields(
+    fields: Optional[Iterable[str]],
+) -> Optional[FrozenSet[str]]:
+    """The resource fields to map, the id is always mapped as resources are keyed by it."""
+    if fields is None:
+        return None
+    return frozenset(fields) | {"id"}
+
+
+def prepare_product_queryset(
+    queryset: QuerySet,
+    include_children: bool = False,
+    product_mapper=ProductToResource,
+    prefetch_profile: Optional[str] = None,
+    fields: Optional[FrozenSet[str]] = None,
+) -> QuerySet:
+    """Apply the prefetches for the product mapper and defer unused columns.
+
+    :param queryset: A queryset of product models.
+    :param include_children: Include children of parent products.
+    :param product_mapper: The mapping that is used for the products.
+    :param prefetch_profile: The prefetch profile to apply, defaults to the
+        ``prefetch_profile`` of the product mapper.
+    :param fields: The resource fields that are mapped, defaults to all fields.
+    """
+    queryset = prefetch_product_queryset(
+        queryset,
+        include_children and (fields is None or "children" in fields),
+        prefetch_profile or getattr(product_mapper, "prefetch_profile", None),
+        fields=fields,
+    )
+    if fields is None:
+        return queryset
+
+    field_columns = getattr(product_mapper, "field_columns", {})
+    required_columns = {
+        column for field in fields for column in field_columns.get(field, ())
+    }
+    deferred_columns = {
+        column
+        for columns in field_columns.values()
+        for column in columns
+        if column not in required_columns
+    }
+    if deferred_columns:
+        queryset = queryset.defer(*deferred_columns)
+    return queryset
+
+
 def product_to_resource_with_strategy(
     product: Union[ProductModel, Iterable[ProductModel]],
     stock_strategy: DefaultStrategy,
     include_children: bool = False,
     product_mapper: OscarBaseMapping = ProductToResource,
+    context: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+    fields: Optional[Iterable[str]] = None,
 ):
     """Map a product model to a resource.
 
@@ -441,17 +550,75 @@ def product_to_resource_with_strategy(
     The request and user are optional, but if provided they are supplied to the
     partner strategy selector.
 
+    When the strategy implements ``fetch_for_products``, the stock prices of all
+    products (and their children) are resolved in one batch before mapping.
+
     :param product: A single product model or iterable of product models (eg a QuerySet).
     :param stock_strategy: The current HTTP request
     :param include_children: Include children of parent products.
+    :param context: Optional context values to share between calls, eg. the
+        ``category_resources`` that were mapped before.
+    :param use_cache: Get and store the resources in the product resource cache,
+        when it is enabled with the ``PRODUCT_RESOURCE_CACHE_ENABLED`` setting.
+    :param fields: Only map these resource fields, defaults to all fields. The other
+        fields are left at their default values.
     """
-    return product_mapper.apply(
-        product,
-        context={
-            "stock_strategy": stock_strategy,
-            "include_children": include_children,
-        },
+    fields = get_projected_fields(fields)
+    if fields is not None and "children" not in fields:
+        include_children = False
+
+    resource_cache = get_product_resource_cache(
+        product_mapper, stock_strategy, include_children, use_cache, fields
     )
+    if resource_cache is not None:
+        single = isinstance(product, ProductModel)
+        products = [product] if single else list(product)
+        resources = resource_cache.get_many(product.pk for product in products)
+        missing = [product for product in products if product.pk not in resources]
+        if missing:
+            mapped = product_to_resource_with_strategy(
+                missing,
+                stock_strategy,
+                include_children,
+                product_mapper=product_mapper,
+                context=context,
+                use_cache=False,
+                fields=fields,
+            )
+            mapped = {resource.id: resource for resource in mapped}
+            resource_cache.set_many(mapped)
+            resources.update(mapped)
+
+        if single:
+            return resources[product.pk]
+        return [resources[product.pk] for product in products]
+
+    context = {
+        **(context or {}),
+        "stock_strategy": stock_strategy,
+        "include_children": include_children,
+    }
+    if fields is not None:
+        context["projected_fields"] = {product_mapper.to_obj: fields}
+
+    # Stock prices are only resolved when one of their fields is mapped
+    if not isinstance(product, ProductModel) and (
+        fields is None or not fields.isdisjoint(STOCK_PRICE_FIELDS)
+    ):
+        product = list(product)
+        products = product
+        if include_children:
+            products = product + [
+                child
+                for parent in product
+                if parent.is_parent
+                for child in parent.children.all()
+            ]
+        stock_prices = fetch_stock_prices(stock_strategy, products)
+        if stock_prices is not None:
+            context["stock_prices"] = stock_prices
+
+    return product_mapper.apply(product, context=context)
 
 
 def product_to_resource(
@@ -460,6 +627,7 @@ def product_to_resource(
     user: Optional[AbstractUser] = None,
     include_children: bool = False,
     product_mapper: OscarBaseMapping = ProductToResource,
+    fields: Optional[Iterable[str]] = None,
     **kwargs,
 ) -> Union[ProductResource, Iterable[ProductResource]]:
     """Map a product model to a resource.
@@ -473,13 +641,18 @@ def product_to_resource(
     :param request: The current HTTP request
     :param user: The current user
     :param include_children: Include children of parent products.
+    :param fields: Only map these resource fields, defaults to all fields.
     :param kwargs: Additional keyword arguments to pass to the strategy selector.
     """
 
     selector_type = get_class("partner.strategy", "Selector")
     stock_strategy = selector_type().strategy(request=request, user=user, **kwargs)
     return product_to_resource_with_strategy(
-        product, stock_strategy, include_children, product_mapper=product_mapper
+        product,
+        stock_strategy,
+        include_children,
+        product_mapper=product_mapper,
+        fields=fields,
     )
 
 
@@ -489,6 +662,8 @@ def product_queryset_to_resources(
     user: Optional[AbstractUser] = None,
     include_children: bool = False,
     product_mapper=ProductToResource,
+    prefetch_profile: Optional[str] = None,
+    fields: Optional[Iterable[str]] = None,
     **kwargs,
 ) -> Iterable[ProductResource]:
     """Map a queryset of product models to a list of resources.
@@ -500,19 +675,169 @@ def product_queryset_to_resources(
     :param request: The current HTTP request
     :param user: The current user
     :param include_children: Include children of parent products.
+    :param prefetch_profile: The prefetch profile to apply, defaults to the
+        ``prefetch_profile`` of the product mapper.
+    :param fields: Only map these resource fields, defaults to all fields. Only the
+        prefetches and columns these fields need are loaded.
     :param kwargs: Additional keyword arguments to pass to the strategy selector.
     """
+    selector_type = get_class("partner.strategy", "Selector")
+    stock_strategy = selector_type().strategy(request=request, user=user, **kwargs)
+    fields = get_projected_fields(fields)
 
-    queryset = prefetch_product_queryset(queryset, include_children)
+    resource_cache = get_product_resource_cache(
+        product_mapper, stock_strategy, include_children, fields=fields
+    )
+    if resource_cache is not None:
+        # Only prefetch and map the products that are not cached yet
+        pks = list(queryset.values_list("pk", flat=True))
+        resources = resource_cache.get_many(pks)
+        missing = [pk for pk in pks if pk not in resources]
+        if missing:
+            if queryset.query.is_sliced:
+                queryset = queryset.model.objects.all()
+            mapped = product_to_resource_with_strategy(
+                prepare_product_queryset(
+                    queryset.filter(pk__in=missing),
+                    include_children,
+                    product_mapper,
+                    prefetch_profile,
+                    fields,
+                ),
+                stock_strategy,
+                include_children,
+                product_mapper=product_mapper,
+                use_cache=False,
+                fields=fields,
+            )
+            mapped = {resource.id: resource for resource in mapped}
+            resource_cache.set_many(mapped)
+            resources.update(mapped)
+
+        return [resources[pk] for pk in pks if pk in resources]
+
+    queryset = prepare_product_queryset(
+        queryset, include_children, product_mapper, prefetch_profile, fields
+    )
 
-    return product_to_resource(
+    return product_to_resource_with_strategy(
+        queryset,
+        stock_strategy,
+        include_children,
+        product_mapper=product_mapper,
+        fields=fields,
+    )
+
+
+def product_queryset_to_resources_iterator(
+    queryset: QuerySet,
+    request: Optional[HttpRequest] = None,
+    user: Optional[AbstractUser] = None,
+    include_children: bool = False,
+    product_mapper=ProductToResource,
+    chunk_size: int = QUERYSET_TO_RESOURCES_CHUNK_SIZE,
+    prefetch_profile: Optional[str] = None,
+    fields: Optional[Iterable[str]] = None,
+    **kwargs,
+) -> Iterator[ProductResource]:
+    """Lazily map a queryset of product models to resources.
+
+    The queryset is walked in chunks of ``chunk_size`` products ordered by primary
+    key. The registered prefetches are executed for each chunk, so only a single
+    chunk of model instances and resources is kept in memory at any time. Use this
+    instead of ``product_queryset_to_resources`` when mapping large catalogues.
+
+    The resources are always yielded in primary key order, the ordering of the
+    queryset is ignored. Sliced querysets are not supported and raise a
+    ``ValueError``, use ``product_queryset_to_resource_pages`` to map a page.
+
+    :param queryset: A queryset of product models, it must not be sliced.
+    :param request: The current HTTP request
+    :param user: The current user
+    :param include_children: Include children of parent products.
+    :param chunk_size: The number of products to fetch and map at once.
+    :param prefetch_profile: The prefetch profile to apply, defaults to the
+        ``prefetch_profile`` of the product mapper.
+    :param fields: Only map these resource fields, defaults to all fields.
+    :param kwargs: Additional keyword arguments to pass to the strategy selector.
+    """
+    selector_type = get_class("partner.strategy", "Selector")
+    stock_strategy = selector_type().strategy(request=request, user=user, **kwargs)
+    fields = get_projected_fields(fields)
+
+    queryset = prepare_product_queryset(
+        queryset, include_children, product_mapper, prefetch_profile, fields
+    )
+
+    # Categories and other small tables are shared by many products, so map them
+    # once for all chunks.
+    context = {"category_resources": {}, "interned_resources": {}}
+    for chunk in chunked_queryset(queryset, chunk_size):
+        yield from product_to_resource_with_strategy(
+            chunk,
+            stock_strategy,
+            include_children,
+            product_mapper=product_mapper,
+            context=context,
+            fields=fields,
+        )
+
+
+def product_queryset_to_resource_pages(
+    queryset: QuerySet,
+    page_size: int = QUERYSET_TO_RESOURCES_CHUNK_SIZE,
+    after: Optional[str] = None,
+    request: Optional[HttpRequest] = None,
+    user: Optional[AbstractUser] = None,
+    include_children: bool = False,
+    product_mapper=ProductToResource,
+    ordering: Sequence[str] = ("pk",),
+    prefetch_profile: Optional[str] = None,
+    fields: Optional[Iterable[str]] = None,
+    **kwargs,
+) -> ResourcePage:
+    """Map a single page of a queryset of product models to resources.
+
+    Pages are selected with keyset pagination, so fetching a page deep into the
+    catalogue costs the same as fetching the first one. The returned cursor can be
+    passed as ``after`` to continue with the next page, eg. in a later request or
+    after a crash. Use ``ordering=("date_updated", "pk")`` to walk the products in
+    the order they were last changed.
+
+    :param queryset: A queryset of product models.
+    :param page_size: The maximum number of products on the page.
+    :param after: The cursor of the previous page, or None for the first page.
+    :param request: The current HTTP request
+    :param user: The current user
+    :param include_children: Include children of parent products.
+    :param ordering: The fields to order by, the primary key is always added last.
+    :param prefetch_profile: The prefetch profile to apply, defaults to the
+        ``prefetch_profile`` of the product mapper.
+    :param fields: Only map these resource fields, defaults to all fields.
+    :param kwargs: Additional keyword arguments to pass to the strategy selector.
+    """
+    fields = get_projected_fields(fields)
+    # The cursor is read from the ordering columns, so these are never deferred
+    queryset = prepare_product_queryset(
         queryset,
-        request,
-        user,
         include_children,
         product_mapper,
-        **kwargs,
+        prefetch_profile,
+        fields if fields is None else fields.union(ordering),
     )
+    products, cursor, has_next = keyset_page(queryset, page_size, ordering, after)
+
+    selector_type = get_class("partner.strategy", "Selector")
+    stock_strategy = selector_type().strategy(request=request, user=user, **kwargs)
+    resources = product_to_resource_with_strategy(
+        products,
+        stock_strategy,
+        include_children,
+        product_mapper=product_mapper,
+        fields=fields,
+    )
+
+    return ResourcePage(list(resources), cursor, has_next)
 
 
 def products_to_db(
@@ -523,20 +848,39 @@ def products_to_db(
     delete_related=False,
     clean_instances=True,
     chunk_size=RESOURCES_TO_DB_CHUNK_SIZE,
+    upsert=False,
+    counts=None,
+    context_mapper=ProductModelMapperContext,
 ) -> Tuple[List[ProductModel], Dict]:
     """Map mulitple products to a model and store them in the database.
 
     The method will first bulk update or create the foreign keys like parent products and productclasses
     After that all the products will be bulk saved.
     At last all related models like images, stockrecords, and related_products can will be saved and set on the product.
+
+    Pass ``upsert=True`` to save the products, product classes, categories, images
+    and stockrecords with one upsert per model instead of a bulk_create and a
+    bulk_update, see ``resources_to_db``.
+
+    For large imports into PostgreSQL pass
+    ``context_mapper=CopyProductModelMapperContext``, which loads the rows with
+    COPY through temporary staging tables.
     """
-    return resources_to_db(
+    saved_products, errors = resources_to_db(
         products,
         fields_to_update,
         identifier_mapping,
         model_mapper=product_mapper,
-        context_mapper=ProductModelMapperContext,
+        context_mapper=context_mapper,
         delete_related=delete_related,
         clean_instances=clean_instances,
         chunk_size=chunk_size,
+        upsert=upsert,
+        counts=counts,
     )
+
+    # Bulk operations don't send signals, so invalidate the cached resources here.
+    if isinstance(saved_products, QuerySet):
+        invalidate_product_resources(saved_products.values_list("pk", flat=True))
+
+    return saved_products, errors
@@ -1,5 +1,17 @@
 """Common code between mappings."""
-from typing import Any, Dict, Optional, Type, Iterable
+from inspect import getattr_static
+from types import FunctionType
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    List,
+    NamedTuple,
+    Optional,
+    Type,
+    Iterable,
+    Tuple,
+)
 from operator import attrgetter
 
 from django.db.models import QuerySet, Model
@@ -16,6 +28,20 @@ from odin.mapping import (
     EMPTY_LIST,
 )
 
+from ..utils import active_query_detector
+
+
+class ResourcePage(NamedTuple):
+    """A page of mapped resources.
+
+    The cursor points to the last resource of the page and can be passed as the
+    ``after`` argument to fetch the next page, even after new rows are added.
+    """
+
+    resources: List[Any]
+    cursor: Optional[str]
+    has_next: bool
+
 
 def map_queryset(
     mapping: Type[odin.Mapping],
@@ -45,15 +71,316 @@ def map_queryset(
     )
 
 
+def select_related_for_mapping(
+    queryset: QuerySet, mapping: Type["OscarBaseMapping"]
+) -> QuerySet:
+    """Select the relations that the mapping traverses along with the queryset."""
+    lookups = mapping.get_select_related()
+    if not lookups:
+        return queryset
+    return queryset.select_related(*lookups)
+
+
+def select_related_objects(
+    instances: Iterable[Model], mapping: Type["OscarBaseMapping"]
+) -> None:
+    """Load the relations that the mapping traverses for instances that were fetched
+    already, with one query for all of them.
+
+    Relations that are loaded already, or that are empty, are left alone.
+    """
+    lookups = mapping.get_select_related()
+    if not lookups:
+        return
+
+    meta = mapping.from_obj._meta
+    fields = [meta.get_field(name) for name in mapping.select_related]
+    missing = [
+        instance
+        for instance in instances
+        if instance.pk is not None
+        and any(
+            not field.is_cached(instance)
+            and getattr(instance, field.attname) is not None
+            for field in fields
+        )
+    ]
+    if not missing:
+        return
+
+    # pylint: disable=protected-access
+    fetched = mapping.from_obj._default_manager.select_related(*lookups).in_bulk(
+        [instance.pk for instance in missing]
+    )
+    for instance in missing:
+        source = fetched.get(instance.pk)
+        if source is None:
+            continue
+        for field in fields:
+            if not field.is_cached(instance) and getattr(
+                instance, field.attname
+            ) == getattr(source, field.attname):
+                setattr(instance, field.name, getattr(source, field.name))
+
+
+class CompiledMappingRule:
+    """A mapping rule with its field getters and action resolved up front.
+
+    ``OscarBaseMapping._apply_rule`` looks everything up again for every rule of
+    every object, a compiled rule only does the work that depends on the source.
+    """
+
+    __slots__ = (
+        "mapping_rule",
+        "getter",
+        "action",
+        "action_name",
+        "pass_mapping",
+        "bind",
+        "to_fields",
+        "to_field",
+        "to_list",
+        "skip_if_none",
+    )
+
+    def __init__(self, mapping_type, mapping_rule):
+        from_fields, action, to_fields, to_list, bind, skip_if_none = mapping_rule
+        self.mapping_rule = mapping_rule
+        self.to_fields = to_fields
+        self.to_field = to_fields[0] if len(to_fields) == 1 else None
+        self.to_list = to_list
+        self.bind = bind
+        self.skip_if_none = skip_if_none
+
+        if from_fields is None:
+            self.getter = None
+        elif len(from_fields) == 1:
+            getter = attrgetter(from_fields[0])
+            self.getter = lambda source: (getter(source),)
+        else:
+            # attrgetter returns a tuple when getting multiple fields.
+            self.getter = attrgetter(*from_fields)
+
+        # Actions defined as methods on the mapping are resolved once on the class
+        # and called with the mapping instance, anything else is still resolved on
+        # the mapping instance for every object.
+        self.action = action
+        self.action_name = None
+        self.pass_mapping = bind
+        if isinstance(action, str):
+            attr = getattr_static(mapping_type, action, None)
+            if isinstance(attr, staticmethod):
+                self.action = attr.__func__
+            elif isinstance(attr, FunctionType) and not bind:
+                self.action = attr
+                self.pass_mapping = True
+            else:
+                self.action = None
+                self.action_name = action
+
+    def __call__(self, mapping) -> Dict[str, Any]:
+        if self.getter is None:
+            from_values = EMPTY_LIST
+        else:
+            from_values = self.getter(mapping.source)
+
+        action = self.action
+        if action is None and self.action_name is None:
+            to_values = from_values
+        else:
+            if action is None:
+                action = getattr(mapping, self.action_name)
+
+            try:
+                if self.pass_mapping:
+                    to_values = action(mapping, *from_values)
+                else:
+                    to_values = action(*from_values)
+            except TypeError as ex:
+                raise MappingExecutionError(
+                    f"{ex} applying rule {self.mapping_rule}"
+                ) from ex
+
+        if self.to_list:
+            if isinstance(to_values, Iterable):
+                to_values = (list(to_values),)
+            else:
+                to_values = (to_values,)
+        elif to_values is not from_values:
+            to_values = force_tuple(to_values)
+
+        to_fields = self.to_fields
+        if len(to_fields) != len(to_values):
+            raise MappingExecutionError(
+                f"Rule expects {len(to_fields)} fields ({len(to_values)} returned) "
+                f"applying rule {self.mapping_rule}. The `to_list` option might need to be specified"
+            )
+
+        if self.to_field is not None:
+            value = to_values[0]
+            if self.skip_if_none and value is None:
+                return {}
+            if value is NotProvided and mapping.ignore_not_provided:
+                return {}
+            return {self.to_field: value}
+
+        result = dict(zip(to_fields, to_values))
+        if self.skip_if_none:
+            result = {k: v for k, v in result.items() if v is not None}
+        if mapping.ignore_not_provided:
+            result = {k: v for k, v in result.items() if v is not NotProvided}
+        return result
+
+
 class NonRegisterableMappingMeta(MappingMeta):
     def __new__(mcs, name, bases, attrs):
         attrs["register_mapping"] = attrs.get("register_mapping", False)
-        return super().__new__(mcs, name, bases, attrs)
+        mapping = super().__new__(mcs, name, bases, attrs)
+
+        # The rules of a subclass are added after the copied rules of its parents,
+        # leave out the parent rules they replace so those fields are mapped once.
+        num_inherited = sum(
+            len(base._mapping_rules) for base in bases if hasattr(base, "_subs")
+        )
+        if num_inherited and "_mapping_rules" in mapping.__dict__:
+            inherited_rules = mapping._mapping_rules[:num_inherited]
+            rules = mapping._mapping_rules[num_inherited:]
+            to_fields = {mapping_rule.to_field for mapping_rule in rules}
+            mapping._mapping_rules = [
+                mapping_rule
+                for mapping_rule in inherited_rules
+                if mapping_rule.to_field not in to_fields
+            ] + rules
+        return mapping
 
 
 class OscarBaseMapping(MappingBase, metaclass=NonRegisterableMappingMeta):
     register_mapping = False
 
+    # Map every model instance only once within the same context, and share the
+    # resource. Enable this for mappings of small tables that many rows refer to.
+    intern_resources = False
+
+    # The foreign keys of the source model that this mapping traverses, with the
+    # mapping of the related object (or None). They are selected along with the
+    # source objects, see ``select_related_for_mapping``.
+    select_related: Dict[str, Optional[Type["OscarBaseMapping"]]] = {}
+
+    @classmethod
+    def get_select_related(cls) -> List[str]:
+        """Return the select_related lookups of this mapping and the mappings it uses."""
+        lookups = []
+        for name, mapping in cls.select_related.items():
+            nested_lookups = mapping.get_select_related() if mapping else []
+            if nested_lookups:
+                lookups.extend(f"{name}__{lookup}" for lookup in nested_lookups)
+            else:
+                lookups.append(name)
+        return lookups
+
+    @classmethod
+    def apply(
+        cls,
+        source_obj,
+        context=None,
+        allow_subclass: bool = False,
+        mapping_result=None,
+    ):
+        if (
+            not cls.intern_resources
+            or context is None
+            or not isinstance(source_obj, Model)
+            or source_obj.pk is None
+        ):
+            return super().apply(source_obj, context, allow_subclass, mapping_result)
+
+        interned_resources = context.setdefault("interned_resources", {})
+        key = (cls, source_obj._meta.label, source_obj.pk)
+        try:
+            return interned_resources[key]
+        except KeyError:
+            resource = super().apply(source_obj, context, allow_subclass)
+            interned_resources[key] = resource
+            return resource
+
+    @classmethod
+    def get_compiled_rules(
+        cls, fields: Optional[FrozenSet[str]] = None
+    ) -> Optional[Tuple[CompiledMappingRule, ...]]:
+        """
+        Compile the mapping rules of this mapping, the result is cached on the class.
+
+        Returns None when a subclass customises ``_apply_rule``, as its rules have to be
+        applied one by one with that method.
+
+        :param fields: Only return the rules that map to one of these fields.
+        """
+        try:
+            compiled_rules = cls.__dict__["_compiled_rules"]
+        except KeyError:
+            if cls._apply_rule is not OscarBaseMapping._apply_rule:
+                compiled_rules = None
+            else:
+                compiled_rules = tuple(
+                    CompiledMappingRule(cls, mapping_rule)
+                    for mapping_rule in cls._mapping_rules  # pylint: disable=E1133
+                )
+            cls._compiled_rules = compiled_rules
+            cls._projected_rules = {}
+
+        if compiled_rules is None or fields is None:
+            return compiled_rules
+
+        try:
+            return cls._projected_rules[fields]
+        except KeyError:
+            projected_rules = cls._projected_rules[fields] = tuple(
+                compiled_rule
+                for compiled_rule in compiled_rules
+                if not fields.isdisjoint(compiled_rule.to_fields)
+            )
+            return projected_rules
+
+    def get_projected_fields(self) -> Optional[FrozenSet[str]]:
+        """
+        The fields of the resource to map, or None to map all fields.
+
+        The fields are projected per resource type with the ``projected_fields`` context
+        value, so nested mappings of other resources are not affected.
+        """
+        projected_fields = self.context.get("projected_fields")
+        if projected_fields is None:
+            return None
+        return projected_fields.get(self.to_obj)
+
+    def convert(self, **field_values):
+        fields = self.get_projected_fields()
+
+        detector = active_query_detector.get()
+        if detector is not None:
+            # Apply the rules one by one so queries can be attributed to them
+            for mapping_rule in self._mapping_rules:  # pylint: disable=E1133
+                if fields is not None and fields.isdisjoint(mapping_rule.to_field):
+                    continue
+                with detector.rule(type(self), mapping_rule):
+                    field_values.update(self._apply_rule(mapping_rule))
+            return self.create_object(**field_values)
+
+        compiled_rules = self.get_compiled_rules(fields)
+        if compiled_rules is None:
+            if fields is None:
+                return super().convert(**field_values)
+
+            for mapping_rule in self._mapping_rules:  # pylint: disable=E1133
+                if not fields.isdisjoint(mapping_rule.to_field):
+                    field_values.update(self._apply_rule(mapping_rule))
+            return self.create_object(**field_values)
+
+        for compiled_rule in compiled_rules:
+            field_values.update(compiled_rule(self))
+
+        return self.create_object(**field_values)
+
     def create_object(self, **field_values):
         """
         When subclassing a mapping and resource sometimes the overidden map will somehow result in the values being None
@@ -6,6 +6,9 @@ ProductClass = get_model("catalogue", "ProductClass")
 ProductImage = get_model("catalogue", "ProductImage")
 StockRecord = get_model("partner", "StockRecord")
 Partner = get_model("partner", "Partner")
+Order = get_model("order", "Order")
+PaymentEventType = get_model("order", "PaymentEventType")
+ShippingEventType = get_model("order", "ShippingEventType")
 
 PRODUCT_STRUCTURE = "Product.structure"
 PRODUCT_IS_PUBLIC = "Product.is_public"
@@ -110,3 +113,96 @@ MODEL_IDENTIFIERS_MAPPING = {
     ProductImage: ("code",),
     Partner: ("code",),
 }
+
+ORDER_NUMBER = "Order.number"
+ORDER_SITE = "Order.site"
+ORDER_USER = "Order.user"
+ORDER_GUEST_EMAIL = "Order.guest_email"
+ORDER_BILLING_ADDRESS = "Order.billing_address"
+ORDER_CURRENCY = "Order.currency"
+ORDER_TOTAL_INCL_TAX = "Order.total_incl_tax"
+ORDER_TOTAL_EXCL_TAX = "Order.total_excl_tax"
+ORDER_SHIPPING_INCL_TAX = "Order.shipping_incl_tax"
+ORDER_SHIPPING_EXCL_TAX = "Order.shipping_excl_tax"
+ORDER_SHIPPING_TAX_CODE = "Order.shipping_tax_code"
+ORDER_SHIPPING_ADDRESS = "Order.shipping_address"
+ORDER_SHIPPING_METHOD = "Order.shipping_method"
+ORDER_SHIPPING_CODE = "Order.shipping_code"
+ORDER_STATUS = "Order.status"
+ORDER_DATE_PLACED = "Order.date_placed"
+
+ADDRESS_FIELDS = [
+    "title",
+    "first_name",
+    "last_name",
+    "line1",
+    "line2",
+    "line3",
+    "line4",
+    "state",
+    "postcode",
+    "country",
+    "search_text",
+]
+
+# The related rows of an order have no identifier of their own, so they are
+# replaced as a whole when their model is part of the fields to update.
+ORDER_LINES = "Line.order"
+ORDER_LINE_PRICES = "LinePrice.line"
+ORDER_LINE_ATTRIBUTES = "LineAttribute.line"
+ORDER_NOTES = "OrderNote.order"
+ORDER_STATUS_CHANGES = "OrderStatusChange.order"
+ORDER_DISCOUNTS = "OrderDiscount.order"
+ORDER_SURCHARGES = "Surcharge.order"
+ORDER_PAYMENT_EVENTS = "PaymentEvent.order"
+ORDER_SHIPPING_EVENTS = "ShippingEvent.order"
+
+ALL_ORDER_FIELDS = [
+    ORDER_NUMBER,
+    ORDER_SITE,
+    ORDER_USER,
+    ORDER_GUEST_EMAIL,
+    ORDER_BILLING_ADDRESS,
+    ORDER_CURRENCY,
+    ORDER_TOTAL_INCL_TAX,
+    ORDER_TOTAL_EXCL_TAX,
+    ORDER_SHIPPING_INCL_TAX,
+    ORDER_SHIPPING_EXCL_TAX,
+    ORDER_SHIPPING_TAX_CODE,
+    ORDER_SHIPPING_ADDRESS,
+    ORDER_SHIPPING_METHOD,
+    ORDER_SHIPPING_CODE,
+    ORDER_STATUS,
+    ORDER_DATE_PLACED,
+]
+
+ALL_BILLINGADDRESS_FIELDS = ["BillingAddress.%s" % f for f in ADDRESS_FIELDS]
+ALL_SHIPPINGADDRESS_FIELDS = ["ShippingAddress.%s" % f for f in ADDRESS_FIELDS] + [
+    "ShippingAddress.phone_number",
+    "ShippingAddress.notes",
+]
+
+ALL_ORDER_RELATED_FIELDS = [
+    ORDER_LINES,
+    ORDER_LINE_PRICES,
+    ORDER_LINE_ATTRIBUTES,
+    ORDER_NOTES,
+    ORDER_STATUS_CHANGES,
+    ORDER_DISCOUNTS,
+    ORDER_SURCHARGES,
+    ORDER_PAYMENT_EVENTS,
+    ORDER_SHIPPING_EVENTS,
+]
+
+ALL_ORDER_IMPORT_FIELDS = (
+    ALL_ORDER_FIELDS
+    + ALL_BILLINGADDRESS_FIELDS
+    + ALL_SHIPPINGADDRESS_FIELDS
+    + ALL_ORDER_RELATED_FIELDS
+)
+
+ORDER_IDENTIFIERS_MAPPING = {
+    Order: ("number",),
+    PaymentEventType: ("name",),
+    ShippingEventType: ("name",),
+}
@@ -1,14 +1,22 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
 from operator import attrgetter
 
-from django.db import transaction
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
 from django.db.models import Q
-from django.core.exceptions import ValidationError
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 
 from oscar.core.loading import get_model
 from oscar.apps.catalogue.product_attributes import QuerysetCache
 
-from ..utils import ErrorLog, in_bulk
+from ..postgres import copy_insert, copy_update
+from ..utils import (
+    ErrorLog,
+    bulk_update_from_values,
+    get_lookup_batch_size,
+    get_lookup_filters,
+    in_bulk,
+)
 from ..exceptions import OscarOdinException
 from .constants import MODEL_IDENTIFIERS_MAPPING
 
@@ -16,6 +24,10 @@ Product = get_model("catalogue", "Product")
 ProductClass = get_model("catalogue", "ProductClass")
 ProductAttributeValue = get_model("catalogue", "ProductAttributeValue")
 ProductAttribute = get_model("catalogue", "ProductAttribute")
+Order = get_model("order", "Order")
+Line = get_model("order", "Line")
+Partner = get_model("partner", "Partner")
+StockRecord = get_model("partner", "StockRecord")
 
 
 def separate_instances_to_create_and_update(Model, instances, identifier_mapping):
@@ -28,6 +40,7 @@ def separate_instances_to_create_and_update(Model, instances, identifier_mapping
     if identifiers and instances:
         # pylint: disable=protected-access
         id_mapping = in_bulk(Model._default_manager, instances, identifiers)
+        using = router.db_for_write(Model)
 
         get_key_values = attrgetter(*identifiers)
         for instance in instances:
@@ -40,7 +53,7 @@ def separate_instances_to_create_and_update(Model, instances, identifier_mapping
             if key in id_mapping:
                 instance.pk = id_mapping[key]
                 # pylint: disable=protected-access
-                instance._state.db = "default"
+                instance._state.db = using
                 instance._state.adding = False
                 instances_to_update.append(instance)
             else:
@@ -51,6 +64,63 @@ def separate_instances_to_create_and_update(Model, instances, identifier_mapping
         return instances, [], []
 
 
+def has_unique_constraint(Model, field_names):
+    """Whether the combination of fields is unique, either by itself or as a whole."""
+    # pylint: disable=protected-access
+    meta = Model._meta
+    fields = {meta.get_field(name).name for name in field_names}
+    if len(fields) == 1 and meta.get_field(*fields).unique:
+        return True
+    unique_sets = [set(unique) for unique in meta.unique_together] + [
+        set(constraint.fields) for constraint in meta.total_unique_constraints
+    ]
+    return fields in unique_sets
+
+
+def get_unique_key(instance, unique_check):
+    """
+    The values of the fields of a unique check, or None when Django's
+    ``validate_unique`` would skip the check for this instance.
+    """
+    # pylint: disable=protected-access
+    connection = connections[router.db_for_write(instance.__class__, instance=instance)]
+    key = []
+    for field_name in unique_check:
+        field = instance._meta.get_field(field_name)
+        value = getattr(instance, field.attname)
+        if value is None or (
+            value == "" and connection.features.interprets_empty_strings_as_nulls
+        ):
+            return None
+        if field.primary_key and not instance._state.adding:
+            return None
+        key.append(value)
+    return tuple(key)
+
+
+def validate_other_constraints(instance, exclude):
+    """
+    Validate the constraints of the instance that are not checked as unique checks,
+    like check constraints and conditional unique constraints.
+    """
+    errors = {}
+    using = router.db_for_write(instance.__class__, instance=instance)
+    for model_class, constraints in instance.get_constraints():
+        # pylint: disable=protected-access
+        unique_constraints = model_class._meta.total_unique_constraints
+        for constraint in constraints:
+            if constraint in unique_constraints:
+                continue
+            try:
+                constraint.validate(model_class, instance, exclude=exclude, using=using)
+            except ValidationError as e:
+                if getattr(e, "code", None) == "unique" and len(constraint.fields) == 1:
+                    errors.setdefault(constraint.fields[0], []).append(e)
+                else:
+                    errors = e.update_error_dict(errors)
+    return errors
+
+
 class ModelMapperContext(dict):
     foreign_key_items = None
     many_to_many_items = None
@@ -63,11 +133,19 @@ class ModelMapperContext(dict):
     errors = None
     delete_related = False
     clean_instances = True
+    upsert = False
+    counts = None
 
     update_related_models_same_type = True
 
     def __init__(
-        self, Model, *args, delete_related=False, error_identifiers=None, **kwargs
+        self,
+        Model,
+        *args,
+        delete_related=False,
+        error_identifiers=None,
+        upsert=False,
+        **kwargs,
     ):
         super().__init__(*args, **kwargs)
         self.foreign_key_items = defaultdict(list)
@@ -79,6 +157,8 @@ class ModelMapperContext(dict):
         self.attribute_data = []
         self.errors = ErrorLog(identifiers=error_identifiers)
         self.delete_related = delete_related
+        self.upsert = upsert
+        self.counts = defaultdict(Counter)
         self.Model = Model
 
     def __bool__(self):
@@ -93,6 +173,13 @@ class ModelMapperContext(dict):
         return attrgetter(*identifiers)(instance)
 
     def validate_instances(self, instances, validate_unique=True, fields=None):
+        """
+        Clean the instances and return the valid ones, the errors of the others are
+        added to the error log.
+
+        The fields are cleaned per instance, their uniqueness is validated for all
+        instances together by ``get_unique_errors``.
+        """
         if not self.clean_instances or not instances:
             return instances
         validated_instances = []
@@ -104,23 +191,99 @@ class ModelMapperContext(dict):
 
         identifiers = self.identifier_mapping.get(instances[0].__class__)
 
+        cleaned_instances = []
+        instance_errors = []
         for instance in instances:
             identity = self.get_identity(instance, identifiers)
             if identifiers is None or identity not in identities:
                 if identifiers is not None:
                     identities.append(identity)
+                instance = self.prepare_instance_for_validation(instance)
+                errors = {}
                 try:
-                    instance = self.prepare_instance_for_validation(instance)
                     instance.full_clean(
-                        validate_unique=validate_unique, exclude=exclude
+                        exclude=exclude,
+                        validate_unique=False,
+                        validate_constraints=False,
                     )
                 except ValidationError as e:
-                    self.errors.add_error(e, instance)
-                else:
-                    validated_instances.append(instance)
+                    errors = e.update_error_dict(errors)
+                cleaned_instances.append(instance)
+                instance_errors.append(errors)
+
+        if validate_unique:
+            # Like full_clean, only fields that passed validation are checked
+            excludes = [
+                set(exclude).union(name for name in errors if name != NON_FIELD_ERRORS)
+                for errors in instance_errors
+            ]
+            unique_errors = self.get_unique_errors(cleaned_instances, excludes)
+            for index, errors in unique_errors.items():
+                for name, messages in errors.items():
+                    instance_errors[index].setdefault(name, []).extend(messages)
+
+        for instance, errors in zip(cleaned_instances, instance_errors):
+            if errors:
+                self.errors.add_error(ValidationError(errors), instance)
+            else:
+                validated_instances.append(instance)
 
         return validated_instances
 
+    def get_unique_errors(self, instances, excludes):
+        """
+        Validate the unique fields and constraints of the instances, like
+        ``validate_unique`` and ``validate_constraints`` do. Every unique field or
+        constraint is checked with one query for all instances, instead of one query
+        per instance. Returns the errors by the index of the instance.
+        """
+        # pylint: disable=protected-access
+        errors = defaultdict(dict)
+        unique_keys = defaultdict(dict)
+        for index, (instance, exclude) in enumerate(zip(instances, excludes)):
+            unique_checks, date_checks = instance._get_unique_checks(
+                exclude=exclude, include_meta_constraints=True
+            )
+            for model_class, unique_check in unique_checks:
+                key = get_unique_key(instance, unique_check)
+                if key is not None:
+                    unique_keys[(model_class, unique_check)][index] = key
+
+            # These are not common enough to check in bulk
+            instance_errors = instance._perform_date_checks(date_checks)
+            instance_errors.update(validate_other_constraints(instance, exclude))
+            for name, messages in instance_errors.items():
+                errors[index].setdefault(name, []).extend(messages)
+
+        for (model_class, unique_check), keys in unique_keys.items():
+            manager = model_class._default_manager
+            existing_pks = defaultdict(set)
+            for query in get_lookup_filters(
+                set(keys.values()),
+                unique_check,
+                get_lookup_batch_size(manager.db, unique_check),
+            ):
+                for pk, *values in (
+                    manager.filter(query).order_by().values_list("pk", *unique_check)
+                ):
+                    existing_pks[tuple(values)].add(pk)
+
+            for index, key in keys.items():
+                instance = instances[index]
+                pks = existing_pks.get(key, set())
+                pk = instance._get_pk_val(model_class._meta)
+                if not instance._state.adding and pk is not None:
+                    pks = pks - {pk}
+                if pks:
+                    name = (
+                        NON_FIELD_ERRORS if len(unique_check) > 1 else unique_check[0]
+                    )
+                    errors[index].setdefault(name, []).append(
+                        instance.unique_error_message(model_class, unique_check)
+                    )
+
+        return errors
+
     def add_attribute_data(self, attribute_data):
         self.attribute_data.append(attribute_data)
 
@@ -220,24 +383,120 @@ class ModelMapperContext(dict):
             if instance.pk is None and identity in pk_identity_map:
                 instance.pk = pk_identity_map[identity]
 
+    def can_upsert(self, Model, instances):
+        """
+        Whether the instances of Model can be created and updated by one upsert, that
+        needs support of the database and a unique constraint on the identifiers.
+
+        The database checks the rows that would be inserted before it detects the
+        conflict, so references like ``ProductClassResource(slug=...)`` that leave
+        required columns empty are saved the regular way.
+        """
+        identifiers = self.identifier_mapping.get(Model)
+        if not self.upsert or not identifiers:
+            return False
+        connection = connections[router.db_for_write(Model)]
+        if not connection.features.supports_update_conflicts_with_target:
+            return False
+        if not has_unique_constraint(Model, identifiers):
+            return False
+        # pylint: disable=protected-access
+        required_fields = [
+            field.attname
+            for field in Model._meta.concrete_fields
+            if not field.null
+            and not field.primary_key
+            and not getattr(field, "auto_now", False)
+            and not getattr(field, "auto_now_add", False)
+        ]
+        return all(
+            getattr(instance, attname) is not None
+            for instance in instances
+            for attname in required_fields
+        )
+
+    def bulk_upsert(self, Model, instances_to_create, instances_to_update, fields):
+        """
+        Save the instances with a single INSERT ... ON CONFLICT DO UPDATE on the
+        identifiers of the model, instead of a bulk_create and a bulk_update.
+        """
+        identifiers = self.identifier_mapping[Model]
+        pks = [instance.pk for instance in instances_to_update]
+        # Conflict on the identifiers rather than on the primary keys
+        for instance in instances_to_update:
+            instance.pk = None
+
+        Model.objects.bulk_create(
+            instances_to_create + instances_to_update,
+            update_conflicts=True,
+            unique_fields=identifiers,
+            update_fields=fields,
+        )
+
+        for instance, pk in zip(instances_to_update, pks):
+            instance.pk = pk
+
+        # Not every Django version returns the primary keys of upserted rows
+        instances_without_pk = [
+            instance for instance in instances_to_create if instance.pk is None
+        ]
+        if instances_without_pk:
+            # pylint: disable=protected-access
+            id_mapping = in_bulk(
+                Model._default_manager, instances_without_pk, identifiers
+            )
+            get_key_values = attrgetter(*identifiers)
+            for instance in instances_without_pk:
+                key = get_key_values(instance)
+                if not isinstance(key, tuple):
+                    key = (key,)
+                instance.pk = id_mapping.get(key)
+
+    def bulk_create_and_update(
+        self, Model, instances_to_create, instances_to_update, fields
+    ):
+        """
+        Create and update validated instances of Model, the instances to update are
+        left alone when there are no fields to update.
+        """
+        if fields is None:
+            instances_to_update = []
+
+        self.counts[Model]["created"] += len(instances_to_create)
+        self.counts[Model]["updated"] += len(instances_to_update)
+
+        self.bulk_write(Model, instances_to_create, instances_to_update, fields)
+
+    def bulk_write(self, Model, instances_to_create, instances_to_update, fields):
+        if instances_to_update and self.can_upsert(Model, instances_to_update):
+            self.bulk_upsert(Model, instances_to_create, instances_to_update, fields)
+        else:
+            Model.objects.bulk_create(instances_to_create)
+            if instances_to_update:
+                bulk_update_from_values(Model.objects, instances_to_update, fields)
+
     def bulk_update_or_create_foreign_keys(self):
         instances_to_create, instances_to_update = self.get_fk_relations
 
-        for field, instances in instances_to_create.items():
+        for field in {**instances_to_create, **instances_to_update}:
+            Model = field.related_model
+            instances = instances_to_create[field]
             validated_fk_instances = self.validate_instances(instances)
-            field.related_model.objects.bulk_create(validated_fk_instances)
-            if len(instances) != len(validated_fk_instances):
-                self.assign_pk_to_duplicate_instances(instances, validated_fk_instances)
 
-        for field, instances in instances_to_update.items():
-            Model = field.related_model
+            fields = None
+            validated_instances_to_update = []
             if self.update_related_models_same_type or Model != self.Model:
                 fields = self.get_fields_to_update(Model)
                 if fields is not None:
-                    instances_to_update = self.validate_instances(
-                        instances, fields=fields
+                    validated_instances_to_update = self.validate_instances(
+                        instances_to_update[field], fields=fields
                     )
-                    Model.objects.bulk_update(instances_to_update, fields=fields)
+
+            self.bulk_create_and_update(
+                Model, validated_fk_instances, validated_instances_to_update, fields
+            )
+            if len(instances) != len(validated_fk_instances):
+                self.assign_pk_to_duplicate_instances(instances, validated_fk_instances)
 
     def bulk_update_or_create_instances(self, instances):
         (
@@ -249,7 +508,24 @@ class ModelMapperContext(dict):
         )
 
         validated_create_instances = self.validate_instances(instances_to_create)
-        self.Model.objects.bulk_create(validated_create_instances)
+
+        fields = self.get_fields_to_update(self.Model)
+        validated_instances_to_update = []
+        if fields is not None:
+            validated_instances_to_update = self.validate_instances(
+                instances_to_update, fields=fields
+            )
+            for instance in validated_instances_to_update:
+                # This should be removed once support for django 3.2 is dropped
+                # pylint: disable=protected-access
+                instance._prepare_related_fields_for_save("bulk_update")
+
+        self.bulk_create_and_update(
+            self.Model,
+            validated_create_instances,
+            validated_instances_to_update,
+            fields,
+        )
         self.assign_pk_to_duplicate_instances(
             instances_to_create, validated_create_instances
         )
@@ -262,16 +538,20 @@ class ModelMapperContext(dict):
                     """
                 )
 
-        fields = self.get_fields_to_update(self.Model)
-        if fields is not None:
-            validated_instances_to_update = self.validate_instances(
-                instances_to_update, fields=fields
-            )
-            for instance in validated_instances_to_update:
-                # This should be removed once support for django 3.2 is dropped
-                # pylint: disable=protected-access
-                instance._prepare_related_fields_for_save("bulk_update")
-            self.Model.objects.bulk_update(validated_instances_to_update, fields=fields)
+    def bulk_update_or_create_relations(self, instances_to_create, instances_to_update):
+        for relation in {**instances_to_create, **instances_to_update}:
+            Model = relation.related_model
+            if self.update_related_models_same_type or Model != self.Model:
+                fields = self.get_fields_to_update(Model)
+                if fields is not None:
+                    self.bulk_create_and_update(
+                        Model,
+                        self.validate_instances(instances_to_create[relation]),
+                        self.validate_instances(
+                            instances_to_update[relation], fields=fields
+                        ),
+                        fields,
+                    )
 
     def bulk_update_or_create_one_to_many(self):
         for relation, parent, instances in self.get_all_o2m_instances:
@@ -279,30 +559,7 @@ class ModelMapperContext(dict):
                 setattr(instance, relation.field.name, parent)
 
         instances_to_create, instances_to_update, identities = self.get_o2m_relations
-
-        for relation, instances_to_create in instances_to_create.items():
-            if (
-                self.update_related_models_same_type
-                or relation.related_model != self.Model
-            ):
-                fields = self.get_fields_to_update(relation.related_model)
-                if fields is not None:
-                    instances_to_create = self.validate_instances(instances_to_create)
-                    relation.related_model.objects.bulk_create(instances_to_create)
-
-        for relation, instances_to_update in instances_to_update.items():
-            if (
-                self.update_related_models_same_type
-                or relation.related_model != self.Model
-            ):
-                fields = self.get_fields_to_update(relation.related_model)
-                if fields is not None:
-                    instances_to_update = self.validate_instances(
-                        instances_to_update, fields=fields
-                    )
-                    relation.related_model.objects.bulk_update(
-                        instances_to_update, fields=fields
-                    )
+        self.bulk_update_or_create_relations(instances_to_create, instances_to_update)
 
         if self.delete_related:
             for relation, keys in identities.items():
@@ -331,31 +588,8 @@ class ModelMapperContext(dict):
     def bulk_update_or_create_many_to_many(self):
         m2m_to_create, m2m_to_update, _ = self.get_all_m2m_relations
 
-        # Create many to many's
-        for relation, instances_to_create in m2m_to_create.items():
-            if (
-                self.update_related_models_same_type
-                or relation.related_model != self.Model
-            ):
-                fields = self.get_fields_to_update(relation.related_model)
-                if fields is not None:
-                    instances_to_create = self.validate_instances(instances_to_create)
-                    relation.related_model.objects.bulk_create(instances_to_create)
-
-        # Update many to many's
-        for relation, instances_to_update in m2m_to_update.items():
-            if (
-                self.update_related_models_same_type
-                or relation.related_model != self.Model
-            ):
-                fields = self.get_fields_to_update(relation.related_model)
-                if fields is not None:
-                    instances_to_update = self.validate_instances(
-                        instances_to_update, fields=fields
-                    )
-                    relation.related_model.objects.bulk_update(
-                        instances_to_update, fields=fields
-                    )
+        # Create and update many to many's
+        self.bulk_update_or_create_relations(m2m_to_create, m2m_to_update)
 
         for relation, values in self.many_to_many_items.items():
             fields = self.get_fields_to_update(relation.related_model)
@@ -424,7 +658,9 @@ class ModelMapperContext(dict):
                         ).exclude(id__in=bulk_troughs.values()).delete()
 
                     # Save only new through models
-                    Through.objects.bulk_create(throughs.values())
+                    self.bulk_create_and_update(
+                        Through, list(throughs.values()), [], None
+                    )
 
     def bulk_save(
         self, instances, fields_to_update, identifier_mapping, clean_instances
@@ -518,20 +754,12 @@ class ProductModelMapperContext(ModelMapperContext):
         # now save all the attributes in bulk
         if attributes_to_delete and self.delete_related:
             ProductAttributeValue.objects.filter(pk__in=attributes_to_delete).delete()
-        if attributes_to_update:
-            validated_attributes_to_update = self.validate_instances(
-                attributes_to_update
-            )
-            ProductAttributeValue.objects.bulk_update(
-                validated_attributes_to_update, fields_to_be_updated, batch_size=500
-            )
-        if attributes_to_create:
-            validated_attributes_to_create = self.validate_instances(
-                attributes_to_create
-            )
-            ProductAttributeValue.objects.bulk_create(
-                validated_attributes_to_create, batch_size=500, ignore_conflicts=False
-            )
+        self.bulk_create_and_update(
+            ProductAttributeValue,
+            self.validate_instances(attributes_to_create),
+            self.validate_instances(attributes_to_update),
+            list(fields_to_be_updated) or None,
+        )
 
     def fetch_product_class_attributes(self):
         product_classes = ProductClass.objects.filter(
@@ -548,3 +776,320 @@ class ProductModelMapperContext(ModelMapperContext):
         super().bulk_update_or_create_instances(instances)
 
         self.bulk_update_or_create_product_attributes(instances)
+
+
+class OrderModelMapperContext(ModelMapperContext):
+    """
+    Bulk save orders, identified by their number, with their addresses and related rows.
+
+    The lines, line prices and attributes, notes, status changes, discounts,
+    surcharges and events of an order have no identifier of their own. The rows of
+    orders that were saved before are replaced by the ones of the resources.
+    """
+
+    update_related_models_same_type = False
+    address_fields = ("billing_address", "shipping_address")
+
+    def add_instance_to_fk_items(self, field, instance):
+        # The users and addresses of the orders are saved by the methods below
+        if field.model is not self.Model:
+            super().add_instance_to_fk_items(field, instance)
+
+    def link_users(self, instances):
+        """
+        Link the orders to the users with the same email, users are never created.
+        Orders of unknown users are saved as guest orders.
+        """
+        orders = [
+            order
+            for order in instances
+            if order.user is not None and order.user.pk is None
+        ]
+        if not orders:
+            return
+
+        users = {}
+        for user in (
+            get_user_model()
+            .objects.filter(email__in={order.user.email for order in orders})
+            .order_by("pk")
+        ):
+            users.setdefault(user.email, user)
+
+        for order in orders:
+            user = users.get(order.user.email)
+            if user is None:
+                order.guest_email = order.guest_email or order.user.email
+            order.user = user
+
+    def bulk_update_or_create_addresses(self, instances):
+        """
+        Save the addresses of the orders, the addresses of orders that were saved
+        before are updated. Orders of which an address is invalid are left out.
+        """
+        existing_addresses = {
+            number: addresses
+            for number, *addresses in Order.objects.filter(
+                number__in=[order.number for order in instances]
+            ).values_list("number", *["%s_id" % field for field in self.address_fields])
+        }
+
+        for index, field in enumerate(self.address_fields):
+            Model = Order._meta.get_field(field).related_model
+            using = router.db_for_write(Model)
+            addresses_to_create = []
+            addresses_to_update = []
+            for order in instances:
+                address = getattr(order, field)
+                if address is None:
+                    continue
+                existing = existing_addresses.get(order.number)
+                pk = existing[index] if existing else None
+                if pk is None:
+                    addresses_to_create.append(address)
+                else:
+                    address.pk = pk
+                    # pylint: disable=protected-access
+                    address._state.adding = False
+                    address._state.db = using
+                    addresses_to_update.append(address)
+
+            fields = self.get_fields_to_update(Model)
+            if fields is not None:
+                addresses_to_update = self.validate_instances(
+                    addresses_to_update, fields=fields
+                )
+            self.bulk_create_and_update(
+                Model,
+                self.validate_instances(addresses_to_create),
+                addresses_to_update,
+                fields,
+            )
+
+        return [
+            order
+            for order in instances
+            if all(
+                getattr(order, field) is None or getattr(order, field).pk is not None
+                for field in self.address_fields
+            )
+        ]
+
+    def bulk_update_or_create_instances(self, instances):
+        (
+            instances_to_create,
+            instances_to_update,
+            self.instance_keys,
+        ) = separate_instances_to_create_and_update(
+            self.Model, instances, self.identifier_mapping
+        )
+
+        instances_to_create = self.validate_instances(instances_to_create)
+
+        fields = self.get_fields_to_update(self.Model)
+        if fields is not None:
+            instances_to_update = self.validate_instances(
+                instances_to_update, fields=fields
+            )
+
+        self.bulk_create_and_update(
+            self.Model, instances_to_create, instances_to_update, fields
+        )
+        return instances_to_create, instances_to_update
+
+    def delete_related_instances(self, orders):
+        """Delete the related rows of orders that are replaced."""
+        for relation in self.one_to_many_items:
+            if relation.model is self.Model and self.get_fields_to_update(
+                relation.related_model
+            ):
+                relation.related_model.objects.filter(
+                    **{"%s__in" % relation.field.name: orders}
+                ).delete()
+
+    def get_auto_now_values(self, instances):
+        """
+        Bulk creating sets the auto_now(_add) fields to the current time, keep the
+        values of the resources to restore them afterwards.
+        """
+        # pylint: disable=protected-access
+        fields = [
+            field
+            for field in instances[0]._meta.concrete_fields
+            if getattr(field, "auto_now", False)
+            or getattr(field, "auto_now_add", False)
+        ]
+        return {
+            field.attname: [getattr(instance, field.attname) for instance in instances]
+            for field in fields
+            if all(getattr(instance, field.attname) for instance in instances)
+        }
+
+    def report_unknown_relation(self, line, field_name, value):
+        """Leave out a relation of a line that does not exist and log an error."""
+        # pylint: disable=protected-access
+        field = Line._meta.get_field(field_name)
+        error = ValidationError(
+            field.error_messages["invalid"],
+            code="invalid",
+            params={
+                "model": field.remote_field.model._meta.verbose_name,
+                "pk": value,
+                "field": field.remote_field.field_name,
+                "value": value,
+            },
+        )
+        self.errors.add_error(ValidationError({field_name: [error]}), line.order)
+        setattr(line, field.attname, None)
+
+    def link_line_relations(self, lines):
+        """
+        Check that the partners, stockrecords and products the lines refer to by id
+        exist, eg. when the orders of another platform are imported. Unknown
+        stockrecords are looked up by the partner and sku of the line and unknown
+        products by the upc of the line. Relations that are not found are left out
+        and reported in the error log, the lines are saved without them.
+        """
+        partner_pks = set(
+            Partner.objects.filter(
+                pk__in={line.partner_id for line in lines} - {None}
+            ).values_list("pk", flat=True)
+        )
+        for line in lines:
+            if line.partner_id is not None and line.partner_id not in partner_pks:
+                self.report_unknown_relation(line, "partner", line.partner_id)
+
+        stockrecord_pks = set(
+            StockRecord.objects.filter(
+                pk__in={line.stockrecord_id for line in lines} - {None}
+            ).values_list("pk", flat=True)
+        )
+        unknown_stockrecord_lines = [
+            line
+            for line in lines
+            if line.stockrecord_id is not None
+            and line.stockrecord_id not in stockrecord_pks
+        ]
+        stockrecord_pks_by_sku = in_bulk(
+            StockRecord.objects,
+            [line for line in unknown_stockrecord_lines if line.partner_id],
+            ("partner_id", "partner_sku"),
+        )
+        for line in unknown_stockrecord_lines:
+            pk = stockrecord_pks_by_sku.get((line.partner_id, line.partner_sku))
+            if pk is None:
+                self.report_unknown_relation(line, "stockrecord", line.stockrecord_id)
+            else:
+                line.stockrecord_id = pk
+
+        product_pks = set(
+            Product.objects.filter(
+                pk__in={line.product_id for line in lines} - {None}
+            ).values_list("pk", flat=True)
+        )
+        unknown_product_lines = [
+            line
+            for line in lines
+            if line.product_id is not None and line.product_id not in product_pks
+        ]
+        product_pks_by_upc = dict(
+            Product.objects.filter(
+                upc__in={line.upc for line in unknown_product_lines if line.upc}
+            ).values_list("upc", "pk")
+        )
+        for line in unknown_product_lines:
+            pk = product_pks_by_upc.get(line.upc)
+            if pk is None:
+                self.report_unknown_relation(line, "product", line.product_id)
+            else:
+                line.product_id = pk
+
+    def bulk_create_related_instances(self, orders):
+        """
+        Create the related rows of the orders, the relations of the orders are
+        created before the relations of their lines.
+        """
+        saved_orders = {id(order) for order in orders}
+        relations = sorted(
+            self.one_to_many_items,
+            key=lambda relation: relation.model is not self.Model,
+        )
+        for relation in relations:
+            Model = relation.related_model
+            if self.get_fields_to_update(Model) is None:
+                continue
+
+            instances = []
+            for parent, children in self.one_to_many_items[relation]:
+                # Lines of orders that were not saved, were not created either
+                if parent.pk is None or (
+                    relation.model is self.Model and id(parent) not in saved_orders
+                ):
+                    continue
+                for child in children:
+                    setattr(child, relation.field.name, parent)
+                    if relation.model is not self.Model and hasattr(child, "order_id"):
+                        child.order = parent.order
+                    instances.append(child)
+
+            if Model is Line:
+                self.link_line_relations(instances)
+
+            # The related objects were saved or looked up just now, validating
+            # them again would query them for every row.
+            fields = [
+                field.name
+                for field in Model._meta.concrete_fields
+                if not field.is_relation
+            ]
+            instances = self.validate_instances(instances, fields=fields)
+            if not instances:
+                continue
+
+            auto_now_values = self.get_auto_now_values(instances)
+            Model.objects.bulk_create(instances)
+
+            if auto_now_values:
+                for attname, values in auto_now_values.items():
+                    for instance, value in zip(instances, values):
+                        setattr(instance, attname, value)
+                bulk_update_from_values(Model.objects, instances, list(auto_now_values))
+
+    def bulk_save(
+        self, instances, fields_to_update, identifier_mapping, clean_instances
+    ):
+        self.fields_to_update = fields_to_update
+        self.identifier_mapping = identifier_mapping
+        self.clean_instances = clean_instances
+
+        with transaction.atomic():
+            self.link_users(instances)
+
+            self.bulk_update_or_create_foreign_keys()
+
+            instances = self.bulk_update_or_create_addresses(instances)
+
+            created, updated = self.bulk_update_or_create_instances(instances)
+
+            self.delete_related_instances(updated)
+
+            self.bulk_create_related_instances(created + updated)
+
+            return created + updated, self.errors
+
+
+class CopyProductModelMapperContext(ProductModelMapperContext):
+    """
+    Bulk save products like ProductModelMapperContext. On PostgreSQL the rows of the
+    products, their stockrecords, images, attribute values and categories are
+    loaded with COPY into temporary staging tables, and merged from there.
+    Other databases save them the regular way.
+    """
+
+    def bulk_write(self, Model, instances_to_create, instances_to_update, fields):
+        using = router.db_for_write(Model)
+        if connections[using].vendor == "postgresql":
+            copy_insert(Model, instances_to_create, using=using)
+            copy_update(Model, instances_to_update, fields, using=using)
+        else:
+            super().bulk_write(Model, instances_to_create, instances_to_update, fields)
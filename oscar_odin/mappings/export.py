@@ -0,0 +1,330 @@
+"""Export product querysets to JSONL or CSV files using multiple processes."""
+import csv
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Optional, Tuple
+
+import django
+import odin
+from django.db import connections
+from django.db.models import QuerySet
+from odin.codecs import csv_codec, json_codec
+from oscar.core.loading import get_class, get_classes, get_model
+
+from ..settings import QUERYSET_TO_RESOURCES_CHUNK_SIZE
+from .prefetching.registry import EXPORT_PROFILE
+
+__all__ = (
+    "JSONL",
+    "CSV",
+    "ProductImageToExportResource",
+    "ProductToExportResource",
+    "get_pk_ranges",
+    "export_product_queryset",
+)
+
+ProductModel = get_model("catalogue", "Product")
+ProductImageModel = get_model("catalogue", "ProductImage")
+
+(
+    ProductImageToResource,
+    ProductToResource,
+    product_queryset_to_resources_iterator,
+) = get_classes(
+    "oscar_odin.mappings.catalogue",
+    [
+        "ProductImageToResource",
+        "ProductToResource",
+        "product_queryset_to_resources_iterator",
+    ],
+)
+map_queryset = get_class("oscar_odin.mappings.common", "map_queryset")
+StockRecordModelToResource = get_class(
+    "oscar_odin.mappings.partner", "StockRecordModelToResource"
+)
+
+(
+    ParentProductResource,
+    ProductImageResource,
+    ProductRecommentationResource,
+    ProductResource,
+) = get_classes(
+    "oscar_odin.resources.catalogue",
+    [
+        "ParentProductResource",
+        "ProductImageResource",
+        "ProductRecommentationResource",
+        "ProductResource",
+    ],
+)
+StockRecordResource = get_class("oscar_odin.resources.partner", "StockRecordResource")
+
+JSONL = "jsonl"
+CSV = "csv"
+
+
+class ProductImageToExportResource(ProductImageToResource):
+    """Map from an image model to a resource that can be serialized."""
+
+    from_obj = ProductImageModel
+    to_obj = ProductImageResource
+
+    @odin.map_field
+    def product(self, value) -> None:  # pylint: disable=unused-argument
+        """Images are exported as part of their product, so don't map it again."""
+        return None
+
+
+class ProductToExportResource(ProductToResource):
+    """Map from a product model to a resource that can be serialized.
+
+    ProductToResource leaves the parent, stockrecords and recommended products as
+    model objects, these are mapped to resources for the export as well.
+    """
+
+    from_obj = ProductModel
+    to_obj = ProductResource
+
+    prefetch_profile = EXPORT_PROFILE
+
+    @odin.assign_field(to_list=True)
+    def images(self) -> List[ProductImageResource]:
+        """Map related image."""
+        items = self.source.get_all_images()
+        return map_queryset(ProductImageToExportResource, items, context=self.context)
+
+    @odin.assign_field
+    def parent(self) -> Optional[ParentProductResource]:
+        """Map the parent of child products to its upc."""
+        if self.source.parent_id is None:
+            return None
+        return ParentProductResource(upc=self.source.parent.upc)
+
+    @odin.assign_field(to_list=True)
+    def stockrecords(self) -> List[StockRecordResource]:
+        """Map related stockrecords."""
+        return map_queryset(
+            StockRecordModelToResource, self.source.stockrecords, context=self.context
+        )
+
+    @odin.assign_field(to_list=True)
+    def recommended_products(self) -> List[ProductRecommentationResource]:
+        """Map recommended products to their upc."""
+        return [
+            ProductRecommentationResource(upc=product.upc)
+            for product in self.source.recommended_products.all()
+        ]
+
+    @odin.assign_field
+    def children(self) -> Tuple[Optional[List[ProductResource]]]:
+        """Children of parent products."""
+        if self.context.get("include_children", False) and self.source.is_parent:
+            # Return a tuple as an optional list causes problems.
+            return (
+                map_queryset(
+                    ProductToExportResource, self.source.children, context=self.context
+                ),
+            )
+        return (None,)
+
+
+def get_pk_ranges(queryset: QuerySet, num_ranges: int) -> List[Tuple[int, int]]:
+    """Split a queryset into at most ``num_ranges`` inclusive primary key ranges.
+
+    Every range contains (about) the same number of rows, so the ranges can be
+    mapped in parallel without one of them holding up the rest. The bounds are
+    looked up with a query per range, that skips the rows of the range from its
+    first primary key, so the primary keys are not all loaded into memory.
+    """
+    pks = queryset.order_by("pk").values_list("pk", flat=True)
+    count = pks.count()
+    if not count:
+        return []
+
+    size, remainder = divmod(count, min(num_ranges, count))
+    ranges = []
+    first_pk = pks.first()
+    while first_pk is not None:
+        length = size + (1 if len(ranges) < remainder else 0)
+        # The last primary key of this range, and the first one of the next range
+        bounds = list(pks.filter(pk__gte=first_pk)[length - 1 : length + 1])
+        if not bounds:
+            # Rows were deleted since they were counted
+            bounds = [pks.last()]
+        ranges.append((first_pk, bounds[0]))
+        first_pk = bounds[1] if len(bounds) > 1 else None
+
+    return ranges
+
+
+def write_resources(fp, resources, file_format, resource_type):
+    """Write resources to a file without a header, returns the number of resources."""
+    count = 0
+    if file_format == JSONL:
+        for resource in resources:
+            fp.write(json_codec.dumps(resource, include_type_field=False))
+            fp.write("\n")
+            count += 1
+    elif file_format == CSV:
+        writer = csv.writer(fp)
+        fields = csv_codec.value_fields(resource_type)
+        for resource in resources:
+            csv_codec.dump_to_writer(writer, [resource], resource_type, fields)
+            count += 1
+    else:
+        raise ValueError(f"Unsupported export format {file_format!r}")
+
+    return count
+
+
+def export_pk_range(
+    pk_range: Tuple[int, int],
+    model,
+    query,
+    using: str,
+    directory: str,
+    file_format: str,
+    include_children: bool,
+    product_mapper,
+    chunk_size: int,
+    strategy_kwargs: dict,
+) -> Tuple[str, int]:
+    """
+    Map the products within a primary key range and write them to a part file.
+
+    The queryset is rebuilt from its model and query, pickling a queryset for the
+    worker processes would evaluate it.
+    """
+    first_pk, last_pk = pk_range
+    # pylint: disable=protected-access
+    queryset = model._default_manager.db_manager(using).all()
+    queryset.query = query
+    queryset = queryset.filter(pk__gte=first_pk, pk__lte=last_pk)
+    resources = product_queryset_to_resources_iterator(
+        queryset,
+        include_children=include_children,
+        product_mapper=product_mapper,
+        chunk_size=chunk_size,
+        **strategy_kwargs,
+    )
+
+    path = os.path.join(directory, f"{first_pk}-{last_pk}.part")
+    with open(path, "w", encoding="utf-8", newline="") as fp:
+        count = write_resources(fp, resources, file_format, product_mapper.to_obj)
+
+    return path, count
+
+
+# The connections a forked worker process inherited from its parent process
+_inherited_connections = []
+
+
+def _reset_connections():
+    """
+    Make sure a forked worker process opens its own database connections.
+
+    The inherited connections share their sockets with the parent process, closing
+    them would close the connections of the parent as well. They are set aside
+    instead, and kept until the worker exits.
+    """
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is not None:
+            _inherited_connections.append(connection.connection)
+            connection.connection = None
+
+
+def export_product_queryset(
+    queryset: QuerySet,
+    path: str,
+    file_format: str = JSONL,
+    processes: Optional[int] = None,
+    num_ranges: Optional[int] = None,
+    include_children: bool = False,
+    product_mapper=ProductToExportResource,
+    chunk_size: int = QUERYSET_TO_RESOURCES_CHUNK_SIZE,
+    mp_context: Optional[str] = None,
+    **kwargs,
+) -> int:
+    """Export a queryset of products to a single JSONL or CSV file.
+
+    Mapping products is CPU bound, so the queryset is split into primary key ranges
+    that are mapped by a pool of worker processes, each with its own database
+    connection and each running the registered prefetches for its chunks. Every
+    range is written to a part file, the parts are merged in primary key order.
+
+    The strategy is selected within the workers, so instead of a request or user
+    only keyword arguments for the strategy selector can be passed.
+
+    :param queryset: A queryset of product models.
+    :param path: The file to write the export to.
+    :param file_format: Either ``JSONL`` or ``CSV``, CSV only contains the non composite fields.
+    :param processes: The number of worker processes, defaults to the number of CPUs.
+        With a single process, the ranges are exported in the current process.
+    :param num_ranges: The number of ranges to split the queryset in, defaults to
+        four ranges per process to even out the work between the processes.
+    :param include_children: Include children of parent products.
+    :param product_mapper: The mapping to use for the products.
+    :param chunk_size: The number of products every worker maps at once.
+    :param mp_context: The multiprocessing start method for the worker processes,
+        defaults to the start method of the platform. Workers that are not forked set
+        up Django themselves, which needs the ``DJANGO_SETTINGS_MODULE`` environment
+        variable. The workers use connections of their own, so they don't see rows
+        that the caller has not committed yet.
+    :param kwargs: Additional keyword arguments to pass to the strategy selector.
+    :return: The number of exported products.
+    """
+    if file_format not in (JSONL, CSV):
+        raise ValueError(f"Unsupported export format {file_format!r}")
+
+    processes = processes or os.cpu_count() or 1
+    pk_ranges = get_pk_ranges(queryset, num_ranges or processes * 4)
+
+    directory = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        export = partial(
+            export_pk_range,
+            model=queryset.model,
+            query=queryset.query,
+            using=queryset.db,
+            directory=directory,
+            file_format=file_format,
+            include_children=include_children,
+            product_mapper=product_mapper,
+            chunk_size=chunk_size,
+            strategy_kwargs=kwargs,
+        )
+
+        if processes == 1:
+            parts = [export(pk_range) for pk_range in pk_ranges]
+        else:
+            context = multiprocessing.get_context(mp_context)
+            if context.get_start_method() == "fork":
+                # Connections can not be shared with the forked worker processes.
+                initializer = _reset_connections
+            else:
+                # The worker processes start without the apps being loaded, this
+                # module can't be imported until they are.
+                initializer = django.setup
+            with ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=context,
+                initializer=initializer,
+            ) as executor:
+                parts = list(executor.map(export, pk_ranges))
+
+        with open(path, "w", encoding="utf-8", newline="") as fp:
+            if file_format == CSV:
+                fields = csv_codec.value_fields(product_mapper.to_obj)
+                csv.writer(fp).writerow([field.name for field in fields])
+
+            for part_path, _ in parts:
+                with open(part_path, encoding="utf-8", newline="") as part:
+                    shutil.copyfileobj(part, fp)
+
+        return sum(count for _, count in parts)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
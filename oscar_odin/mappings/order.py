@@ -1,7 +1,13 @@
 """Mappings between odin and django-oscar models."""
-from typing import Any, Dict, Iterable, List, Optional, Union
+from collections import defaultdict
+from datetime import datetime
+from heapq import merge
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
 import odin
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import QuerySet
 from django.http import HttpRequest
 from oscar.core.loading import get_model, get_class, get_classes
 
@@ -9,31 +15,96 @@ from decimal import Decimal
 from django.db.models import Sum
 from django.db.models.functions import Coalesce
 
+from . import constants
+from .context import OrderModelMapperContext
+from .prefetching.prefetch import prefetch_order_queryset
+from .prefetching.registry import DEFAULT_PROFILE
+from ..settings import QUERYSET_TO_RESOURCES_CHUNK_SIZE, RESOURCES_TO_DB_CHUNK_SIZE
+from ..utils import (
+    ErrorLog,
+    chunked,
+    decode_cursor,
+    encode_cursor,
+    get_keyset_query,
+    validate_resources,
+)
+
 __all__ = (
     "OrderToResource",
     "order_to_resource",
+    "order_queryset_to_resources",
+    "order_changes_to_resources",
+    "OrderToModel",
+    "orders_to_db",
+    "order_statuses_to_db",
 )
 
 OrderModel = get_model("order", "Order")
+ProductModel = get_model("catalogue", "Product")
 OrderNoteModel = get_model("order", "OrderNote")
 OrderStatusChangeModel = get_model("order", "OrderStatusChange")
 LineModel = get_model("order", "Line")
 LinePriceModel = get_model("order", "LinePrice")
+LineAttributeModel = get_model("order", "LineAttribute")
 PaymentEventModel = get_model("order", "PaymentEvent")
+PaymentEventTypeModel = get_model("order", "PaymentEventType")
 ShippingEventModel = get_model("order", "ShippingEvent")
+ShippingEventTypeModel = get_model("order", "ShippingEventType")
 OrderDiscountModel = get_model("order", "OrderDiscount")
 OrderLineDiscountModel = get_model("order", "OrderLineDiscount")
 SurchargeModel = get_model("order", "Surcharge")
+BillingAddressModel = get_model("order", "BillingAddress")
+ShippingAddressModel = get_model("order", "ShippingAddress")
+UserModel = get_model("auth", "User")
+
+InvalidOrderStatus, InvalidLineStatus = get_classes(
+    "order.exceptions", ["InvalidOrderStatus", "InvalidLineStatus"]
+)
+
+# The models of which new rows mark an order as changed. Every model needs an
+# ``order`` foreign key and an indexed ``date_created`` field.
+ORDER_CHANGE_MODELS = (OrderStatusChangeModel, PaymentEventModel, ShippingEventModel)
+ORDER_CHANGE_ORDERING = ("date_created", "order_id")
+
+resources_to_db = get_class("oscar_odin.mappings.resources", "resources_to_db")
 
 # mappings
-map_queryset, OscarBaseMapping = get_classes(
-    "oscar_odin.mappings.common", ["map_queryset", "OscarBaseMapping"]
+ModelMapping = get_class("oscar_odin.mappings.model_mapper", "ModelMapping")
+(
+    map_queryset,
+    OscarBaseMapping,
+    ResourcePage,
+    select_related_for_mapping,
+    select_related_objects,
+) = get_classes(
+    "oscar_odin.mappings.common",
+    [
+        "map_queryset",
+        "OscarBaseMapping",
+        "ResourcePage",
+        "select_related_for_mapping",
+        "select_related_objects",
+    ],
 )
-BillingAddressToResource, ShippingAddressToResource = get_classes(
+(
+    BillingAddressToResource,
+    ShippingAddressToResource,
+    BillingAddressToModel,
+    ShippingAddressToModel,
+) = get_classes(
     "oscar_odin.mappings.address",
-    ["BillingAddressToResource", "ShippingAddressToResource"],
+    [
+        "BillingAddressToResource",
+        "ShippingAddressToResource",
+        "BillingAddressToModel",
+        "ShippingAddressToModel",
+    ],
 )
 UserToResource = get_class("oscar_odin.mappings.auth", "UserToResource")
+ProductToResource, product_queryset_to_resources = get_classes(
+    "oscar_odin.mappings.catalogue",
+    ["ProductToResource", "product_queryset_to_resources"],
+)
 
 # resources
 UserResource = get_class("oscar_odin.resources.auth", "UserResource")
@@ -51,6 +122,7 @@ UserResource = get_class("oscar_odin.resources.auth", "UserResource")
     PaymentEventResource,
     ShippingEventResource,
     DiscountPerTaxCodeResource,
+    OrderStatusResource,
 ) = get_classes(
     "oscar_odin.resources.order",
     [
@@ -66,9 +138,11 @@ UserResource = get_class("oscar_odin.resources.auth", "UserResource")
         "PaymentEventResource",
         "ShippingEventResource",
         "DiscountPerTaxCodeResource",
+        "OrderStatusResource",
     ],
 )
 
+ProductResource = get_class("oscar_odin.resources.catalogue", "ProductResource")
 BillingAddressResource, ShippingAddressResource = get_classes(
     "oscar_odin.resources.address",
     ["BillingAddressResource", "ShippingAddressResource"],
@@ -91,7 +165,11 @@ class DiscountLineToResource(OscarBaseMapping):
     @odin.assign_field
     def line(self):
         """map line object as resource"""
-        return LineToResource.apply(self.source.line)
+        # Reuse the resource of the line when the order lines were mapped already
+        line_resource = self.context.get("line_resources", {}).get(self.source.line_id)
+        if line_resource is not None:
+            return line_resource
+        return LineToResource.apply(self.source.line, context=self.context)
 
 
 class DiscountToResource(OscarBaseMapping):
@@ -135,20 +213,26 @@ class DiscountToResource(OscarBaseMapping):
     @odin.assign_field(to_list=True)
     def discount_lines_per_tax_code(self):
         """get the total discount of all lines for each tax code"""
-        discount_lines = []
-
-        for tax_code in sorted(
-            set(self.source.discount_lines.values_list("line__tax_code", flat=True))
-        ):
-            amount = self.source.discount_lines.filter(
-                line__tax_code=tax_code
-            ).aggregate(amount=Coalesce(Sum("amount"), Decimal(0)))["amount"]
-
-            discount_lines.append(
-                DiscountPerTaxCodeResource(amount=amount, tax_code=tax_code)
+        prefetched = getattr(self.source, "_prefetched_objects_cache", {})
+        if "discount_lines" in prefetched:
+            # Sum the prefetched discount lines instead of querying them again
+            totals = {}
+            for discount_line in prefetched["discount_lines"]:
+                tax_code = discount_line.line.tax_code
+                totals[tax_code] = (
+                    totals.get(tax_code, Decimal(0)) + discount_line.amount
+                )
+        else:
+            totals = dict(
+                self.source.discount_lines.order_by()
+                .values_list("line__tax_code")
+                .annotate(amount=Coalesce(Sum("amount"), Decimal(0)))
             )
 
-        return discount_lines
+        return [
+            DiscountPerTaxCodeResource(amount=totals[tax_code], tax_code=tax_code)
+            for tax_code in sorted(totals)
+        ]
 
 
 class ShippingEventToResource(OscarBaseMapping):
@@ -184,10 +268,22 @@ class LineToResource(OscarBaseMapping):
         items = self.source.prices.all()
         return map_queryset(LinePriceToResource, items, context=self.context)
 
+    @odin.assign_field
+    def product(self) -> Optional[ProductResource]:
+        """Map the product from the product resources of the batch, if included."""
+        product_resources = self.context.get("product_resources")
+        if product_resources is None:
+            return None
+        return product_resources.get(self.source.product_id)
+
     @odin.assign_field
     def attributes(self) -> Dict[str, Any]:
         """Map attributes."""
-        return dict(self.source.attributes.values_list("type", "value"))
+        # Iterate over all attributes, so prefetched attributes are used
+        return {
+            attribute.type: attribute.value
+            for attribute in self.source.attributes.all()
+        }
 
 
 class StatusChangeToResource(OscarBaseMapping):
@@ -210,6 +306,27 @@ class OrderToResource(OscarBaseMapping):
     from_obj = OrderModel
     to_obj = OrderResource
 
+    # The prefetch profile that is applied when mapping querysets with this mapper
+    prefetch_profile = DEFAULT_PROFILE
+    select_related = {
+        "user": UserToResource,
+        "billing_address": BillingAddressToResource,
+        "shipping_address": ShippingAddressToResource,
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._line_resources = None
+
+    def get_line_resources(self) -> Dict[int, LineResource]:
+        """Map the lines of the order once, by pk, for the lines and discounts."""
+        if self._line_resources is None:
+            lines = map_queryset(
+                LineToResource, self.source.lines, context=self.context
+            )
+            self._line_resources = {line.model_instance.pk: line for line in lines}
+        return self._line_resources
+
     @odin.assign_field
     def email(self) -> str:
         """Map order email."""
@@ -219,25 +336,28 @@ class OrderToResource(OscarBaseMapping):
     def user(self) -> Optional[UserResource]:
         """Map user."""
         if self.source.user:
-            return UserToResource.apply(self.source.user)
+            return UserToResource.apply(self.source.user, context=self.context)
 
     @odin.assign_field
     def billing_address(self) -> Optional[BillingAddressResource]:
         """Map billing address."""
         if self.source.billing_address:
-            return BillingAddressToResource.apply(self.source.billing_address)
+            return BillingAddressToResource.apply(
+                self.source.billing_address, context=self.context
+            )
 
     @odin.assign_field
     def shipping_address(self) -> Optional[ShippingAddressResource]:
         """Map shipping address."""
         if self.source.shipping_address:
-            return ShippingAddressToResource.apply(self.source.shipping_address)
+            return ShippingAddressToResource.apply(
+                self.source.shipping_address, context=self.context
+            )
 
     @odin.assign_field(to_list=True)
     def lines(self) -> List[LineResource]:
         """Map order lines."""
-        items = self.source.lines
-        return map_queryset(LineToResource, items, context=self.context)
+        return list(self.get_line_resources().values())
 
     @odin.assign_field(to_list=True)
     def notes(self) -> List[NoteResource]:
@@ -254,6 +374,8 @@ class OrderToResource(OscarBaseMapping):
     @odin.assign_field(to_list=True)
     def discounts(self) -> List[DiscountResource]:
         """Map order discounts."""
+        # The discount lines reuse the resources of the order lines
+        self.context["line_resources"] = self.get_line_resources()
         items = self.source.discounts
         return map_queryset(DiscountToResource, items, context=self.context)
 
@@ -288,7 +410,579 @@ def order_to_resource(
     :param order: A single product model or iterable of product models (eg a QuerySet).
     :param request: The current HTTP request
     """
+    # Load the user and addresses with one query, instead of one per relation
+    if isinstance(order, QuerySet):
+        order = select_related_for_mapping(order, OrderToResource)
+    elif isinstance(order, OrderModel):
+        select_related_objects([order], OrderToResource)
+    else:
+        order = list(order)
+        select_related_objects(order, OrderToResource)
+
     return OrderToResource.apply(
         order,
         context={},
     )
+
+
+def get_order_context(
+    orders: List[OrderModel],
+    request: Optional[HttpRequest] = None,
+    include_products: bool = False,
+    product_mapper=ProductToResource,
+    product_fields: Optional[Iterable[str]] = None,
+) -> Dict[str, Any]:
+    """Build the mapping context for a batch of orders.
+
+    When products are included, the products of all lines are mapped at once and
+    shared by the lines through the ``product_resources`` context value.
+    """
+    context = {}
+    if include_products:
+        product_ids = {
+            line.product_id
+            for order in orders
+            for line in order.lines.all()
+            if line.product_id is not None
+        }
+        products = product_queryset_to_resources(
+            ProductModel.objects.filter(pk__in=product_ids),
+            request=request,
+            product_mapper=product_mapper,
+            fields=product_fields,
+        )
+        context["product_resources"] = {product.id: product for product in products}
+    return context
+
+
+def order_queryset_to_resources(
+    queryset: QuerySet,
+    request: Optional[HttpRequest] = None,
+    order_mapper=OrderToResource,
+    prefetch_profile: Optional[str] = None,
+    include_products: bool = False,
+    product_mapper=ProductToResource,
+    product_fields: Optional[Iterable[str]] = None,
+) -> Iterable[OrderResource]:
+    """Map a queryset of order models to a list of resources.
+
+    The operations registered on the ``order_prefetch_registry`` are applied to the
+    queryset first, so a batch of orders is mapped with a fixed number of queries.
+
+    :param queryset: A queryset of order models.
+    :param request: The current HTTP request
+    :param order_mapper: The mapping to use for the orders.
+    :param prefetch_profile: The prefetch profile to apply, defaults to the
+        ``prefetch_profile`` of the order mapper.
+    :param include_products: Map the products of the lines, all at once, onto the
+        ``product`` field of the lines.
+    :param product_mapper: The mapping to use for the products.
+    :param product_fields: Only map these fields of the products.
+    """
+    queryset = prefetch_order_queryset(
+        select_related_for_mapping(queryset, order_mapper),
+        prefetch_profile or getattr(order_mapper, "prefetch_profile", None),
+    )
+    orders = list(queryset)
+    context = get_order_context(
+        orders, request, include_products, product_mapper, product_fields
+    )
+    return list(order_mapper.apply(orders, context=context))
+
+
+def get_order_changes(watermark, size, change_models=ORDER_CHANGE_MODELS):
+    """
+    Select the first ``size`` changes after the watermark, as ``(date_created, order_id)``.
+
+    Every change model is queried for its first ``size`` rows on its own, so each query
+    only reads the index from the watermark onwards. The rows are merged afterwards, any
+    row up to the last merged row is part of the first ``size`` rows of its model.
+    """
+    changes = []
+    for model in change_models:
+        queryset = model.objects.order_by(*ORDER_CHANGE_ORDERING)
+        if watermark is not None:
+            queryset = queryset.filter(
+                get_keyset_query(ORDER_CHANGE_ORDERING, watermark)
+            )
+        changes.append(queryset.values_list(*ORDER_CHANGE_ORDERING)[:size])
+
+    return list(merge(*changes))[:size]
+
+
+def order_changes_to_resources(
+    after: Optional[str] = None,
+    since: Optional[datetime] = None,
+    batch_size: int = QUERYSET_TO_RESOURCES_CHUNK_SIZE,
+    request: Optional[HttpRequest] = None,
+    order_mapper=OrderToResource,
+    prefetch_profile: Optional[str] = None,
+    include_products: bool = False,
+    product_mapper=ProductToResource,
+    product_fields: Optional[Iterable[str]] = None,
+) -> ResourcePage:
+    """Map the orders that changed after a watermark to resources.
+
+    An order has changed when a status change, payment event or shipping event was
+    created for it. The changes are walked in the order they were created, a batch of
+    at most ``batch_size`` changes is selected and their orders are mapped once each.
+    The returned cursor is the new watermark, pass it as ``after`` to continue with
+    the next batch, eg. in the next synchronisation. Orders that change again later
+    on are returned again by a later batch.
+
+    :param after: The cursor of the previous batch, or None to start at ``since``.
+    :param since: Only select changes created at or after this moment, when there is
+        no cursor yet. Defaults to all changes.
+    :param batch_size: The maximum number of changes in the batch.
+    :param request: The current HTTP request
+    :param order_mapper: The mapping to use for the orders.
+    :param prefetch_profile: The prefetch profile to apply, defaults to the
+        ``prefetch_profile`` of the order mapper.
+    :param include_products: Map the products of the lines, all at once, onto the
+        ``product`` field of the lines.
+    :param product_mapper: The mapping to use for the products.
+    :param product_fields: Only map these fields of the products.
+    """
+    watermark = None
+    if after is not None:
+        ordering, values = decode_cursor(after)
+        if ordering != ORDER_CHANGE_ORDERING:
+            raise ValueError(f"Invalid cursor {after!r}")
+        date_field = OrderStatusChangeModel._meta.get_field("date_created")
+        try:
+            watermark = (date_field.to_python(values[0]), int(values[1]))
+        except (DjangoValidationError, TypeError, ValueError):
+            raise ValueError(f"Invalid cursor {after!r}") from None
+    elif since is not None:
+        # Order ids start at 1, so this selects all changes created at since
+        watermark = (since, 0)
+
+    # Select one extra change to find out if there is a next batch.
+    changes = get_order_changes(watermark, batch_size + 1)
+    has_next = len(changes) > batch_size
+    changes = changes[:batch_size]
+
+    if not changes:
+        cursor = after
+        if cursor is None and watermark is not None:
+            cursor = encode_cursor(
+                ORDER_CHANGE_ORDERING, [watermark[0].isoformat(), watermark[1]]
+            )
+        return ResourcePage([], cursor, False)
+
+    # The orders in the order of their first change in this batch
+    positions = {}
+    for _, order_id in changes:
+        positions.setdefault(order_id, len(positions))
+
+    queryset = prefetch_order_queryset(
+        select_related_for_mapping(
+            OrderModel.objects.filter(pk__in=positions), order_mapper
+        ),
+        prefetch_profile or getattr(order_mapper, "prefetch_profile", None),
+    )
+    orders = sorted(queryset, key=lambda order: positions[order.pk])
+    context = get_order_context(
+        orders, request, include_products, product_mapper, product_fields
+    )
+    resources = list(order_mapper.apply(orders, context=context))
+
+    date_created, order_id = changes[-1]
+    cursor = encode_cursor(ORDER_CHANGE_ORDERING, [date_created.isoformat(), order_id])
+    return ResourcePage(resources, cursor, has_next)
+
+
+class SurchargeToModel(ModelMapping):
+    """Mapping from a surcharge resource to a model."""
+
+    from_obj = SurchargeResource
+    to_obj = SurchargeModel
+
+
+class DiscountToModel(ModelMapping):
+    """Mapping from an order discount resource to a model.
+
+    The discount lines reference the lines by their resource, they are not imported.
+    """
+
+    from_obj = DiscountResource
+    to_obj = OrderDiscountModel
+    exclude_fields = ["id", "discount_lines"]
+
+    @odin.map_field
+    def category(self, value: DiscountCategoryResource) -> str:
+        """Map category."""
+        return value.value
+
+
+class ShippingEventToModel(ModelMapping):
+    """Mapping from a shipping event resource to a model."""
+
+    from_obj = ShippingEventResource
+    to_obj = ShippingEventModel
+
+    @odin.map_field
+    def event_type(self, value: str) -> ShippingEventTypeModel:
+        """Event types are looked up, or created, by name."""
+        return ShippingEventTypeModel(name=value)
+
+
+class PaymentEventToModel(ModelMapping):
+    """Mapping from a payment event resource to a model."""
+
+    from_obj = PaymentEventResource
+    to_obj = PaymentEventModel
+
+    @odin.map_field
+    def event_type(self, value: str) -> PaymentEventTypeModel:
+        """Event types are looked up, or created, by name."""
+        return PaymentEventTypeModel(name=value)
+
+
+class LinePriceToModel(ModelMapping):
+    """Mapping from a line price resource to a model."""
+
+    from_obj = LinePriceResource
+    to_obj = LinePriceModel
+
+
+class LineToModel(ModelMapping):
+    """Mapping from a line resource to a model."""
+
+    from_obj = LineResource
+    to_obj = LineModel
+    exclude_fields = ["product"]
+
+    @odin.assign_field
+    def num_allocated(self) -> int:
+        """No stock is allocated for imported lines."""
+        return 0
+
+    @odin.map_field(from_field="stock_record_id", to_field="stockrecord_id")
+    def stockrecord_id(self, value: Optional[int]) -> Optional[int]:
+        """Map stockrecord."""
+        return value
+
+    @odin.map_list_field
+    def prices(self, values) -> List[LinePriceModel]:
+        """Map line prices. We save these later in bulk"""
+        return LinePriceToModel.apply(values)
+
+    @odin.map_list_field
+    def attributes(self, values: Dict[str, Any]) -> List[LineAttributeModel]:
+        """Map attributes. We save these later in bulk"""
+        return [
+            LineAttributeModel(type=key, value=value) for key, value in values.items()
+        ]
+
+    @odin.map_field(
+        from_field=["prices", "quantity", "unit_price_incl_tax", "unit_price_excl_tax"],
+        to_field=["line_price_incl_tax", "line_price_excl_tax"],
+    )
+    def line_price(
+        self, prices, quantity, unit_price_incl_tax, unit_price_excl_tax
+    ) -> Tuple[Decimal, Decimal]:
+        """The line price is the total of the line prices, or of the unit prices."""
+        if prices:
+            return (
+                sum(price.price_incl_tax * price.quantity for price in prices),
+                sum(price.price_excl_tax * price.quantity for price in prices),
+            )
+        return (
+            (unit_price_incl_tax or Decimal(0)) * quantity,
+            (unit_price_excl_tax or Decimal(0)) * quantity,
+        )
+
+    @odin.map_field(
+        from_field=[
+            "price_before_discounts_incl_tax",
+            "price_before_discounts_excl_tax",
+            "quantity",
+            "unit_price_incl_tax",
+            "unit_price_excl_tax",
+        ],
+        to_field=[
+            "line_price_before_discounts_incl_tax",
+            "line_price_before_discounts_excl_tax",
+        ],
+    )
+    def line_price_before_discounts(
+        self,
+        price_before_discounts_incl_tax,
+        price_before_discounts_excl_tax,
+        quantity,
+        unit_price_incl_tax,
+        unit_price_excl_tax,
+    ) -> Tuple[Decimal, Decimal]:
+        """Map the price before discounts, which defaults to the total of the unit prices."""
+        if price_before_discounts_incl_tax is None:
+            price_before_discounts_incl_tax = (
+                unit_price_incl_tax or Decimal(0)
+            ) * quantity
+        if price_before_discounts_excl_tax is None:
+            price_before_discounts_excl_tax = (
+                unit_price_excl_tax or Decimal(0)
+            ) * quantity
+        return price_before_discounts_incl_tax, price_before_discounts_excl_tax
+
+
+class StatusChangeToModel(ModelMapping):
+    """Mapping from an order status change resource to a model."""
+
+    from_obj = StatusChangeResource
+    to_obj = OrderStatusChangeModel
+
+
+class NoteToModel(ModelMapping):
+    """Mapping from an order note resource to a model."""
+
+    from_obj = NoteResource
+    to_obj = OrderNoteModel
+
+    @odin.map_field
+    def note_type(self, value) -> str:
+        """Map note type."""
+        return value.value if value else ""
+
+
+class OrderToModel(ModelMapping):
+    """Mapping from an order resource to a model."""
+
+    from_obj = OrderResource
+    to_obj = OrderModel
+    exclude_fields = ["user"]
+
+    @odin.map_field(from_field=["user", "email"], to_field=["user", "guest_email"])
+    def user(self, user, email) -> Tuple[Optional[UserModel], str]:
+        """Users are linked by email when the orders are saved, they are not created."""
+        if user is None:
+            return None, email
+        return UserModel(email=user.email or email), ""
+
+    @odin.map_field
+    def billing_address(self, value) -> Optional[BillingAddressModel]:
+        """Map billing address."""
+        if value:
+            return BillingAddressToModel.apply(value, context=self.context)
+        return None
+
+    @odin.map_field
+    def shipping_address(self, value) -> Optional[ShippingAddressModel]:
+        """Map shipping address."""
+        if value:
+            return ShippingAddressToModel.apply(value, context=self.context)
+        return None
+
+    @odin.map_list_field
+    def lines(self, values) -> List[LineModel]:
+        """Map order lines, the context keeps their prices and attributes."""
+        return LineToModel.apply(values, context=self.context)
+
+    @odin.map_list_field
+    def notes(self, values) -> List[OrderNoteModel]:
+        """Map order notes."""
+        return NoteToModel.apply(values)
+
+    @odin.map_list_field
+    def status_changes(self, values) -> List[OrderStatusChangeModel]:
+        """Map order status changes."""
+        return StatusChangeToModel.apply(values)
+
+    @odin.map_list_field
+    def discounts(self, values) -> List[OrderDiscountModel]:
+        """Map order discounts."""
+        return DiscountToModel.apply(values)
+
+    @odin.map_list_field
+    def surcharges(self, values) -> List[SurchargeModel]:
+        """Map order surcharges."""
+        return SurchargeToModel.apply(values)
+
+    @odin.map_list_field
+    def shipping_events(self, values) -> List[ShippingEventModel]:
+        """Map shipping events, the context keeps their event types."""
+        return ShippingEventToModel.apply(values, context=self.context)
+
+    @odin.map_list_field
+    def payment_events(self, values) -> List[PaymentEventModel]:
+        """Map payment events, the context keeps their event types."""
+        return PaymentEventToModel.apply(values, context=self.context)
+
+
+def orders_to_db(
+    orders,
+    fields_to_update=constants.ALL_ORDER_IMPORT_FIELDS,
+    identifier_mapping=constants.ORDER_IDENTIFIERS_MAPPING,
+    order_mapper=OrderToModel,
+    clean_instances=True,
+    skip_invalid_resources=False,
+    chunk_size=RESOURCES_TO_DB_CHUNK_SIZE,
+) -> Tuple[QuerySet, List]:
+    """Map multiple orders to models and store them in the database, eg. to import
+    the order history of another platform.
+
+    Every chunk of orders is saved with a fixed number of bulk queries. Orders are
+    identified by their number, the addresses of orders that exist already are
+    updated and their lines, discounts, notes, status changes, surcharges and events
+    are replaced. Users are linked by email, orders of unknown users are saved as
+    guest orders. Lines are linked to their products and stockrecords by id, or by
+    upc and partner sku when the id is unknown. Relations that are not found are
+    left empty and reported in the errors.
+
+    :param orders: The order resources to save.
+    :param fields_to_update: The fields that are updated on existing orders and
+        addresses, and the related models that are replaced.
+    :param identifier_mapping: The fields that identify the orders and event types.
+    :param order_mapper: The mapping to use for the orders.
+    :param clean_instances: Validate the instances before saving them.
+    :param skip_invalid_resources: Save the valid orders when some are invalid.
+    :param chunk_size: The number of orders that are saved at once.
+    :return: The saved orders and the errors.
+    """
+    return resources_to_db(
+        orders,
+        fields_to_update,
+        identifier_mapping,
+        model_mapper=order_mapper,
+        context_mapper=OrderModelMapperContext,
+        clean_instances=clean_instances,
+        skip_invalid_resources=skip_invalid_resources,
+        chunk_size=chunk_size,
+    )
+
+
+def save_order_statuses(statuses: List[OrderStatusResource], errors: ErrorLog):
+    """Save a chunk of order statuses, returns the pks of the orders that changed."""
+    orders = {
+        number: (pk, status)
+        for pk, number, status in OrderModel.objects.filter(
+            number__in=[resource.number for resource in statuses]
+        ).values_list("pk", "number", "status")
+    }
+
+    # Only the lines of orders that cascade their status, or that have new line
+    # statuses, are needed.
+    line_order_pks = [
+        orders[resource.number][0]
+        for resource in statuses
+        if resource.number in orders
+        and (resource.lines or resource.status in OrderModel.cascade)
+    ]
+    lines = defaultdict(dict)
+    if line_order_pks:
+        for pk, order_id, status in LineModel.objects.filter(
+            order_id__in=line_order_pks
+        ).values_list("pk", "order_id", "status"):
+            lines[order_id][pk] = status
+
+    # The statuses are tracked as they change, an order can occur more than once
+    order_statuses = {}
+    line_statuses = {}
+    status_changes = []
+    changed_order_pks = set()
+    for resource in statuses:
+        if resource.number not in orders:
+            errors.add_error(
+                OrderModel.DoesNotExist(f"Order {resource.number} does not exist"),
+                resource,
+            )
+            continue
+
+        order_pk, old_status = orders[resource.number]
+        order_lines = lines[order_pk]
+        if resource.status != old_status:
+            if resource.status not in OrderModel.pipeline.get(old_status, ()):
+                errors.add_error(
+                    InvalidOrderStatus(
+                        f"'{resource.status}' is not a valid status for order "
+                        f"{resource.number} (current status: '{old_status}')"
+                    ),
+                    resource,
+                )
+                continue
+
+            orders[resource.number] = (order_pk, resource.status)
+            order_statuses[order_pk] = resource.status
+            status_changes.append(
+                OrderStatusChangeModel(
+                    order_id=order_pk, old_status=old_status, new_status=resource.status
+                )
+            )
+            changed_order_pks.add(order_pk)
+
+            # The line statuses of the resource take precedence over the cascaded status
+            line_status = OrderModel.cascade.get(resource.status)
+            resource_line_pks = {line.line_id for line in resource.lines}
+            if line_status is not None:
+                for line_pk, old_line_status in order_lines.items():
+                    if line_pk not in resource_line_pks and line_status in (
+                        LineModel.pipeline.get(old_line_status, ())
+                    ):
+                        order_lines[line_pk] = line_statuses[line_pk] = line_status
+
+        for line in resource.lines:
+            old_line_status = order_lines.get(line.line_id)
+            if old_line_status is None:
+                errors.add_error(
+                    LineModel.DoesNotExist(
+                        f"Line {line.line_id} of order {resource.number} does not exist"
+                    ),
+                    resource,
+                )
+            elif line.status in LineModel.pipeline.get(old_line_status, ()):
+                order_lines[line.line_id] = line_statuses[line.line_id] = line.status
+                changed_order_pks.add(order_pk)
+            elif line.status != old_line_status:
+                errors.add_error(
+                    InvalidLineStatus(
+                        f"'{line.status}' is not a valid status for line {line.line_id} "
+                        f"(current status: '{old_line_status}')"
+                    ),
+                    resource,
+                )
+
+    order_pks_per_status = defaultdict(list)
+    for order_pk, status in order_statuses.items():
+        order_pks_per_status[status].append(order_pk)
+    for status, pks in order_pks_per_status.items():
+        OrderModel.objects.filter(pk__in=pks).update(status=status)
+
+    line_pks_per_status = defaultdict(list)
+    for line_pk, status in line_statuses.items():
+        line_pks_per_status[status].append(line_pk)
+    for status, pks in line_pks_per_status.items():
+        LineModel.objects.filter(pk__in=pks).update(status=status)
+
+    OrderStatusChangeModel.objects.bulk_create(status_changes)
+
+    return changed_order_pks
+
+
+def order_statuses_to_db(
+    statuses: List[OrderStatusResource],
+    chunk_size: int = RESOURCES_TO_DB_CHUNK_SIZE,
+) -> Tuple[QuerySet, List]:
+    """Set the statuses of many orders, and of their lines, at once.
+
+    The rules of ``Order.set_status`` and ``Line.set_status`` apply: every transition
+    must be allowed by the status pipeline and the order status cascades to the
+    lines. Every chunk is saved in its own transaction, with one UPDATE per distinct
+    status and one bulk insert of the status changes. Unlike ``set_status`` no
+    signals are sent.
+
+    Unknown orders or lines and invalid transitions are returned as errors, the
+    other statuses are saved.
+
+    :param statuses: The new statuses of the orders and lines.
+    :param chunk_size: The number of orders that are updated at once.
+    """
+    valid_statuses, validation_errors = validate_resources(statuses, ("number",))
+    errors = ErrorLog(identifiers=("number",))
+    errors.extend(validation_errors)
+
+    changed_order_pks = set()
+    for chunk in chunked(valid_statuses, chunk_size):
+        with transaction.atomic():
+            changed_order_pks.update(save_order_statuses(chunk, errors))
+
+    return OrderModel.objects.filter(pk__in=changed_order_pks), errors
@@ -16,6 +16,7 @@ StockRecord = get_model("partner", "StockRecord")
 class PartnerModelToResource(OscarBaseMapping):
     from_obj = Partner
     to_obj = PartnerResource
+    intern_resources = True
 
 
 class PartnerToModel(ModelMapping):
@@ -29,7 +30,7 @@ class StockRecordModelToResource(OscarBaseMapping):
 
     @odin.map_field
     def partner(self, partner):
-        return PartnerModelToResource.apply(partner)
+        return PartnerModelToResource.apply(partner, context=self.context)
 
 
 class StockRecordToModel(ModelMapping):
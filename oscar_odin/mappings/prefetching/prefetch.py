@@ -1,16 +1,33 @@
-from django.db.models import Prefetch
+from typing import Iterable, Optional
+
+from django.db.models import Prefetch, QuerySet
 
 from oscar.core.loading import get_class, get_model
 
-from .registry import prefetch_registry
+from .registry import (
+    DEFAULT_PROFILE,
+    EXPORT_PROFILE,
+    PrefetchType,
+    order_prefetch_registry,
+    prefetch_registry,
+)
 
 ProductQuerySet = get_class("catalogue.managers", "ProductQuerySet")
 
 ProductModel = get_model("catalogue", "Product")
+ShippingEventModel = get_model("order", "ShippingEvent")
+PaymentEventModel = get_model("order", "PaymentEvent")
+
+# The resource fields that are mapped from the stock price resolved by the strategy
+STOCK_PRICE_FIELDS = ("price", "currency", "availability", "is_available_to_buy")
 
 
 def prefetch_product_queryset(
-    queryset: ProductQuerySet, include_children: bool = False, **kwargs
+    queryset: ProductQuerySet,
+    include_children: bool = False,
+    prefetch_profile: Optional[str] = None,
+    fields: Optional[Iterable[str]] = None,
+    **kwargs,
 ) -> ProductQuerySet:
     """
     Optimize the product queryset with registered select_related and prefetch_related operations.
@@ -18,53 +35,118 @@ def prefetch_product_queryset(
     Args:
         queryset (ProductQuerySet): The initial queryset to optimize.
         include_children (bool): Whether to include prefetches for children.
+        prefetch_profile (Optional[str]): The name of the profile to apply, defaults to the
+            default profile.
+        fields (Optional[Iterable[str]]): Only apply the operations that are needed for these
+            resource fields, defaults to all operations.
 
     Returns:
         ProductQuerySet: The optimized queryset.
     """
     callable_kwargs = {"include_children": include_children, **kwargs}
 
-    select_related_fields = prefetch_registry.get_select_related()
-    queryset = queryset.select_related(*select_related_fields)
+    registry = prefetch_registry
+    if prefetch_profile not in (None, DEFAULT_PROFILE):
+        registry = prefetch_registry.get_profile(prefetch_profile)
 
-    prefetches = prefetch_registry.get_prefetches()
-    for prefetch in prefetches.values():
-        if isinstance(prefetch, (str, Prefetch)):
-            queryset = queryset.prefetch_related(prefetch)
-        elif callable(prefetch):
-            queryset = prefetch(queryset, **callable_kwargs)
+    select_related_fields = registry.get_select_related(fields)
+    # select_related() without lookups would select all non-null relations instead
+    if select_related_fields:
+        queryset = queryset.select_related(*select_related_fields)
+
+    prefetches = registry.get_prefetches(fields)
+    queryset = apply_prefetches(queryset, prefetches.values(), **callable_kwargs)
 
     if include_children:
-        children_prefetches = prefetch_registry.get_children_prefetches()
-        for prefetch in children_prefetches.values():
-            if isinstance(prefetch, (str, Prefetch)):
-                queryset = queryset.prefetch_related(prefetch)
-            elif callable(prefetch):
-                queryset = prefetch(queryset, **callable_kwargs)
+        children_prefetches = registry.get_children_prefetches(fields)
+        queryset = apply_prefetches(
+            queryset, children_prefetches.values(), **callable_kwargs
+        )
+
+    return queryset
+
+
+def prefetch_order_queryset(
+    queryset: QuerySet,
+    prefetch_profile: Optional[str] = None,
+    fields: Optional[Iterable[str]] = None,
+    **kwargs,
+) -> QuerySet:
+    """
+    Optimize the order queryset with the operations registered on the order_prefetch_registry.
+
+    Args:
+        queryset (QuerySet): The initial queryset to optimize.
+        prefetch_profile (Optional[str]): The name of the profile to apply, defaults to the
+            default profile.
+        fields (Optional[Iterable[str]]): Only apply the operations that are needed for these
+            resource fields, defaults to all operations.
+
+    Returns:
+        QuerySet: The optimized queryset.
+    """
+    registry = order_prefetch_registry
+    if prefetch_profile not in (None, DEFAULT_PROFILE):
+        registry = order_prefetch_registry.get_profile(prefetch_profile)
+
+    select_related = registry.get_select_related(fields)
+    # select_related() without lookups would select all non-null relations instead
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    return apply_prefetches(
+        queryset, registry.get_prefetches(fields).values(), **kwargs
+    )
+
+
+def apply_prefetches(
+    queryset: QuerySet, prefetches: Iterable[PrefetchType], **kwargs
+) -> QuerySet:
+    """
+    Apply prefetch_related operations to a queryset.
+
+    Args:
+        queryset (QuerySet): The queryset to apply the prefetches to.
+        prefetches (Iterable[PrefetchType]): Strings, Prefetch objects or methods that are
+            called with the queryset and the keyword arguments.
 
+    Returns:
+        QuerySet: The queryset with the prefetches applied.
+    """
+    for prefetch in prefetches:
+        if isinstance(prefetch, (str, Prefetch)):
+            queryset = queryset.prefetch_related(prefetch)
+        elif callable(prefetch):
+            queryset = prefetch(queryset, **kwargs)
     return queryset
 
 
 def register_default_prefetches():
+    # The parent is used by most fields of child products, eg. get_title
+    prefetch_registry.register_select_related("parent")
+
     # ProductToResource.product_class -> get_product_class
-    prefetch_registry.register_select_related(["product_class", "parent"])
+    prefetch_registry.register_select_related("product_class", fields=["product_class"])
 
     # ProductToResource.images -> get_all_images
-    prefetch_registry.register_prefetch("images")
+    prefetch_registry.register_prefetch("images", fields=["images"])
 
     # ProducToResource.map_stock_price -> fetch_for_product
-    prefetch_registry.register_prefetch("stockrecords")
+    prefetch_registry.register_prefetch(
+        "stockrecords", fields=["stockrecords", *STOCK_PRICE_FIELDS]
+    )
 
     # This gets prefetches somewhere (.categories.all()), it's not in get_categories as that does
     # .browsable() and that's where the prefetch_browsable_categories is for. But if we remove this,
     # the amount of queries will be more again. ToDo: Figure out where this is used and document it.
-    prefetch_registry.register_prefetch("categories")
+    prefetch_registry.register_prefetch("categories", fields=["categories"])
 
     # The parent and its related fields are prefetched in numerous places in the resource.
     # ProductToResource.product_class -> get_product_class (takes parent product_class if itself has no product_class)
     # ProductToResource.images -> get_all_images (takes parent images if itself has no images)
-    prefetch_registry.register_prefetch("parent__product_class")
-    prefetch_registry.register_prefetch("parent__images")
+    prefetch_registry.register_prefetch(
+        "parent__product_class", fields=["product_class"]
+    )
+    prefetch_registry.register_prefetch("parent__images", fields=["images"])
 
     # ProducToResource.attributes -> get_attribute_values
     def prefetch_attribute_values(queryset: ProductQuerySet, **kwargs):
@@ -72,14 +154,18 @@ def register_default_prefetches():
             include_parent_children_attributes=kwargs.get("include_children", False)
         )
 
-    prefetch_registry.register_prefetch(prefetch_attribute_values)
+    prefetch_registry.register_prefetch(
+        prefetch_attribute_values, fields=["attributes"]
+    )
 
     # ProductToResource.categories -> get_categories
     # ProductToResource.categories -> get_categories -> looks up the parent categories if child
     def prefetch_browsable_categories(queryset: ProductQuerySet, **kwargs):
         return queryset.prefetch_browsable_categories()
 
-    prefetch_registry.register_prefetch(prefetch_browsable_categories)
+    prefetch_registry.register_prefetch(
+        prefetch_browsable_categories, fields=["categories"]
+    )
 
     # ProductToResource.map_stock_price -> fetch_for_parent -> product.children.public() -> stockrecords
     def prefetch_public_children_stockrecords(queryset: ProductQuerySet, **kwargs):
@@ -87,8 +173,67 @@ def register_default_prefetches():
             queryset=ProductModel.objects.public().prefetch_related("stockrecords")
         )
 
-    prefetch_registry.register_prefetch(prefetch_public_children_stockrecords)
+    prefetch_registry.register_prefetch(
+        prefetch_public_children_stockrecords, fields=STOCK_PRICE_FIELDS
+    )
 
     # Register children prefetches
-    prefetch_registry.register_children_prefetch("children__images")
-    prefetch_registry.register_children_prefetch("children__stockrecords")
+    prefetch_registry.register_children_prefetch("children__images", fields=["images"])
+    prefetch_registry.register_children_prefetch(
+        "children__stockrecords", fields=["stockrecords", *STOCK_PRICE_FIELDS]
+    )
+
+    # The exported resources also contain the relations that are not mapped by default
+    export_profile = prefetch_registry.register_profile(EXPORT_PROFILE)
+
+    # ProductToExportResource.stockrecords -> StockRecordModelToResource.partner
+    export_profile.register_prefetch("stockrecords__partner", fields=["stockrecords"])
+    export_profile.register_children_prefetch(
+        "children__stockrecords__partner", fields=["stockrecords"]
+    )
+
+    # ProductToExportResource.recommended_products
+    export_profile.register_prefetch(
+        "recommended_products", fields=["recommended_products"]
+    )
+    export_profile.register_children_prefetch(
+        "children__recommended_products", fields=["recommended_products"]
+    )
+
+
+def register_default_order_prefetches():
+    # The user and addresses are selected with the select_related lookups that
+    # OrderToResource declares.
+
+    # OrderToResource.lines -> LineToResource.prices, attributes
+    order_prefetch_registry.register_prefetch("lines__prices", fields=["lines"])
+    order_prefetch_registry.register_prefetch("lines__attributes", fields=["lines"])
+
+    # OrderToResource.discounts -> DiscountToResource.discount_lines_per_tax_code
+    # The discount lines reuse the line resources of the order, so the prices and
+    # attributes of their lines are not needed.
+    order_prefetch_registry.register_prefetch(
+        "discounts__discount_lines__line", fields=["discounts"]
+    )
+
+    order_prefetch_registry.register_prefetch("notes", fields=["notes"])
+    order_prefetch_registry.register_prefetch(
+        "status_changes", fields=["status_changes"]
+    )
+    order_prefetch_registry.register_prefetch("surcharges", fields=["surcharges"])
+
+    # ShippingEventResource.event_type, PaymentEventResource.event_type
+    order_prefetch_registry.register_prefetch(
+        Prefetch(
+            "shipping_events",
+            queryset=ShippingEventModel.objects.select_related("event_type"),
+        ),
+        fields=["shipping_events"],
+    )
+    order_prefetch_registry.register_prefetch(
+        Prefetch(
+            "payment_events",
+            queryset=PaymentEventModel.objects.select_related("event_type"),
+        ),
+        fields=["payment_events"],
+    )
@@ -1,4 +1,4 @@
-from typing import Dict, Any, Union, Callable, List, Set
+from typing import Dict, Any, FrozenSet, Iterable, Optional, Union, Callable, List, Set
 
 from django.db.models import Prefetch
 
@@ -11,6 +11,10 @@ PrefetchType = Union[
 ]
 SelectRelatedType = Union[str, List[str]]
 
+DEFAULT_PROFILE = "default"
+# The profile of the mapping that exports products, see ProductToExportResource
+EXPORT_PROFILE = "export"
+
 
 class PrefetchRegistry:
     """
@@ -25,44 +29,129 @@ class PrefetchRegistry:
     You can also unregister default ones, and replace them with your own. For example when your way of
     getting stockrecords does a different query, it's better to unregister the default one and register your own.
     This way, you're also not doing a useless query.
+
+    Mappers that only use a few fields of the product can select a named profile, so they
+    don't pay for prefetches they never use. A profile is a registry of its own, that
+    either starts empty or inherits the operations of another profile:
+
+        listing = prefetch_registry.register_profile("listing", inherits=None)
+        listing.register_select_related("product_class")
+        listing.register_prefetch("stockrecords")
+
+        product_queryset_to_resources(queryset, prefetch_profile="listing")
+
+    The registry itself is the default profile.
+
+    Operations can be registered with the resource fields they are needed for. When only
+    some fields are requested, eg. ``product_queryset_to_resources(queryset, fields=["title"])``,
+    the operations for other fields are skipped. Operations without fields always run.
     """
 
-    def __init__(self):
+    def __init__(self, name: str = DEFAULT_PROFILE, parent: "PrefetchRegistry" = None):
+        self.name = name
+        self.parent = parent
         self.prefetches: Dict[str, PrefetchType] = {}
         self.children_prefetches: Dict[str, PrefetchType] = {}
         self.select_related: Set[str] = set()
 
-    def register_prefetch(self, prefetch: PrefetchType):
+        # The resource fields that operations are needed for, by key
+        self.prefetch_fields: Dict[str, FrozenSet[str]] = {}
+        self.children_prefetch_fields: Dict[str, FrozenSet[str]] = {}
+        self.select_related_fields: Dict[str, FrozenSet[str]] = {}
+
+        # Inherited operations that were unregistered from this profile
+        self.excluded_prefetches: Set[str] = set()
+        self.excluded_children_prefetches: Set[str] = set()
+        self.excluded_select_related: Set[str] = set()
+
+        # All profiles are shared with the registry the profile was registered on
+        self.profiles: Dict[str, PrefetchRegistry] = {name: self}
+
+    def register_profile(
+        self, name: str, inherits: Optional[str] = DEFAULT_PROFILE
+    ) -> "PrefetchRegistry":
+        """
+        Register a named profile, or return it when it is already registered.
+
+        Args:
+            name (str): The name of the profile.
+            inherits (Optional[str]): The profile to inherit the operations from, or None
+                to start with an empty profile. Operations that are registered on the
+                inherited profile later on are inherited as well.
+
+        Returns:
+            PrefetchRegistry: The profile to register the operations on.
+        """
+        if name in self.profiles:
+            return self.profiles[name]
+
+        parent = self.get_profile(inherits) if inherits is not None else None
+        profile = PrefetchRegistry(name, parent=parent)
+        profile.profiles = self.profiles
+        self.profiles[name] = profile
+        return profile
+
+    def get_profile(self, name: str) -> "PrefetchRegistry":
+        """
+        Get a registered profile.
+
+        Args:
+            name (str): The name of the profile.
+
+        Returns:
+            PrefetchRegistry: The profile.
+        """
+        try:
+            return self.profiles[name]
+        except KeyError:
+            raise ValueError(f"Unknown prefetch profile: {name}") from None
+
+    def register_prefetch(
+        self, prefetch: PrefetchType, fields: Optional[Iterable[str]] = None
+    ):
         """
         Register a prefetch_related operation.
 
         Args:
             prefetch (PrefetchType): The prefetch to register. Can be a string, Prefetch object, or a method.
+            fields (Optional[Iterable[str]]): The resource fields the prefetch is needed for.
         """
         key = self._get_key(prefetch)
         self.prefetches[key] = prefetch
+        self._set_fields(self.prefetch_fields, key, fields)
+        self.excluded_prefetches.discard(key)
 
-    def register_children_prefetch(self, prefetch: PrefetchType):
+    def register_children_prefetch(
+        self, prefetch: PrefetchType, fields: Optional[Iterable[str]] = None
+    ):
         """
         Register a children prefetch_related operation. Children as is, the children of a parent.
 
         Args:
             prefetch (PrefetchType): The child prefetch to register. Can be a string, Prefetch object, or a method.
+            fields (Optional[Iterable[str]]): The resource fields the prefetch is needed for.
         """
         key = self._get_key(prefetch)
         self.children_prefetches[key] = prefetch
+        self._set_fields(self.children_prefetch_fields, key, fields)
+        self.excluded_children_prefetches.discard(key)
 
-    def register_select_related(self, select: SelectRelatedType):
+    def register_select_related(
+        self, select: SelectRelatedType, fields: Optional[Iterable[str]] = None
+    ):
         """
         Register a select_related operation.
 
         Args:
             select (SelectRelatedType): The select_related to register. Can be a string or a list of strings.
+            fields (Optional[Iterable[str]]): The resource fields the select_related is needed for.
         """
         if isinstance(select, str):
-            self.select_related.add(select)
-        elif isinstance(select, list):
-            self.select_related.update(select)
+            select = [select]
+        self.select_related.update(select)
+        for key in select:
+            self._set_fields(self.select_related_fields, key, fields)
+        self.excluded_select_related.difference_update(select)
 
     def unregister_prefetch(self, prefetch: Union[str, Callable]):
         """
@@ -73,6 +162,9 @@ class PrefetchRegistry:
         """
         key = self._get_key(prefetch)
         self.prefetches.pop(key, None)
+        self.prefetch_fields.pop(key, None)
+        if self.parent is not None:
+            self.excluded_prefetches.add(key)
 
     def unregister_children_prefetch(self, prefetch: Union[str, Callable]):
         """
@@ -83,6 +175,9 @@ class PrefetchRegistry:
         """
         key = self._get_key(prefetch)
         self.children_prefetches.pop(key, None)
+        self.children_prefetch_fields.pop(key, None)
+        if self.parent is not None:
+            self.excluded_children_prefetches.add(key)
 
     def unregister_select_related(self, select: str):
         """
@@ -92,33 +187,116 @@ class PrefetchRegistry:
             select (str): The select_related to remove.
         """
         self.select_related.discard(select)
+        self.select_related_fields.pop(select, None)
+        if self.parent is not None:
+            self.excluded_select_related.add(select)
 
-    def get_prefetches(self) -> Dict[str, PrefetchType]:
+    def get_prefetches(
+        self, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, PrefetchType]:
         """
         Get all registered prefetch_related operations.
 
+        Args:
+            fields (Optional[Iterable[str]]): Only get the prefetches needed for these resource fields.
+
         Returns:
             Dict[str, PrefetchType]: A dictionary of prefetch keys to their prefetch.
         """
-        return self.prefetches
-
-    def get_children_prefetches(self) -> Dict[str, PrefetchType]:
+        prefetches = self._filter(self.prefetches, self.prefetch_fields, fields)
+        if self.parent is None:
+            return prefetches
+        return self._inherit(
+            self.parent.get_prefetches(fields),
+            prefetches,
+            self.excluded_prefetches | self.prefetches.keys(),
+        )
+
+    def get_children_prefetches(
+        self, fields: Optional[Iterable[str]] = None
+    ) -> Dict[str, PrefetchType]:
         """
         Get all registered children-specific prefetch_related operations. Children as is, the children of a parent.
 
+        Args:
+            fields (Optional[Iterable[str]]): Only get the prefetches needed for these resource fields.
+
         Returns:
             Dict[str, PrefetchType]: A dictionary of child prefetch keys to their prefetch.
         """
-        return self.children_prefetches
-
-    def get_select_related(self) -> List[str]:
+        prefetches = self._filter(
+            self.children_prefetches, self.children_prefetch_fields, fields
+        )
+        if self.parent is None:
+            return prefetches
+        return self._inherit(
+            self.parent.get_children_prefetches(fields),
+            prefetches,
+            self.excluded_children_prefetches | self.children_prefetches.keys(),
+        )
+
+    def get_select_related(self, fields: Optional[Iterable[str]] = None) -> List[str]:
         """
         Get all registered select_related operations.
 
+        Args:
+            fields (Optional[Iterable[str]]): Only get the select_related needed for these resource fields.
+
         Returns:
             List[str]: A list of select_related fields.
         """
-        return list(self.select_related)
+        select_related = set(
+            self._filter(
+                dict.fromkeys(self.select_related), self.select_related_fields, fields
+            )
+        )
+        if self.parent is None:
+            return list(select_related)
+        inherited = (
+            set(self.parent.get_select_related(fields))
+            - self.excluded_select_related
+            - self.select_related
+        )
+        return list(inherited | select_related)
+
+    @staticmethod
+    def _set_fields(
+        operation_fields: Dict[str, FrozenSet[str]],
+        key: str,
+        fields: Optional[Iterable[str]],
+    ):
+        if fields is None:
+            operation_fields.pop(key, None)
+        else:
+            operation_fields[key] = frozenset(fields)
+
+    @staticmethod
+    def _filter(
+        operations: Dict[str, Any],
+        operation_fields: Dict[str, FrozenSet[str]],
+        fields: Optional[Iterable[str]],
+    ) -> Dict[str, Any]:
+        if fields is None or not operation_fields:
+            return operations
+        fields = frozenset(fields)
+        return {
+            key: operation
+            for key, operation in operations.items()
+            if key not in operation_fields
+            or not operation_fields[key].isdisjoint(fields)
+        }
+
+    @staticmethod
+    def _inherit(
+        inherited: Dict[str, PrefetchType],
+        own: Dict[str, PrefetchType],
+        excluded: Set[str],
+    ) -> Dict[str, PrefetchType]:
+        prefetches = {
+            key: prefetch for key, prefetch in inherited.items() if key not in excluded
+        }
+        prefetches.update(own)
+        return prefetches
 
     def _get_key(self, operation: Union[PrefetchType, SelectRelatedType]) -> str:
         """
@@ -141,3 +319,6 @@ class PrefetchRegistry:
 
 
 prefetch_registry = PrefetchRegistry()
+
+# The prefetches for the order_queryset_to_resources method
+order_prefetch_registry = PrefetchRegistry()
@@ -1,3 +1,5 @@
+from collections import Counter
+
 from oscar.core.loading import get_class
 
 from ..settings import RESOURCES_TO_DB_CHUNK_SIZE
@@ -19,12 +21,19 @@ def resources_to_db(
     skip_invalid_resources=False,
     error_identifiers=None,
     chunk_size=RESOURCES_TO_DB_CHUNK_SIZE,
+    upsert=False,
+    counts=None,
 ):
     """Map mulitple resources to a model and store them in the database.
 
     The method will first bulk update or create the foreign keys
     After that all the resources will be bulk saved.
     At last all related models can will be saved and set on the record.
+
+    With ``upsert`` the rows of models that have a unique constraint on their
+    identifiers are created and updated with a single INSERT ... ON CONFLICT DO
+    UPDATE, on databases that support it. The number of created and updated rows
+    per model are added to ``counts``, when given.
     """
     error_identifiers = error_identifiers or identifier_mapping.get(model_mapper.to_obj)
     valid_resources, resource_errors = validate_resources(resources, error_identifiers)
@@ -39,6 +48,7 @@ def resources_to_db(
             model_mapper.to_obj,
             delete_related=delete_related,
             error_identifiers=error_identifiers,
+            upsert=upsert,
         )
 
         if extra_context:
@@ -64,5 +74,9 @@ def resources_to_db(
 
         errors.extend(chunk_errors)
 
+        if counts is not None:
+            for Model, model_counts in context.counts.items():
+                counts.setdefault(Model, Counter()).update(model_counts)
+
     saved_resources = model_mapper.to_obj.objects.filter(pk__in=saved_resources_pks)
     return saved_resources, resource_errors + errors
@@ -0,0 +1,181 @@
+"""Load model instances into PostgreSQL with COPY.
+
+The rows are copied into a temporary staging table, which is not written to the
+WAL, and merged into the table of the model with a single statement. That avoids
+the overhead of the large parameterized statements of bulk_create and bulk_update.
+"""
+import io
+import json
+from uuid import uuid4
+
+from django.db import connections, transaction
+from django.db.models import JSONField
+
+__all__ = ("copy_insert", "copy_update", "format_copy_value")
+
+
+def format_copy_value(value) -> str:
+    """Format a value prepared for the database for the text format of COPY."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def get_db_value(connection, field, instance, add):
+    if add:
+        value = field.pre_save(instance, add)
+    else:
+        value = getattr(instance, field.attname)
+    if isinstance(field, JSONField):
+        return None if value is None else json.dumps(value, cls=field.encoder)
+    return field.get_db_prep_save(value, connection)
+
+
+def copy_rows(cursor, table, columns, rows):
+    data = io.StringIO()
+    for row in rows:
+        data.write("\t".join(format_copy_value(value) for value in row))
+        data.write("\n")
+
+    sql = "COPY %s (%s) FROM STDIN" % (table, ", ".join(columns))
+    if hasattr(cursor, "copy_expert"):
+        # psycopg2
+        data.seek(0)
+        cursor.copy_expert(sql, data)
+    else:
+        # psycopg 3
+        with cursor.copy(sql) as copy:
+            copy.write(data.getvalue())
+
+
+def copy_to_staging_table(connection, cursor, Model, fields, rows):
+    """
+    Copy the rows into a new temporary table with the columns of the fields.
+    Returns the name of the table.
+    """
+    quote_name = connection.ops.quote_name
+    staging_table = quote_name("odin_staging_%s" % uuid4().hex)
+    columns = [quote_name(field.column) for field in fields]
+    cursor.execute(
+        "CREATE TEMPORARY TABLE %s AS SELECT %s FROM %s WITH NO DATA"
+        % (
+            staging_table,
+            ", ".join(columns),
+            # pylint: disable=protected-access
+            quote_name(Model._meta.db_table),
+        )
+    )
+    copy_rows(cursor, staging_table, columns, rows)
+    return staging_table
+
+
+def get_pks_from_sequence(connection, cursor, Model, count):
+    """
+    Take primary keys for new rows from the sequence of the table, so the rows can
+    be copied with their primary keys.
+    """
+    # pylint: disable=protected-access
+    meta = Model._meta
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+        [connection.ops.quote_name(meta.db_table), meta.pk.column, count],
+    )
+    return [pk for (pk,) in cursor.fetchall()]
+
+
+def copy_insert(Model, instances, using="default"):
+    """
+    Insert new instances, like bulk_create does, and set their primary keys.
+
+    The primary keys are only set on the instances once the rows are inserted, so
+    instances keep their primary key of None when the insert fails.
+    """
+    if not instances:
+        return
+
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    # pylint: disable=protected-access
+    meta = Model._meta
+    fields = meta.concrete_fields
+    columns = ", ".join(quote_name(field.column) for field in fields)
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        if meta.auto_field is not None:
+            pks = get_pks_from_sequence(connection, cursor, Model, len(instances))
+        else:
+            pks = [instance.pk for instance in instances]
+
+        rows = []
+        for instance, pk in zip(instances, pks):
+            instance._prepare_related_fields_for_save(operation_name="bulk_create")
+            rows.append(
+                [
+                    # The instance keeps its empty pk until the insert succeeded
+                    pk
+                    if field is meta.auto_field
+                    else get_db_value(connection, field, instance, True)
+                    for field in fields
+                ]
+            )
+
+        staging_table = copy_to_staging_table(connection, cursor, Model, fields, rows)
+        cursor.execute(
+            "INSERT INTO %s (%s) SELECT %s FROM %s"
+            % (quote_name(meta.db_table), columns, columns, staging_table)
+        )
+        cursor.execute("DROP TABLE %s" % staging_table)
+
+    for instance, pk in zip(instances, pks):
+        instance.pk = pk
+        instance._state.adding = False
+        instance._state.db = using
+
+
+def copy_update(Model, instances, fields, using="default"):
+    """
+    Update the fields of existing instances, like bulk_update does.
+    """
+    if not instances or not fields:
+        return
+
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    # pylint: disable=protected-access
+    meta = Model._meta
+    fields = [meta.pk] + [meta.get_field(name) for name in fields]
+
+    rows = []
+    for instance in instances:
+        instance._prepare_related_fields_for_save(operation_name="bulk_update")
+        rows.append(
+            [get_db_value(connection, field, instance, False) for field in fields]
+        )
+
+    table = quote_name(meta.db_table)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        staging_table = copy_to_staging_table(connection, cursor, Model, fields, rows)
+        cursor.execute(
+            "UPDATE %s SET %s FROM %s AS staging WHERE %s.%s = staging.%s"
+            % (
+                table,
+                ", ".join(
+                    "%s = staging.%s"
+                    % (quote_name(field.column), quote_name(field.column))
+                    for field in fields[1:]
+                ),
+                staging_table,
+                table,
+                quote_name(meta.pk.column),
+                quote_name(meta.pk.column),
+            )
+        )
+        cursor.execute("DROP TABLE %s" % staging_table)
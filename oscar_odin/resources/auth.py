@@ -1,4 +1,6 @@
 """Resources for Oscar categories."""
+import odin
+
 from oscar.core.loading import get_class
 
 OscarResource = get_class("oscar_odin.resources.base", "OscarResource")
@@ -16,6 +18,6 @@ class UserResource(_User):
     """User resource."""
 
     id: int
-    first_name: str
-    last_name: str
+    first_name: str = odin.Options(empty=True)
+    last_name: str = odin.Options(empty=True)
     email: str
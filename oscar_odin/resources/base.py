@@ -1,4 +1,6 @@
 """Common base resource for all Oscar resources."""
+from django.db.models.manager import BaseManager
+
 from ..inheritable import AnnotatedResource
 
 
@@ -13,6 +15,18 @@ class OscarResource(AnnotatedResource, abstract=True):
     def model_instance(self, value):
         self._model_instance = value
 
+    def __getstate__(self):
+        # The model instance is only used while mapping within the same process, don't
+        # pickle it along with its prefetched relations.
+        state = self.__dict__.copy()
+        state.pop("_model_instance", None)
+        # Relations that are not mapped, like ProductResource.stockrecords, hold the
+        # related manager of the model instance, which can't be pickled either.
+        for key, value in state.items():
+            if isinstance(value, BaseManager):
+                state[key] = None
+        return state
+
     def extra_attrs(self, attrs):
         model_instance = attrs.get("model_instance")
         if model_instance is not None:
@@ -16,6 +16,7 @@ BillingAddressResource, ShippingAddressResource = get_classes(
     ["BillingAddressResource", "ShippingAddressResource"],
 )
 UserResource = get_class("oscar_odin.resources.auth", "UserResource")
+ProductResource = get_class("oscar_odin.resources.catalogue", "ProductResource")
 
 
 class OscarOrderResource(OscarResource, abstract=True):
@@ -65,8 +66,10 @@ class LineResource(OscarOrderResource):
         empty=True,
         verbose_name="Partner notes",
     )
-    stock_record_id: int
-    product_id: int  # (expand this to full product resource)
+    stock_record_id: Optional[int]
+    product_id: int
+    # Only mapped when the products are included in the order export
+    product: Optional[ProductResource] = None
     title: str
     upc: Optional[str]
     quantity: int = 1
@@ -74,11 +77,11 @@ class LineResource(OscarOrderResource):
     prices: List[LinePriceResource]
 
     # Price information before discounts are applied
-    price_before_discounts_incl_tax: Decimal = DecimalField(
-        verbose_name="Price before discounts (inc. tax)"
+    price_before_discounts_incl_tax: Optional[Decimal] = DecimalField(
+        null=True, verbose_name="Price before discounts (inc. tax)"
     )
-    price_before_discounts_excl_tax: Decimal = DecimalField(
-        verbose_name="Price before discounts (excl. tax)"
+    price_before_discounts_excl_tax: Optional[Decimal] = DecimalField(
+        null=True, verbose_name="Price before discounts (excl. tax)"
     )
 
     # Normal site price for item (without discounts)
@@ -164,7 +167,7 @@ class DiscountResource(OscarOrderResource):
     is_shipping_discount: bool
     is_post_order_action: bool
     description: str
-    discount_lines_per_tax_code: DiscountPerTaxCodeResource
+    discount_lines_per_tax_code: List[DiscountPerTaxCodeResource]
 
 
 class SurchargeResource(OscarOrderResource):
@@ -257,3 +260,21 @@ class OrderResource(OscarOrderResource):
     surcharges: List[SurchargeResource]
     payment_events: List[PaymentEventResource]
     shipping_events: List[ShippingEventResource]
+
+
+class LineStatusResource(OscarOrderResource):
+    """A new status for a line of an order."""
+
+    line_id: int
+    status: str
+
+
+class OrderStatusResource(OscarOrderResource):
+    """A new status for an order, and optionally for its lines."""
+
+    number: str = odin.Options(
+        key=True,
+        verbose_name="Order number",
+    )
+    status: str
+    lines: List[LineStatusResource] = odin.Options(empty=True)
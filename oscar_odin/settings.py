@@ -1,3 +1,16 @@
 from django.conf import settings
 
 RESOURCES_TO_DB_CHUNK_SIZE = getattr(settings, "RESOURCES_TO_DB_CHUNK_SIZE", 500)
+QUERYSET_TO_RESOURCES_CHUNK_SIZE = getattr(
+    settings, "QUERYSET_TO_RESOURCES_CHUNK_SIZE", 500
+)
+
+PRODUCT_RESOURCE_CACHE_ENABLED = getattr(
+    settings, "PRODUCT_RESOURCE_CACHE_ENABLED", False
+)
+PRODUCT_RESOURCE_CACHE_ALIAS = getattr(
+    settings, "PRODUCT_RESOURCE_CACHE_ALIAS", "default"
+)
+PRODUCT_RESOURCE_CACHE_TIMEOUT = getattr(
+    settings, "PRODUCT_RESOURCE_CACHE_TIMEOUT", 300
+)
@@ -0,0 +1,119 @@
+"""Partner strategy helpers for mapping products in bulk."""
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from oscar.apps.partner.strategy import UseFirstStockRecord
+from oscar.core.loading import get_model
+
+__all__ = (
+    "StockPrice",
+    "purchase_info_to_stock_price",
+    "fetch_stock_prices",
+    "BatchFetchMixin",
+)
+
+ProductModel = get_model("catalogue", "Product")
+
+# price, currency, availability, is_available_to_buy
+StockPrice = Tuple[Decimal, str, int, bool]
+
+
+def purchase_info_to_stock_price(price, availability) -> StockPrice:
+    """Decompose the price and availability of a purchase info into plain values."""
+    return (
+        getattr(price, "incl_tax", Decimal(0)),
+        getattr(price, "currency", ""),
+        getattr(availability, "num_available", 0),
+        availability.is_available_to_buy,
+    )
+
+
+def fetch_stock_prices(stock_strategy, products) -> Optional[Dict[int, StockPrice]]:
+    """
+    Resolve the stock prices of a batch of products with the ``fetch_for_products``
+    method of the strategy.
+
+    Returns None when the strategy does not support fetching in batches, the stock
+    prices are then resolved per product.
+    """
+    fetch_for_products = getattr(stock_strategy, "fetch_for_products", None)
+    if fetch_for_products is None:
+        return None
+    return fetch_for_products(products)
+
+
+class BatchFetchMixin:
+    """
+    Strategy mixin for use with the ``Structured`` base strategy, that resolves the
+    stock prices for a batch of products in one pass.
+
+    Next to the hooks of the ``Structured`` strategy, this mixin adds the
+    ``select_stockrecords`` hook, which selects the stockrecords of a whole batch
+    of products at once. The public children of the parents in the batch are
+    prefetched together, and their stockrecords are selected in the same pass, so
+    the pricing and availability policies only work on stockrecords in memory.
+    """
+
+    def select_stockrecords(self, products: Iterable) -> Dict[int, Any]:
+        """
+        Select the stockrecord of every product in the batch, keyed by product pk.
+
+        When the strategy picks the first stockrecord (``UseFirstStockRecord``), the
+        stockrecords of all products are prefetched with a single query and the
+        first one is taken. Strategies that override ``select_stockrecord`` get it
+        called for every product instead, on top of the prefetched stockrecords.
+        """
+        products = list(products)
+        prefetch_related_objects(products, "stockrecords")
+
+        if type(self).select_stockrecord is not UseFirstStockRecord.select_stockrecord:
+            return {
+                product.pk: self.select_stockrecord(product) for product in products
+            }
+
+        return {
+            product.pk: next(iter(product.stockrecords.all()), None)
+            for product in products
+        }
+
+    def fetch_for_products(self, products: Iterable) -> Dict[int, StockPrice]:
+        """Resolve the stock prices of a batch of products, keyed by product pk."""
+        products = list(products)
+        parents = [product for product in products if product.is_parent]
+        prefetch_related_objects(
+            [
+                parent
+                for parent in parents
+                if not hasattr(parent, "_prefetched_public_children")
+            ],
+            Prefetch(
+                "children",
+                queryset=ProductModel.objects.public(),
+                to_attr="_prefetched_public_children",
+            ),
+        )
+
+        stockrecords = self.select_stockrecords(
+            products
+            + [child for parent in parents for child in parent.get_public_children()]
+        )
+
+        stock_prices = {}
+        for product in products:
+            if product.is_parent:
+                children_stock = [
+                    (child, stockrecords[child.pk])
+                    for child in product.get_public_children()
+                ]
+                price = self.parent_pricing_policy(product, children_stock)
+                availability = self.parent_availability_policy(product, children_stock)
+            else:
+                stockrecord = stockrecords[product.pk]
+                price = self.pricing_policy(product, stockrecord)
+                availability = self.availability_policy(product, stockrecord)
+
+            stock_prices[product.pk] = purchase_info_to_stock_price(price, availability)
+
+        return stock_prices
@@ -1,69 +1,185 @@
 from collections import defaultdict
+from contextvars import ContextVar
 from functools import reduce
-from operator import itemgetter, or_
+from operator import attrgetter, itemgetter, or_
+from typing import NamedTuple
+import base64
+import binascii
 import contextlib
+import json
+import re
 import time
-import math
 
-from django.db import connection, connections, reset_queries
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    connection,
+    connections,
+    reset_queries,
+    router,
+    transaction,
+)
 from django.db.models import Q
+from django.db.models.manager import BaseManager
 from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 
 from odin.exceptions import ValidationError
 from odin.mapping import MappingResult
 
-from .settings import RESOURCES_TO_DB_CHUNK_SIZE
+from .exceptions import NPlusOneQueryError
+from .settings import QUERYSET_TO_RESOURCES_CHUNK_SIZE, RESOURCES_TO_DB_CHUNK_SIZE
 
 
-def get_filters(instances, field_names):
-    for ui in instances:
-        klaas = {}
-        for field_name in field_names:
-            field_value = getattr(ui, field_name)
-            klaas[field_name] = field_value
+def get_lookup_filters(keys, field_names, batch_size):
+    """
+    Build the filters that look up the keys, in batches of at most ``batch_size``
+    query parameters.
 
-        yield Q(**klaas)
+    Keys of a single field are looked up with ``__in``. Composite keys are grouped by
+    all but their last field and every group is looked up with ``__in`` on the last
+    field, so there is one branch per distinct prefix (eg. per partner for
+    stockrecords) instead of one per key.
+    """
+    *prefix_names, last_name = field_names
+    groups = defaultdict(list)
+    for key in keys:
+        groups[key[:-1]].append(key[-1])
 
+    batch = Q()
+    batch_params = 0
+    for prefix, values in groups.items():
+        prefix_filter = dict(zip(prefix_names, prefix))
+        chunk_size = max(batch_size - len(prefix), 1)
+        for offset in range(0, len(values), chunk_size):
+            chunk = values[offset : offset + chunk_size]
+            if batch_params and batch_params + len(prefix) + len(chunk) > batch_size:
+                yield batch
+                batch = Q()
+                batch_params = 0
 
-def get_query(instances, field_names):
-    filters = list((get_filters(instances, field_names)))
+            # NULL never matches ``__in``
+            not_null_values = [value for value in chunk if value is not None]
+            if not_null_values:
+                batch |= Q(**prefix_filter, **{f"{last_name}__in": not_null_values})
+            if len(not_null_values) < len(chunk):
+                batch |= Q(**prefix_filter, **{f"{last_name}__isnull": True})
+            batch_params += len(prefix) + len(chunk)
 
-    query = filters.pop()
-    for query_filter in filters:
-        query = query | query_filter
+    if batch_params:
+        yield batch
 
-    return query
+
+def get_lookup_batch_size(using, field_names):
+    """
+    The number of values that are looked up per query, see get_lookup_filters.
+
+    Room is left for the values of one more key and for the parameters of other
+    filters on the queryset, eg. of the default manager.
+    """
+    max_query_params = connections[using].features.max_query_params
+    if max_query_params is not None:
+        return max(max_query_params - len(field_names) - 1, 1)
+    return getattr(settings, "ODIN_BATCH_SIZE", 500)
 
 
 def in_bulk(self, instances, field_names):
     """
-    Return a dictionary mapping each of the given IDs to the object with
-    that ID. If `id_list` isn't provided, evaluate the entire QuerySet.
+    Return a dictionary that maps the values of ``field_names`` of the instances to
+    the pk of the row with those values, for the rows that exist.
     """
+    get_key = attrgetter(*field_names)
+    keys = set()
+    for instance in instances:
+        key = get_key(instance)
+        keys.add(key if len(field_names) > 1 else (key,))
 
-    max_query_params = connections[self.db].features.max_query_params
+    object_mapping = defaultdict(tuple)
+    batch_size = get_lookup_batch_size(self.db, field_names)
+    for query in get_lookup_filters(keys, field_names, batch_size):
+        for obj in self.filter(query).order_by().values("pk", *field_names):
+            pk = obj.pop("pk")
+            object_mapping[tuple(obj.values())] = pk
 
-    if max_query_params is not None:
-        batch_size = math.floor(max_query_params / len(field_names)) - 1
-    else:
-        batch_size = getattr(settings, "ODIN_BATCH_SIZE", 500)
-
-    if batch_size and batch_size < len(instances):
-        qs = ()
-        for offset in range(0, len(instances), batch_size):
-            batch = instances[offset : offset + batch_size]
-            query = get_query(batch, field_names)
-            qs += tuple(self.filter(query).order_by().values("pk", *field_names))
+    return object_mapping
+
+
+def supports_update_from(database):
+    """Whether the database can join other rows in an UPDATE with UPDATE ... FROM."""
+    if database.vendor == "postgresql":
+        return True
+    if database.vendor == "sqlite":
+        return database.Database.sqlite_version_info >= (3, 33)
+    return False
+
+
+def bulk_update_from_values(self, instances, field_names):
+    """
+    Update the fields of the instances like ``bulk_update``, but with a single
+    UPDATE ... FROM (VALUES ...) per batch that joins the values on the primary
+    key, instead of a CASE WHEN per row and field. Databases that do not support
+    UPDATE ... FROM fall back to ``bulk_update``.
+    """
+    instances = list(instances)
+    if not instances:
+        return 0
+
+    # pylint: disable=protected-access
+    using = self._db or router.db_for_write(self.model)
+    database = connections[using]
+    if not supports_update_from(database):
+        return self.bulk_update(instances, field_names)
+
+    meta = self.model._meta
+    fields = [meta.pk] + [meta.get_field(name) for name in field_names]
+    for instance in instances:
+        if instance.pk is None:
+            raise ValueError("All bulk_update() objects must have a primary key set.")
+        instance._prepare_related_fields_for_save(
+            operation_name="bulk_update", fields=fields[1:]
+        )
+
+    quote_name = database.ops.quote_name
+    if database.vendor == "postgresql":
+        # The types of the values can't be derived from NULL or text parameters.
+        # The values are cast to the base type, without length or precision,
+        # because an explicit cast to varchar(n) silently truncates a longer value
+        # while the assignment to the column raises an error like an UPDATE does.
+        placeholders = [
+            "CAST(%%s AS %s)" % re.sub(r"\(.*?\)", "", field.cast_db_type(database))
+            for field in fields
+        ]
     else:
-        query = get_query(instances, field_names)
-        qs = self.filter(query).order_by().values("pk", *field_names)
+        placeholders = ["%s"] * len(fields)
+    row_placeholder = "(%s)" % ", ".join(placeholders)
 
-    object_mapping = defaultdict(tuple)
-    for obj in qs:
-        pk = obj.pop("pk")
-        object_mapping[tuple(obj.values())] = pk
+    # The columns of VALUES are named column1, column2 etc.
+    table = quote_name(meta.db_table)
+    sql = (
+        "UPDATE %s SET %s FROM (VALUES %%s) AS odin_values WHERE %s.%s = odin_values.column1"
+        % (
+            table,
+            ", ".join(
+                "%s = odin_values.column%s" % (quote_name(field.column), index)
+                for index, field in enumerate(fields[1:], start=2)
+            ),
+            table,
+            quote_name(meta.pk.column),
+        )
+    )
 
-    return object_mapping
+    batch_size = database.ops.bulk_batch_size(fields, instances)
+    rows_updated = 0
+    with transaction.atomic(using=using, savepoint=False):
+        with database.cursor() as cursor:
+            for batch in chunked(instances, batch_size):
+                params = [
+                    field.get_db_prep_save(getattr(instance, field.attname), database)
+                    for instance in batch
+                    for field in fields
+                ]
+                cursor.execute(sql % ", ".join([row_placeholder] * len(batch)), params)
+                rows_updated += cursor.rowcount
+    return rows_updated
 
 
 @contextlib.contextmanager
@@ -79,6 +195,98 @@ def querycounter(*labels, print_queries=False):
             print("   ", q)
 
 
+# The query detector that is active in the current context, see detect_n_plus_one
+active_query_detector = ContextVar("active_query_detector", default=None)
+
+
+class RepeatedQuery(NamedTuple):
+    """A query that was executed repeatedly while applying a single mapping rule."""
+
+    rule: str
+    count: int
+    sql: str
+
+
+def get_query_fingerprint(sql):
+    """Reduce a query to its shape, so queries that only differ in values match."""
+    sql = re.sub(r"IN \((?:%s, )*%s\)", "IN (...)", sql)
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    return re.sub(r"\b\d+\b", "?", sql)
+
+
+class QueryDetector:
+    """
+    Groups the queries that are executed while mapping by the mapping rule that
+    was applied, and the shape of the query.
+    """
+
+    def __init__(self, threshold=2):
+        self.threshold = threshold
+        self.rule_stack = []
+        self.queries = defaultdict(int)
+        self.examples = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.rule_stack:
+            key = (self.rule_stack[-1], get_query_fingerprint(sql))
+            self.queries[key] += 1
+            self.examples.setdefault(key, sql)
+        return execute(sql, params, many, context)
+
+    @contextlib.contextmanager
+    def rule(self, mapping, mapping_rule):
+        """Attribute the queries to a mapping rule while it is applied."""
+        action = mapping_rule.action
+        name = action if isinstance(action, str) else ", ".join(mapping_rule.to_field)
+        self.rule_stack.append(f"{mapping.__name__}.{name}")
+        try:
+            yield
+        finally:
+            self.rule_stack.pop()
+
+    @property
+    def repeated_queries(self):
+        return [
+            RepeatedQuery(rule, count, self.examples[(rule, fingerprint)])
+            for (rule, fingerprint), count in self.queries.items()
+            if count >= self.threshold
+        ]
+
+
+@contextlib.contextmanager
+def detect_n_plus_one(threshold=2, raise_error=True, using=DEFAULT_DB_ALIAS):
+    """
+    Detect mapping rules that execute the same query for every object they map,
+    which usually means a prefetch is missing from the prefetch registry.
+
+    Mappings are lazy, so make sure the resources are evaluated within the block::
+
+        with detect_n_plus_one():
+            list(product_queryset_to_resources(queryset))
+
+    Raises ``NPlusOneQueryError`` naming the rules and queries when a query shape is
+    repeated ``threshold`` times by the same rule. With ``raise_error=False`` the
+    repeated queries can be inspected on the yielded detector instead.
+    """
+    detector = QueryDetector(threshold)
+    token = active_query_detector.set(detector)
+    try:
+        with connections[using].execute_wrapper(detector):
+            yield detector
+    finally:
+        active_query_detector.reset(token)
+
+    repeated_queries = detector.repeated_queries
+    if raise_error and repeated_queries:
+        raise NPlusOneQueryError(
+            "Queries are repeated for every mapped object:\n"
+            + "\n".join(
+                f"{query.rule} executed {query.count} times: {query.sql}"
+                for query in repeated_queries
+            )
+        )
+
+
 class ErrorLog(list):
     def __init__(self, identifiers=None):
         self.identifiers = identifiers
@@ -130,6 +338,129 @@ def chunked(iterable, size=RESOURCES_TO_DB_CHUNK_SIZE, startindex=0):
         startindex += size
 
 
+def chunked_queryset(queryset, size=QUERYSET_TO_RESOURCES_CHUNK_SIZE):
+    """
+    Divide a queryset into lists of ``size`` model instances, ordered by primary key.
+
+    Every chunk is fetched with a separate query that continues after the last seen
+    primary key, so prefetches on the queryset are executed per chunk and a chunk
+    can be garbage collected as soon as the next one is requested. Any ordering of
+    the queryset is replaced, and sliced querysets are rejected, as they can not be
+    walked by primary key.
+    """
+    if isinstance(queryset, BaseManager):
+        queryset = queryset.all()
+
+    if queryset.query.is_sliced:
+        raise ValueError(
+            "Cannot divide a sliced queryset into chunks, filter it by primary key "
+            "instead."
+        )
+
+    queryset = queryset.order_by("pk")
+    last_pk = None
+    while True:
+        if last_pk is None:
+            chunk = list(queryset[:size])
+        else:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:size])
+
+        if chunk:
+            yield chunk
+        if len(chunk) < size:
+            break
+        last_pk = chunk[-1].pk
+
+
+def encode_cursor(ordering, values):
+    """Encode the values of the ordering fields of a row into an opaque cursor."""
+    payload = json.dumps([list(ordering), list(values)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor made by ``encode_cursor`` into the ordering and its values."""
+    try:
+        ordering, values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (AttributeError, TypeError, ValueError, binascii.Error):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+
+    if len(ordering) != len(values):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+
+    return tuple(ordering), values
+
+
+def get_keyset_query(ordering, values):
+    """
+    Return the filter that selects all rows that come after ``values`` when
+    ordering by ``ordering``, eg. for ``(date_updated, pk)``::
+
+        date_updated > x OR (date_updated = x AND pk > y)
+    """
+    query = Q()
+    for index, field_name in enumerate(ordering):
+        conditions = dict(zip(ordering[:index], values[:index]))
+        conditions[f"{field_name}__gt"] = values[index]
+        query |= Q(**conditions)
+
+    return query
+
+
+def keyset_page(queryset, size, ordering=("pk",), after=None):
+    """
+    Fetch a page of at most ``size`` model instances that follow the cursor ``after``.
+
+    Instead of an OFFSET, the page is selected by filtering on the ordering values of
+    the last row of the previous page, so every page costs the same no matter how deep
+    into the queryset it is. The primary key is appended to the ordering when missing
+    to make it unique.
+
+    Returns the model instances, the cursor of the last instance (or ``after`` when the
+    page is empty) and whether more instances follow.
+    """
+    if isinstance(queryset, BaseManager):
+        queryset = queryset.all()
+
+    ordering = tuple(ordering)
+    if ordering[-1] != "pk":
+        ordering += ("pk",)
+
+    meta = queryset.model._meta  # pylint: disable=protected-access
+    fields = [
+        meta.pk if field_name == "pk" else meta.get_field(field_name)
+        for field_name in ordering
+    ]
+
+    queryset = queryset.order_by(*ordering)
+    if after is not None:
+        cursor_ordering, cursor_values = decode_cursor(after)
+        if cursor_ordering != ordering:
+            raise ValueError(
+                f"Cursor is ordered by {cursor_ordering}, expected {ordering}"
+            )
+        try:
+            values = [
+                field.to_python(value) for field, value in zip(fields, cursor_values)
+            ]
+        except DjangoValidationError:
+            raise ValueError(f"Invalid cursor {after!r}")
+        queryset = queryset.filter(get_keyset_query(ordering, values))
+
+    # Fetch one extra instance to find out if there is a next page.
+    instances = list(queryset[: size + 1])
+    has_next = len(instances) > size
+    instances = instances[:size]
+
+    if not instances:
+        return instances, after, has_next
+
+    cursor = encode_cursor(
+        ordering, [field.value_to_string(instances[-1]) for field in fields]
+    )
+    return instances, cursor, has_next
+
+
 def get_mapped_fields(mapping, *from_field_names):
     keyed_mapping = defaultdict(set)
     exclude_fields = getattr(mapping, "exclude_fields", set())
@@ -0,0 +1,118 @@
+from decimal import Decimal as D
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from oscar.core.loading import get_class, get_model
+
+from oscar_odin import settings as odin_settings
+from oscar_odin.mappings import catalogue
+from oscar_odin.mappings.constants import PRODUCT_TITLE
+from oscar_odin.resources.catalogue import ProductClassResource, ProductResource
+
+Product = get_model("catalogue", "Product")
+Selector = get_class("partner.strategy", "Selector")
+
+
+@mock.patch.object(odin_settings, "PRODUCT_RESOURCE_CACHE_ENABLED", True)
+class TestProductResourceCache(TestCase):
+    fixtures = ["oscar_odin/catalogue", "oscar_odin/partner"]
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_queryset_to_resources_uses_cache(self):
+        queryset = Product.objects.filter(pk__lte=50).order_by("pk")
+        resources = catalogue.product_queryset_to_resources(queryset)
+        self.assertEqual(50, len(resources))
+
+        # Only the primary keys are fetched, the resources come from the cache
+        with self.assertNumQueries(1):
+            cached_resources = catalogue.product_queryset_to_resources(queryset)
+
+        self.assertListEqual(
+            [resource.id for resource in resources],
+            [resource.id for resource in cached_resources],
+        )
+        self.assertEqual(resources[0].title, cached_resources[0].title)
+
+    def test_save_invalidates_product_and_parent(self):
+        child = Product.objects.filter(parent__isnull=False).first()
+        parent = child.parent
+        catalogue.product_to_resource(parent, include_children=True)
+
+        child.title = "Changed title"
+        child.save()
+
+        resource = catalogue.product_to_resource(parent, include_children=True)
+        self.assertIn(
+            "Changed title",
+            [child_resource.title for child_resource in resource.children],
+        )
+
+    def test_parent_save_invalidates_children(self):
+        child = Product.objects.filter(parent__isnull=False).first()
+        parent = child.parent
+        # Children get the title of their parent when they have none
+        Product.objects.filter(pk=child.pk).update(title="")
+        catalogue.product_to_resource(Product.objects.get(pk=child.pk))
+
+        parent.title = "Changed title"
+        parent.save()
+
+        resource = catalogue.product_to_resource(Product.objects.get(pk=child.pk))
+        self.assertEqual("Changed title", resource.title)
+
+    def test_stockrecord_save_invalidates_product(self):
+        product = Product.objects.filter(stockrecords__isnull=False).first()
+        stockrecord = product.stockrecords.first()
+        catalogue.product_to_resource(product)
+
+        stockrecord.price = D("1234.56")
+        stockrecord.save()
+
+        resource = catalogue.product_to_resource(product)
+        self.assertEqual(D("1234.56"), resource.price)
+
+    def test_products_to_db_invalidates_products(self):
+        product = Product.objects.filter(structure=Product.STANDALONE).first()
+        catalogue.product_to_resource(product)
+
+        _, errors = catalogue.products_to_db(
+            [
+                ProductResource(
+                    upc=product.upc,
+                    title="Bulk title",
+                    structure=Product.STANDALONE,
+                    product_class=ProductClassResource(slug=product.product_class.slug),
+                )
+            ],
+            fields_to_update=[PRODUCT_TITLE],
+        )
+        self.assertEqual(0, len(errors))
+
+        resource = catalogue.product_to_resource(Product.objects.get(pk=product.pk))
+        self.assertEqual("Bulk title", resource.title)
+
+
+class TestProductResourceCacheDisabled(TestCase):
+    fixtures = ["oscar_odin/catalogue", "oscar_odin/partner"]
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_cache_is_not_used_when_disabled(self):
+        product = Product.objects.filter(structure=Product.STANDALONE).first()
+        strategy = Selector().strategy()
+        catalogue.product_to_resource_with_strategy(product, strategy, use_cache=True)
+
+        product.title = "Changed title"
+        product.save()
+
+        resource = catalogue.product_to_resource_with_strategy(
+            product, strategy, use_cache=True
+        )
+        self.assertEqual("Changed title", resource.title)
@@ -1,14 +1,53 @@
+from typing import Optional
+from unittest import mock
+
+import odin
 from odin.codecs import dict_codec
 
 from django.test import TestCase
 
+from oscar.apps.partner.strategy import Default
 from oscar.core.loading import get_model
 
+from oscar_odin.exceptions import NPlusOneQueryError
 from oscar_odin.mappings import catalogue
+from oscar_odin.mappings.common import OscarBaseMapping
+from oscar_odin.mappings.prefetching.registry import prefetch_registry
+from oscar_odin.resources.base import OscarResource
+from oscar_odin.strategy import BatchFetchMixin
 
-from oscar_odin.utils import get_mapped_fields
+from oscar_odin.utils import detect_n_plus_one, get_mapped_fields
 
 Product = get_model("catalogue", "Product")
+ProductAttribute = get_model("catalogue", "ProductAttribute")
+ProductAttributeValue = get_model("catalogue", "ProductAttributeValue")
+AttributeOptionGroup = get_model("catalogue", "AttributeOptionGroup")
+Partner = get_model("partner", "Partner")
+
+
+class BatchStrategy(BatchFetchMixin, Default):
+    pass
+
+
+class ProductSuggestionResource(OscarResource):
+    id: int
+    upc: Optional[str]
+    title: str
+    product_class: str
+
+
+class ProductToSuggestionResource(OscarBaseMapping):
+    from_obj = Product
+    to_obj = ProductSuggestionResource
+    prefetch_profile = "suggest"
+
+    @odin.assign_field
+    def title(self) -> str:
+        return self.source.get_title()
+
+    @odin.assign_field
+    def product_class(self) -> str:
+        return self.source.get_product_class().name
 
 
 class TestProduct(TestCase):
@@ -78,6 +117,298 @@ class TestProduct(TestCase):
             )
             dict_codec.dump(resources, include_type_field=False)
 
+    def test_queryset_to_resources_prefetch_profile(self):
+        profile = prefetch_registry.register_profile("suggest", inherits=None)
+        profile.register_select_related(
+            ["product_class", "parent", "parent__product_class"]
+        )
+        self.addCleanup(prefetch_registry.profiles.pop, "suggest")
+
+        queryset = Product.objects.all()
+        # The profile of the mapper is applied, so none of the default prefetches run
+        with self.assertNumQueries(1):
+            resources = catalogue.product_queryset_to_resources(
+                queryset, product_mapper=ProductToSuggestionResource
+            )
+        self.assertEqual(210, len(resources))
+
+        with self.assertNumQueries(1):
+            catalogue.product_queryset_to_resources(
+                queryset,
+                product_mapper=ProductToSuggestionResource,
+                prefetch_profile="suggest",
+            )
+
+    def test_queryset_to_resources_fields(self):
+        queryset = Product.objects.all()
+
+        # Only the products themselves are selected, without the unused columns
+        with self.assertNumQueries(1), detect_n_plus_one():
+            resources = catalogue.product_queryset_to_resources(
+                queryset, include_children=True, fields=["title", "upc"]
+            )
+            self.assertEqual(210, len(resources))
+
+        resource = resources[0]
+        self.assertEqual(queryset[0].pk, resource.id)
+        self.assertEqual(queryset[0].get_title(), resource.title)
+        self.assertIsNone(resource.slug)
+        self.assertIsNone(resource.price)
+        self.assertListEqual([], resource.images)
+
+        with self.assertNumQueries(6), detect_n_plus_one():
+            resources = catalogue.product_queryset_to_resources(
+                queryset, include_children=True, fields=["price", "children"]
+            )
+            dict_codec.dump(resources, include_type_field=False)
+
+    def test_queryset_to_resources_without_n_plus_one_queries(self):
+        queryset = Product.objects.all()
+
+        with detect_n_plus_one():
+            resources = catalogue.product_queryset_to_resources(
+                queryset, include_children=True
+            )
+            dict_codec.dump(resources, include_type_field=False)
+
+    def test_detect_n_plus_one(self):
+        # Without the registered prefetches, every product queries its relations
+        products = list(Product.objects.filter(structure=Product.STANDALONE)[:5])
+
+        with self.assertRaises(NPlusOneQueryError) as error:
+            with detect_n_plus_one():
+                list(catalogue.product_to_resource(products))
+
+        self.assertIn("ProductToResource.images", str(error.exception))
+
+        with detect_n_plus_one(raise_error=False) as detector:
+            list(catalogue.product_to_resource(products))
+
+        rules = {query.rule for query in detector.repeated_queries}
+        self.assertIn("ProductToResource.categories", rules)
+        self.assertIn("ProductToResource.attributes", rules)
+
+    def test_queryset_to_resources_iterator(self):
+        queryset = Product.objects.all()
+        product_resources = catalogue.product_queryset_to_resources_iterator(
+            queryset, chunk_size=50
+        )
+
+        self.assertListEqual(
+            list(queryset.order_by("pk").values_list("pk", flat=True)),
+            [resource.id for resource in product_resources],
+        )
+
+    def test_queryset_to_resources_iterator_pk_order(self):
+        queryset = Product.objects.order_by("-title")
+        product_resources = catalogue.product_queryset_to_resources_iterator(
+            queryset, chunk_size=50
+        )
+
+        self.assertListEqual(
+            list(queryset.order_by("pk").values_list("pk", flat=True)),
+            [resource.id for resource in product_resources],
+        )
+
+    def test_queryset_to_resources_iterator_sliced_queryset(self):
+        queryset = Product.objects.all()[:10]
+
+        with self.assertRaises(ValueError):
+            list(catalogue.product_queryset_to_resources_iterator(queryset))
+
+    def test_queryset_to_resources_iterator_num_queries(self):
+        queryset = Product.objects.all()
+
+        # The queries per chunk are the same as for product_queryset_to_resources
+        with self.assertNumQueries(14):
+            resources = catalogue.product_queryset_to_resources_iterator(
+                queryset, chunk_size=500
+            )
+            dict_codec.dump(list(resources), include_type_field=False)
+
+        # Three chunks, prefetches without any related objects in a chunk are skipped.
+        with self.assertNumQueries(31):
+            resources = catalogue.product_queryset_to_resources_iterator(
+                queryset, chunk_size=100
+            )
+            dict_codec.dump(list(resources), include_type_field=False)
+
+    def test_queryset_to_resources_iterator_shares_category_resources(self):
+        queryset = Product.objects.all()
+        resources = list(
+            catalogue.product_queryset_to_resources_iterator(queryset, chunk_size=50)
+        )
+
+        category_resources = {}
+        for resource in resources:
+            for category in resource.categories:
+                category_resources.setdefault(category.id, []).append(category)
+
+        self.assertGreater(max(map(len, category_resources.values())), 50)
+        # Every category is mapped once, across all chunks
+        for categories in category_resources.values():
+            self.assertEqual(1, len(set(map(id, categories))))
+
+    def test_queryset_to_resources_interns_product_classes(self):
+        resources = catalogue.product_queryset_to_resources(Product.objects.all())
+
+        product_classes = {}
+        for resource in resources:
+            product_classes.setdefault(resource.product_class.slug, set()).add(
+                id(resource.product_class)
+            )
+
+        for resource_ids in product_classes.values():
+            self.assertEqual(1, len(resource_ids))
+
+    def test_queryset_to_resource_pages(self):
+        queryset = Product.objects.all()
+
+        ids = []
+        page = catalogue.product_queryset_to_resource_pages(queryset, page_size=100)
+        ids.extend(resource.id for resource in page.resources)
+        while page.has_next:
+            page = catalogue.product_queryset_to_resource_pages(
+                queryset, page_size=100, after=page.cursor
+            )
+            ids.extend(resource.id for resource in page.resources)
+
+        self.assertEqual(10, len(page.resources))
+        self.assertListEqual(
+            list(queryset.order_by("pk").values_list("pk", flat=True)), ids
+        )
+
+    def test_queryset_to_resource_pages_by_date_updated(self):
+        queryset = Product.objects.all()
+        page = catalogue.product_queryset_to_resource_pages(
+            queryset, page_size=200, ordering=("date_updated", "pk")
+        )
+        self.assertTrue(page.has_next)
+
+        # Products that are updated after the cursor was handed out end up on the next page.
+        product = Product.objects.order_by("date_updated", "pk").first()
+        product.save()
+
+        page = catalogue.product_queryset_to_resource_pages(
+            queryset, page_size=200, after=page.cursor, ordering=("date_updated",)
+        )
+        self.assertFalse(page.has_next)
+        self.assertEqual(11, len(page.resources))
+        self.assertEqual(product.pk, page.resources[-1].id)
+
+        # An empty page keeps the cursor, so the feed can be resumed later on.
+        empty_page = catalogue.product_queryset_to_resource_pages(
+            queryset, after=page.cursor, ordering=("date_updated",)
+        )
+        self.assertListEqual([], empty_page.resources)
+        self.assertEqual(page.cursor, empty_page.cursor)
+
+    def test_queryset_to_resource_pages_invalid_cursor(self):
+        queryset = Product.objects.all()
+        page = catalogue.product_queryset_to_resource_pages(queryset, page_size=10)
+
+        with self.assertRaises(ValueError):
+            catalogue.product_queryset_to_resource_pages(queryset, after="invalid")
+
+        with self.assertRaises(ValueError):
+            catalogue.product_queryset_to_resource_pages(
+                queryset, after=page.cursor, ordering=("date_updated",)
+            )
+
+    def test_product_to_resource_with_batch_strategy(self):
+        queryset = Product.objects.all()
+        fields = ("price", "currency", "availability", "is_available_to_buy")
+
+        expected = catalogue.product_to_resource_with_strategy(
+            queryset, Default(), include_children=True
+        )
+
+        strategy = BatchStrategy()
+        with mock.patch.object(
+            strategy, "fetch_for_product", side_effect=AssertionError
+        ), mock.patch.object(strategy, "fetch_for_parent", side_effect=AssertionError):
+            actual = catalogue.product_to_resource_with_strategy(
+                queryset, strategy, include_children=True
+            )
+
+        expected = sorted(expected, key=lambda resource: resource.id)
+        actual = sorted(actual, key=lambda resource: resource.id)
+        self.assertEqual(210, len(actual))
+        for expected_resource, actual_resource in zip(expected, actual):
+            for field in fields:
+                self.assertEqual(
+                    getattr(expected_resource, field), getattr(actual_resource, field)
+                )
+
+    def test_batch_strategy_selects_stockrecords_in_one_pass(self):
+        products = list(Product.objects.all())
+        strategy = BatchStrategy()
+
+        # One query for the public children of the parents, and one for the
+        # stockrecords of all products and children.
+        with mock.patch.object(
+            strategy, "select_stockrecord", side_effect=AssertionError
+        ), self.assertNumQueries(2):
+            stock_prices = strategy.fetch_for_products(products)
+
+        self.assertSetEqual({product.pk for product in products}, set(stock_prices))
+
+    def test_batch_strategy_uses_custom_select_stockrecord(self):
+        class NoStockRecordStrategy(BatchStrategy):
+            def select_stockrecord(self, product):
+                return None
+
+        product = Product.objects.filter(children__isnull=True).first()
+        partner = Partner.objects.create(name="Partner")
+        product.stockrecords.create(
+            partner=partner, partner_sku="sku", price=10, num_in_stock=5
+        )
+
+        self.assertTrue(BatchStrategy().fetch_for_products([product])[product.pk][3])
+        stock_prices = NoStockRecordStrategy().fetch_for_products([product])
+        self.assertFalse(stock_prices[product.pk][3])
+
+    def test_product_to_resource_with_batch_strategy_single_product(self):
+        product = Product.objects.get(id=8)
+
+        actual = catalogue.product_to_resource_with_strategy(product, BatchStrategy())
+
+        self.assertEqual(product.title, actual.title)
+
+    def test_queryset_to_resources_multi_option_attributes(self):
+        product = Product.objects.get(id=1)
+        group = AttributeOptionGroup.objects.create(name="Colours")
+        options = [group.options.create(option=colour) for colour in ("red", "blue")]
+        for code in ("colours", "accents"):
+            attribute = ProductAttribute.objects.create(
+                product_class=product.product_class,
+                name=code,
+                code=code,
+                type=ProductAttribute.MULTI_OPTION,
+                option_group=group,
+            )
+            value = ProductAttributeValue.objects.create(
+                product=product, attribute=attribute
+            )
+            value.value_multi_option.set(options)
+
+        queryset = Product.objects.all()
+        # The options of all multi option values are prefetched at once, an extra query
+        # is only done for the options of the parent attribute values.
+        with self.assertNumQueries(15):
+            resources = catalogue.product_queryset_to_resources(queryset)
+            dict_codec.dump(resources, include_type_field=False)
+
+        resource = next(resource for resource in resources if resource.id == 1)
+        self.assertListEqual(["red", "blue"], resource.attributes["colours"])
+        self.assertListEqual(["red", "blue"], resource.attributes["accents"])
+
+        # Without prefetching, the options are fetched in a single query
+        product = Product.objects.get(id=1)
+        with self.assertNumQueries(2):
+            attributes = catalogue.ProductToResource(product).attributes()
+        self.assertListEqual(["red", "blue"], attributes["colours"])
+
     def test_get_mapped_fields(self):
         product_to_model_fields = get_mapped_fields(catalogue.ProductToModel)
         self.assertListEqual(
@@ -0,0 +1,76 @@
+import odin
+
+from django.test import TestCase
+
+from oscar_odin.inheritable import Resource
+from oscar_odin.mappings.common import CompiledMappingRule, OscarBaseMapping
+
+
+class SourceResource(Resource):
+    title = odin.StringField()
+    code = odin.StringField(null=True)
+
+
+class TargetResource(Resource):
+    title = odin.StringField()
+    code = odin.StringField(null=True)
+    upper_title = odin.StringField()
+    parts = odin.ListField()
+
+
+class SourceToTarget(OscarBaseMapping):
+    from_obj = SourceResource
+    to_obj = TargetResource
+
+    mappings = (odin.define(from_field="code", skip_if_none=True),)
+
+    @odin.assign_field
+    def upper_title(self):
+        return self.source.title.upper()
+
+    @odin.map_list_field(from_field="title", to_field="parts")
+    @staticmethod
+    def parts(title):
+        return title.split()
+
+
+class CustomRuleSourceToTarget(SourceToTarget):
+    from_obj = SourceResource
+    to_obj = TargetResource
+
+    def _apply_rule(self, mapping_rule):
+        return super()._apply_rule(mapping_rule)
+
+
+class CompiledMappingRuleTestCase(TestCase):
+    def test_rules_are_compiled_once(self):
+        compiled_rules = SourceToTarget.get_compiled_rules()
+
+        self.assertTrue(
+            all(isinstance(rule, CompiledMappingRule) for rule in compiled_rules)
+        )
+        self.assertIs(compiled_rules, SourceToTarget.get_compiled_rules())
+
+    def test_compiled_rules_match_apply_rule(self):
+        for source in (
+            SourceResource(title="A title", code="a"),
+            SourceResource(title="A title", code=None),
+        ):
+            mapping = SourceToTarget(source)
+            for compiled_rule in SourceToTarget.get_compiled_rules():
+                self.assertDictEqual(
+                    mapping._apply_rule(compiled_rule.mapping_rule),
+                    compiled_rule(mapping),
+                )
+
+        target = SourceToTarget.apply(SourceResource(title="A title", code=None))
+        self.assertEqual("A TITLE", target.upper_title)
+        self.assertListEqual(["A", "title"], target.parts)
+
+    def test_custom_apply_rule_is_not_compiled(self):
+        self.assertIsNone(CustomRuleSourceToTarget.get_compiled_rules())
+
+        target = CustomRuleSourceToTarget.apply(
+            SourceResource(title="A title", code="a")
+        )
+        self.assertEqual("A TITLE", target.upper_title)
@@ -0,0 +1,153 @@
+import csv
+import json
+import os
+import tempfile
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.catalogue import ProductToResource
+from oscar_odin.mappings.export import (
+    CSV,
+    ProductToExportResource,
+    export_product_queryset,
+    get_pk_ranges,
+)
+
+Product = get_model("catalogue", "Product")
+
+
+class TestExport(TestCase):
+    fixtures = ["oscar_odin/catalogue", "oscar_odin/partner"]
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "export")
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super().tearDown()
+
+    def test_get_pk_ranges(self):
+        pks = list(Product.objects.order_by("pk").values_list("pk", flat=True))
+
+        # The count, the first primary key and the bounds of every range
+        with self.assertNumQueries(6):
+            ranges = get_pk_ranges(Product.objects.all(), 4)
+
+        self.assertListEqual(
+            [
+                (pks[0], pks[52]),
+                (pks[53], pks[105]),
+                (pks[106], pks[157]),
+                (pks[158], pks[209]),
+            ],
+            ranges,
+        )
+        self.assertListEqual([], get_pk_ranges(Product.objects.none(), 4))
+        self.assertEqual(1, len(get_pk_ranges(Product.objects.filter(pk=1), 4)))
+
+    def test_export_product_queryset_jsonl(self):
+        count = export_product_queryset(
+            Product.objects.all(), self.path, processes=1, num_ranges=3
+        )
+
+        with open(self.path, encoding="utf-8") as fp:
+            lines = [json.loads(line) for line in fp]
+
+        self.assertEqual(210, count)
+        self.assertListEqual(
+            list(Product.objects.order_by("pk").values_list("pk", flat=True)),
+            [line["id"] for line in lines],
+        )
+        # The part files are removed
+        self.assertEqual(["export"], os.listdir(self.directory.name))
+
+        # The relations are exported as resources, not as model objects
+        lines = {line["id"]: line for line in lines}
+        child = Product.objects.filter(parent__isnull=False).first()
+        self.assertEqual({"upc": child.parent.upc}, lines[child.pk]["parent"])
+        self.assertEqual([], lines[child.pk]["recommended_products"])
+
+        product = Product.objects.filter(stockrecords__isnull=False).first()
+        self.assertEqual(
+            list(product.stockrecords.values_list("partner_sku", flat=True)),
+            [
+                stockrecord["partner_sku"]
+                for stockrecord in lines[product.pk]["stockrecords"]
+            ],
+        )
+
+    def test_export_mapping_replaces_rules(self):
+        # The rules of the export mapping replace those of ProductToResource
+        to_fields = [rule.to_field for rule in ProductToExportResource._mapping_rules]
+        self.assertEqual(len(to_fields), len(set(to_fields)))
+        self.assertEqual(
+            len(to_fields),
+            len({rule.to_field for rule in ProductToResource._mapping_rules}),
+        )
+
+    def test_export_product_queryset_csv(self):
+        count = export_product_queryset(
+            Product.objects.filter(pk__lte=20),
+            self.path,
+            file_format=CSV,
+            processes=1,
+        )
+
+        with open(self.path, encoding="utf-8", newline="") as fp:
+            rows = list(csv.DictReader(fp))
+
+        self.assertEqual(20, count)
+        self.assertEqual(20, len(rows))
+        self.assertEqual(Product.objects.get(pk=1).upc, rows[0]["upc"])
+
+    def test_export_product_queryset_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            export_product_queryset(Product.objects.all(), self.path, file_format="xml")
+
+
+class TestMultiProcessExport(TransactionTestCase):
+    fixtures = ["oscar_odin/catalogue"]
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "export")
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super().tearDown()
+
+    def test_export_product_queryset(self):
+        queryset = Product.objects.filter(pk__lte=100)
+        count = export_product_queryset(queryset, self.path, processes=2)
+        # Only the query is sent to the workers, pickling the queryset evaluates it
+        self.assertIsNone(queryset._result_cache)
+
+        with open(self.path, encoding="utf-8") as fp:
+            lines = [json.loads(line) for line in fp]
+
+        self.assertEqual(100, count)
+        self.assertListEqual(
+            list(queryset.order_by("pk").values_list("pk", flat=True)),
+            [line["id"] for line in lines],
+        )
+        self.assertEqual(["export"], os.listdir(self.directory.name))
+
+    def test_export_keeps_connections_of_caller(self):
+        with transaction.atomic():
+            Product.objects.filter(pk=1).update(title="Changed title")
+            database_connection = connection.connection
+
+            count = export_product_queryset(
+                Product.objects.filter(pk__lte=10), self.path, processes=2
+            )
+
+            self.assertEqual(10, count)
+            self.assertIs(database_connection, connection.connection)
+            self.assertTrue(connection.in_atomic_block)
+            self.assertEqual("Changed title", Product.objects.get(pk=1).title)
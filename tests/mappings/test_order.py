@@ -1,9 +1,19 @@
+from datetime import timedelta
+from decimal import Decimal as D
+
 from django.test import TestCase
 from oscar.core.loading import get_model
 
 from oscar_odin.mappings import order
+from oscar_odin.utils import detect_n_plus_one
 
 Order = get_model("order", "Order")
+OrderLineDiscount = get_model("order", "OrderLineDiscount")
+OrderStatusChange = get_model("order", "OrderStatusChange")
+PaymentEvent = get_model("order", "PaymentEvent")
+PaymentEventType = get_model("order", "PaymentEventType")
+ShippingEvent = get_model("order", "ShippingEvent")
+ShippingEventType = get_model("order", "ShippingEventType")
 
 
 class TestOrder(TestCase):
@@ -22,3 +32,201 @@ class TestOrder(TestCase):
         actual = order.order_to_resource(order_model)
 
         self.assertEqual(order_model.number, actual.number)
+
+    def test_mapping__dimension_resources_are_interned(self):
+        order_model = Order.objects.first()
+
+        first, second = order.order_to_resource([order_model, order_model])
+
+        self.assertIsNot(first, second)
+        self.assertIs(first.user, second.user)
+        self.assertIs(first.shipping_address.country, second.shipping_address.country)
+
+    def clone_order(self, order_model, number):
+        lines = list(order_model.lines.all())
+        order_model.pk = None
+        order_model.number = number
+        order_model.save()
+
+        for line in lines:
+            prices = list(line.prices.all())
+            attributes = list(line.attributes.all())
+            line.pk = None
+            line.order = order_model
+            line.save()
+            for price in prices:
+                price.pk = None
+                price.order = order_model
+                price.line = line
+                price.save()
+            for attribute in attributes:
+                attribute.pk = None
+                attribute.line = line
+                attribute.save()
+
+    def test_queryset_to_resources(self):
+        order_model = Order.objects.first()
+        expected = order.order_to_resource(order_model)
+
+        (actual,) = order.order_queryset_to_resources(Order.objects.all())
+
+        self.assertEqual(expected.number, actual.number)
+        self.assertEqual(expected.user.email, actual.user.email)
+        self.assertEqual(expected.lines[0].attributes, actual.lines[0].attributes)
+        self.assertEqual(len(expected.lines[0].prices), len(actual.lines[0].prices))
+
+    def test_queryset_to_resources_num_queries(self):
+        self.clone_order(Order.objects.first(), "clone-1")
+        self.clone_order(Order.objects.first(), "clone-2")
+        queryset = Order.objects.all()
+        self.assertEqual(3, queryset.count())
+
+        # The number of queries doesn't depend on the number of orders
+        with self.assertNumQueries(11), detect_n_plus_one():
+            resources = order.order_queryset_to_resources(queryset)
+
+        self.assertEqual(3, len(resources))
+        self.assertTrue(all(len(resource.lines) == 2 for resource in resources))
+
+    def test_select_related(self):
+        self.assertListEqual(
+            ["user", "billing_address__country", "shipping_address__country"],
+            order.OrderToResource.get_select_related(),
+        )
+
+        order_model = Order.objects.first()
+        with self.assertNumQueries(1):
+            order.select_related_objects([order_model], order.OrderToResource)
+
+        # The user, the address and its country are loaded already
+        with self.assertNumQueries(0):
+            self.assertEqual("tim@savage.au", order_model.user.email)
+            self.assertEqual("NL", order_model.shipping_address.country.pk)
+            self.assertIsNone(order_model.billing_address)
+
+        # Nothing is left to load
+        with self.assertNumQueries(0):
+            order.select_related_objects([order_model], order.OrderToResource)
+
+    def test_discount_lines_per_tax_code(self):
+        order_model = Order.objects.first()
+        discount = order_model.discounts.first()
+        first_line, second_line = order_model.lines.order_by("pk")
+        first_line.tax_code = "high"
+        first_line.save()
+        second_line.tax_code = "low"
+        second_line.save()
+        for line, amount in ((first_line, "1.50"), (second_line, "2.00")):
+            for _ in range(2):
+                OrderLineDiscount.objects.create(
+                    line=line,
+                    order_discount=discount,
+                    is_incl_tax=True,
+                    amount=D(amount),
+                )
+
+        expected = [(D("3.00"), "high"), (D("4.00"), "low")]
+
+        # Without prefetching, the totals are selected with a single query
+        with self.assertNumQueries(1):
+            discount_lines = order.DiscountToResource(
+                discount
+            ).discount_lines_per_tax_code()
+        self.assertListEqual(
+            expected, [(line.amount, line.tax_code) for line in discount_lines]
+        )
+
+        (resource,) = order.order_queryset_to_resources(Order.objects.all())
+        self.assertListEqual(
+            expected,
+            [
+                (line.amount, line.tax_code)
+                for line in resource.discounts[0].discount_lines_per_tax_code
+            ],
+        )
+
+    def test_discount_lines_reuse_line_resources(self):
+        order_model = Order.objects.first()
+        discount = order_model.discounts.first()
+        for line in order_model.lines.all():
+            OrderLineDiscount.objects.create(
+                line=line, order_discount=discount, is_incl_tax=True, amount=D("1.00")
+            )
+
+        (resource,) = order.order_queryset_to_resources(Order.objects.all())
+
+        line_resources = {line.model_instance.pk: line for line in resource.lines}
+        discount_lines = resource.discounts[0].discount_lines
+        self.assertEqual(2, len(discount_lines))
+        for discount_line in discount_lines:
+            self.assertIs(
+                line_resources[discount_line.model_instance.line_id], discount_line.line
+            )
+
+    def test_order_changes_to_resources(self):
+        first = Order.objects.first()
+        self.clone_order(Order.objects.first(), "clone-1")
+        second = Order.objects.get(number="clone-1")
+
+        now = first.date_placed
+        status_change = OrderStatusChange.objects.create(
+            order=first, old_status="new", new_status="paid"
+        )
+        payment_event = PaymentEvent.objects.create(
+            order=second,
+            amount=D("10.00"),
+            event_type=PaymentEventType.objects.create(name="Paid"),
+        )
+        shipping_event = ShippingEvent.objects.create(
+            order=first, event_type=ShippingEventType.objects.create(name="Shipped")
+        )
+        for index, change in enumerate([status_change, payment_event, shipping_event]):
+            type(change).objects.filter(pk=change.pk).update(
+                date_created=now + timedelta(hours=index + 1)
+            )
+
+        page = order.order_changes_to_resources(batch_size=2)
+        self.assertListEqual(
+            [first.number, second.number],
+            [resource.number for resource in page.resources],
+        )
+        self.assertTrue(page.has_next)
+
+        page = order.order_changes_to_resources(after=page.cursor, batch_size=2)
+        self.assertListEqual(
+            [first.number], [resource.number for resource in page.resources]
+        )
+        self.assertFalse(page.has_next)
+
+        # Without new changes, the watermark stays the same
+        cursor = page.cursor
+        with self.assertNumQueries(3):
+            page = order.order_changes_to_resources(after=cursor)
+        self.assertListEqual([], page.resources)
+        self.assertEqual(cursor, page.cursor)
+
+        page = order.order_changes_to_resources(since=now + timedelta(hours=2))
+        self.assertListEqual(
+            [second.number, first.number],
+            [resource.number for resource in page.resources],
+        )
+
+    def test_order_changes_to_resources_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            order.order_changes_to_resources(after="invalid")
+
+    def test_queryset_to_resources_include_products(self):
+        self.clone_order(Order.objects.first(), "clone-1")
+
+        resources = order.order_queryset_to_resources(Order.objects.all())
+        self.assertIsNone(resources[0].lines[0].product)
+
+        with detect_n_plus_one():
+            first, second = order.order_queryset_to_resources(
+                Order.objects.order_by("pk"), include_products=True
+            )
+
+        for line in first.lines:
+            self.assertEqual(line.product_id, line.product.id)
+        # The lines of both orders share the product resources
+        self.assertIs(first.lines[0].product, second.lines[0].product)
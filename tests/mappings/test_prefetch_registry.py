@@ -99,6 +99,63 @@ class TestPrefetchSystem(unittest.TestCase):
         key = self.registry._get_key(test_callable)
         self.assertEqual(key, "test_callable")
 
+    def test_register_profile_inherits_default(self):
+        self.registry.register_select_related("product_class")
+        self.registry.register_prefetch("images")
+        self.registry.register_children_prefetch("children__images")
+
+        profile = self.registry.register_profile("listing")
+        profile.register_prefetch("stockrecords")
+        profile.unregister_prefetch("images")
+        profile.unregister_children_prefetch("children__images")
+
+        self.assertEqual(["product_class"], profile.get_select_related())
+        self.assertEqual({"stockrecords": "stockrecords"}, profile.get_prefetches())
+        self.assertEqual({}, profile.get_children_prefetches())
+        # The inherited profile itself is left alone
+        self.assertEqual({"images": "images"}, self.registry.get_prefetches())
+
+    def test_register_profile_inherits_later_registrations(self):
+        profile = self.registry.register_profile("listing")
+        self.registry.register_prefetch("images")
+        self.assertIn("images", profile.get_prefetches())
+
+    def test_register_profile_without_inheritance(self):
+        self.registry.register_prefetch("images")
+        profile = self.registry.register_profile("listing", inherits=None)
+        self.assertEqual({}, profile.get_prefetches())
+        self.assertIs(profile, self.registry.register_profile("listing"))
+
+    def test_register_profile_inherits_profile(self):
+        listing = self.registry.register_profile("listing", inherits=None)
+        listing.register_select_related("product_class")
+        suggest = listing.register_profile("suggest", inherits="listing")
+        suggest.unregister_select_related("product_class")
+        suggest.register_select_related("parent")
+
+        self.assertIs(suggest, self.registry.get_profile("suggest"))
+        self.assertEqual(["parent"], suggest.get_select_related())
+
+    def test_get_operations_for_fields(self):
+        self.registry.register_select_related("parent")
+        self.registry.register_select_related("product_class", fields=["product_class"])
+        self.registry.register_prefetch("images", fields=["images"])
+        self.registry.register_children_prefetch("children__images", fields=["images"])
+
+        self.assertEqual(["parent"], self.registry.get_select_related(["title"]))
+        self.assertEqual({}, self.registry.get_prefetches(["title"]))
+        self.assertEqual({}, self.registry.get_children_prefetches(["title"]))
+        self.assertIn("images", self.registry.get_prefetches(["title", "images"]))
+        self.assertIn("images", self.registry.get_prefetches())
+
+        profile = self.registry.register_profile("listing")
+        profile.register_prefetch("images", fields=["children"])
+        self.assertEqual({}, profile.get_prefetches(["images"]))
+
+    def test_get_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            self.registry.get_profile("unknown")
+
     def test_get_key_unsupported_type(self):
         with self.assertRaises(ValueError):
             self.registry._get_key(123)
@@ -132,6 +189,8 @@ class TestPrefetchSystem(unittest.TestCase):
 
         result = prefetch_product_queryset(self.mock_queryset)
 
+        # Without lookups, select_related() would select all non-null relations
+        self.mock_queryset.select_related.assert_not_called()
         self.mock_queryset.prefetch_related.assert_called_once_with("callable_prefetch")
 
     @patch("oscar_odin.mappings.prefetching.prefetch.prefetch_registry")
@@ -175,3 +234,18 @@ class TestPrefetchSystem(unittest.TestCase):
         result = prefetch_product_queryset(self.mock_queryset, custom_arg=True)
 
         self.mock_queryset.prefetch_related.assert_called_once_with("custom_prefetch")
+
+    @patch("oscar_odin.mappings.prefetching.prefetch.prefetch_registry")
+    def test_prefetch_product_queryset_with_profile(self, mock_registry):
+        profile = self.registry.register_profile("listing")
+        profile.register_select_related("product_class")
+        profile.register_prefetch("stockrecords")
+        mock_registry.get_profile.return_value = profile
+
+        result = prefetch_product_queryset(
+            self.mock_queryset, prefetch_profile="listing"
+        )
+
+        mock_registry.get_profile.assert_called_once_with("listing")
+        self.mock_queryset.select_related.assert_called_once_with("product_class")
+        self.mock_queryset.prefetch_related.assert_called_once_with("stockrecords")
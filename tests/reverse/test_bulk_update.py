@@ -0,0 +1,92 @@
+from decimal import Decimal as D
+from unittest import mock, skipUnless
+
+from django.db import DataError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from oscar.core.loading import get_model
+
+from oscar_odin.utils import bulk_update_from_values
+
+Partner = get_model("partner", "Partner")
+StockRecord = get_model("partner", "StockRecord")
+Product = get_model("catalogue", "Product")
+ProductClass = get_model("catalogue", "ProductClass")
+
+
+class BulkUpdateFromValuesTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        product_class = ProductClass.objects.create(name="Klaas", slug="klaas")
+        self.partners = [
+            Partner.objects.create(name=name, code=name) for name in ["henk", "klaas"]
+        ]
+        self.stockrecords = [
+            StockRecord.objects.create(
+                product=Product.objects.create(
+                    upc=f"upc-{index}", title=f"{index}", product_class=product_class
+                ),
+                partner=self.partners[0],
+                partner_sku=f"sku-{index}",
+                price=D("10"),
+                num_in_stock=index,
+            )
+            for index in range(5)
+        ]
+
+    def test_update(self):
+        for index, stockrecord in enumerate(self.stockrecords):
+            stockrecord.partner = self.partners[1]
+            stockrecord.price = D(index) + D("0.50")
+            stockrecord.num_in_stock = None
+
+        with CaptureQueriesContext(connection) as context:
+            updated = bulk_update_from_values(
+                StockRecord.objects,
+                self.stockrecords,
+                ["partner", "price", "num_in_stock"],
+            )
+
+        self.assertEqual(5, updated)
+        self.assertEqual(1, len(context))
+        self.assertIn("FROM (VALUES", context[0]["sql"])
+        self.assertNotIn("CASE", context[0]["sql"])
+
+        for index, stockrecord in enumerate(StockRecord.objects.order_by("pk")):
+            self.assertEqual(self.partners[1].pk, stockrecord.partner_id)
+            self.assertEqual(D(index) + D("0.50"), stockrecord.price)
+            self.assertIsNone(stockrecord.num_in_stock)
+
+    @skipUnless(connection.features.max_query_params, "No query parameter limit")
+    def test_batches_are_sized_from_max_query_params(self):
+        with mock.patch.object(
+            connection.features, "max_query_params", 4
+        ), CaptureQueriesContext(connection) as context:
+            bulk_update_from_values(StockRecord.objects, self.stockrecords, ["price"])
+
+        # The pk and price of 2 stockrecords per query
+        self.assertEqual(3, len(context))
+
+    @skipUnless(connection.vendor == "postgresql", "SQLite does not enforce lengths")
+    def test_values_are_not_truncated(self):
+        self.stockrecords[0].partner_sku = "x" * 129
+
+        with self.assertRaises(DataError):
+            bulk_update_from_values(
+                StockRecord.objects, self.stockrecords, ["partner_sku"]
+            )
+
+    def test_fallback(self):
+        for stockrecord in self.stockrecords:
+            stockrecord.price = D("20")
+
+        with mock.patch(
+            "oscar_odin.utils.supports_update_from", return_value=False
+        ), CaptureQueriesContext(connection) as context:
+            bulk_update_from_values(StockRecord.objects, self.stockrecords, ["price"])
+
+        self.assertIn("CASE", context[0]["sql"])
+        self.assertEqual(
+            {D("20")}, set(StockRecord.objects.values_list("price", flat=True))
+        )
@@ -4,7 +4,9 @@ import PIL
 from decimal import Decimal as D
 
 from django.core.files import File
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from oscar.core.loading import get_model
 
@@ -37,6 +39,7 @@ ProductAttribute = get_model("catalogue", "ProductAttribute")
 ProductImage = get_model("catalogue", "ProductImage")
 Category = get_model("catalogue", "Category")
 Partner = get_model("partner", "Partner")
+StockRecord = get_model("partner", "StockRecord")
 ProductRecommendation = get_model("catalogue", "ProductRecommendation")
 
 
@@ -1080,3 +1083,59 @@ class ProductFieldsToUpdateTest(TestCase):
         # i.e, ProductClass with slug="better" not found.
         with self.assertRaises(Exception):
             products_to_db(product_resources, clean_instances=True)
+
+
+class UpsertProductsTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.partner = Partner.objects.create(name="klaas", code="klaas")
+        ProductClass.objects.create(name="Klaas", slug="klaas")
+
+    def get_product_resource(self, upc, title, price):
+        return ProductResource(
+            upc=upc,
+            title=title,
+            slug=f"product-{upc}",
+            structure=Product.STANDALONE,
+            price=price,
+            availability=2,
+            currency="EUR",
+            partner=self.partner,
+            product_class=ProductClassResource(slug="klaas"),
+        )
+
+    def test_upsert_products(self):
+        _, errors = products_to_db([self.get_product_resource("1", "Henk", D("10"))])
+        self.assertEqual(len(errors), 0)
+        product = Product.objects.get(upc="1")
+
+        counts = {}
+        with CaptureQueriesContext(connection) as context:
+            products, errors = products_to_db(
+                [
+                    self.get_product_resource("1", "Harrie", D("11")),
+                    self.get_product_resource("2", "Klaas", D("12")),
+                ],
+                upsert=True,
+                counts=counts,
+            )
+        self.assertEqual(len(errors), 0)
+        self.assertEqual(products.count(), 2)
+
+        # Products and stockrecords are both saved with an upsert, the product class
+        # reference lacks its name so it is updated the regular way.
+        upserts = [query["sql"] for query in context if "ON CONFLICT" in query["sql"]]
+        self.assertEqual(len(upserts), 2)
+        updates = [
+            query["sql"] for query in context if query["sql"].startswith("UPDATE")
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertIn("catalogue_productclass", updates[0])
+
+        product.refresh_from_db()
+        self.assertEqual(product.title, "Harrie")
+        self.assertEqual(product.stockrecords.get().price, D("11"))
+        self.assertEqual(Product.objects.get(upc="2").stockrecords.get().price, 12)
+
+        self.assertEqual(counts[Product], {"created": 1, "updated": 1})
+        self.assertEqual(counts[StockRecord], {"created": 1, "updated": 1})
@@ -0,0 +1,83 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from oscar.core.loading import get_model
+
+from oscar_odin.utils import get_lookup_filters, in_bulk
+
+Partner = get_model("partner", "Partner")
+StockRecord = get_model("partner", "StockRecord")
+Product = get_model("catalogue", "Product")
+ProductClass = get_model("catalogue", "ProductClass")
+
+
+class InBulkTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        product_class = ProductClass.objects.create(name="Klaas", slug="klaas")
+        self.partners = [
+            Partner.objects.create(name=name, code=name) for name in ["henk", "klaas"]
+        ]
+        self.stockrecords = {}
+        for index in range(5):
+            product = Product.objects.create(
+                upc=f"upc-{index}", title=f"{index}", product_class=product_class
+            )
+            for partner in self.partners:
+                stockrecord = StockRecord.objects.create(
+                    product=product, partner=partner, partner_sku=f"sku-{index}"
+                )
+                self.stockrecords[(partner.pk, stockrecord.partner_sku)] = stockrecord
+
+    def test_single_field(self):
+        instances = [Partner(code="henk"), Partner(code="klaas"), Partner(code="none")]
+        with CaptureQueriesContext(connection) as context:
+            mapping = in_bulk(Partner.objects, instances, ("code",))
+
+        self.assertEqual(1, len(context))
+        self.assertNotIn(" OR ", context[0]["sql"])
+        self.assertDictEqual(
+            {(partner.code,): partner.pk for partner in self.partners}, dict(mapping)
+        )
+
+    def test_composite_fields(self):
+        instances = [
+            StockRecord(partner_id=partner_id, partner_sku=partner_sku)
+            for partner_id, partner_sku in self.stockrecords
+        ]
+        with CaptureQueriesContext(connection) as context:
+            mapping = in_bulk(
+                StockRecord.objects, instances, ("partner_id", "partner_sku")
+            )
+
+        # One branch per partner, instead of one per stockrecord
+        self.assertEqual(1, len(context))
+        self.assertEqual(1, context[0]["sql"].count(" OR "))
+        self.assertDictEqual(
+            {key: stockrecord.pk for key, stockrecord in self.stockrecords.items()},
+            dict(mapping),
+        )
+
+    def test_batches_are_sized_from_max_query_params(self):
+        instances = [
+            StockRecord(partner_id=partner_id, partner_sku=partner_sku)
+            for partner_id, partner_sku in self.stockrecords
+        ]
+        with mock.patch.object(
+            connection.features, "max_query_params", 7
+        ), CaptureQueriesContext(connection) as context:
+            mapping = in_bulk(
+                StockRecord.objects, instances, ("partner_id", "partner_sku")
+            )
+
+        # 2 partners with 5 skus each, at most 3 skus and their partner per query,
+        # which leaves room for the values of another key
+        self.assertEqual(4, len(context))
+        self.assertEqual(10, len(mapping))
+
+    def test_null_values(self):
+        (query,) = get_lookup_filters({("henk",), (None,)}, ("code",), 10)
+        self.assertIn(("code__isnull", True), query.children)
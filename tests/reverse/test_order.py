@@ -0,0 +1,295 @@
+from datetime import datetime, timezone
+from decimal import Decimal as D
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.order import (
+    order_statuses_to_db,
+    order_to_resource,
+    orders_to_db,
+)
+from oscar_odin.resources.auth import UserResource
+from oscar_odin.resources.order import (
+    LineStatusResource,
+    NoteResource,
+    OrderStatusResource,
+    PaymentEventResource,
+    ShippingEventResource,
+    StatusChangeResource,
+)
+
+Order = get_model("order", "Order")
+Line = get_model("order", "Line")
+ShippingAddress = get_model("order", "ShippingAddress")
+PaymentEventType = get_model("order", "PaymentEventType")
+OrderStatusChange = get_model("order", "OrderStatusChange")
+
+
+class OrdersToDbTest(TestCase):
+    fixtures = [
+        "oscar_odin/auth",
+        "oscar_odin/catalogue",
+        "oscar_odin/partner",
+        "oscar_odin/offer",
+        "oscar_odin/address",
+        "oscar_odin/order",
+    ]
+
+    def get_order_resource(self, number):
+        resource = order_to_resource(Order.objects.get(number="100001"))
+        resource.number = number
+        return resource
+
+    def test_create_orders(self):
+        date_created = datetime(2019, 3, 1, 12, 0, tzinfo=timezone.utc)
+        resource = self.get_order_resource("200001")
+        resource.status_changes = [
+            StatusChangeResource(
+                old_status="Pending", new_status="Shipped", date_created=date_created
+            )
+        ]
+        resource.notes = [
+            NoteResource(
+                note_type="Info",
+                message="Imported",
+                date_created=date_created,
+                date_updated=date_created,
+            )
+        ]
+        resource.payment_events = [
+            PaymentEventResource(amount=D("35.00"), reference="1", event_type="Paid"),
+            PaymentEventResource(amount=D("5.00"), reference="2", event_type="Paid"),
+        ]
+        resource.shipping_events = [
+            ShippingEventResource(
+                event_type="Shipped", notes="", date_created=date_created
+            )
+        ]
+
+        orders, errors = orders_to_db([resource])
+        self.assertEqual(0, len(errors))
+        self.assertEqual(1, len(orders))
+
+        order = Order.objects.get(number="200001")
+        self.assertEqual("tim@savage.au", order.user.email)
+        self.assertEqual("", order.guest_email)
+        self.assertEqual(D("35.00"), order.total_incl_tax)
+        self.assertEqual("NL", order.shipping_address.country_id)
+        self.assertIn("Helmholz road", order.shipping_address.search_text)
+
+        lines = order.lines.order_by("pk")
+        self.assertEqual(2, len(lines))
+        self.assertEqual(D("15.00"), lines[0].line_price_incl_tax)
+        self.assertEqual(D("20.00"), lines[0].line_price_before_discounts_incl_tax)
+        self.assertEqual(2, lines[0].prices.count())
+        self.assertEqual(3, order.line_prices.count())
+        self.assertEqual(
+            {"testoption": "one sheep"},
+            {
+                attribute.type: attribute.value
+                for attribute in lines[0].attributes.all()
+            },
+        )
+
+        self.assertEqual(1, order.discounts.count())
+        self.assertEqual(2, order.payment_events.count())
+        self.assertEqual(1, PaymentEventType.objects.filter(name="Paid").count())
+        self.assertEqual("Shipped", order.shipping_events.get().event_type.name)
+        # The historical dates are kept
+        self.assertEqual(date_created, order.status_changes.get().date_created)
+        self.assertEqual(date_created, order.notes.get().date_created)
+
+    def test_update_orders(self):
+        resource = self.get_order_resource("200001")
+        orders_to_db([resource])
+        order = Order.objects.get(number="200001")
+        address_count = ShippingAddress.objects.count()
+
+        resource.total_incl_tax = D("20.00")
+        resource.lines = resource.lines[1:]
+        resource.shipping_address.line1 = "Updated road"
+        orders, errors = orders_to_db([resource])
+        self.assertEqual(0, len(errors))
+
+        updated_order = orders.get()
+        self.assertEqual(order.pk, updated_order.pk)
+        self.assertEqual(D("20.00"), updated_order.total_incl_tax)
+        self.assertEqual(1, updated_order.lines.count())
+        self.assertEqual(1, updated_order.line_prices.count())
+        self.assertEqual(1, updated_order.discounts.count())
+
+        # The address is updated rather than replaced
+        self.assertEqual(address_count, ShippingAddress.objects.count())
+        self.assertEqual(order.shipping_address_id, updated_order.shipping_address_id)
+        self.assertEqual("Updated road", updated_order.shipping_address.line1)
+
+    def test_unknown_user_becomes_guest_order(self):
+        resource = self.get_order_resource("200001")
+        resource.user = UserResource(
+            id=100, first_name="", last_name="", email="unknown@example.com"
+        )
+
+        orders, errors = orders_to_db([resource])
+        self.assertEqual(0, len(errors))
+
+        order = orders.get()
+        self.assertIsNone(order.user)
+        self.assertEqual("unknown@example.com", order.guest_email)
+
+    def test_unknown_line_relations(self):
+        resource = self.get_order_resource("200001")
+        # Ids of another platform, the first line can be found by upc and sku
+        for line in resource.lines:
+            line.product_id = 999999
+            line.stock_record_id = 999999
+        resource.lines[1].upc = "unknown"
+        resource.lines[1].partner_sku = "unknown"
+
+        orders, errors = orders_to_db([resource])
+        self.assertEqual(1, len(orders))
+        self.assertEqual(2, len(errors))
+        self.assertEqual(
+            [["200001"], ["200001"]], [error.identifier_values for error in errors]
+        )
+        self.assertEqual(
+            ["stockrecord", "product"],
+            [name for error in errors for name in error.error_dict],
+        )
+
+        lines = orders.get().lines.order_by("pk")
+        self.assertEqual((1, 210), (lines[0].stockrecord_id, lines[0].product_id))
+        self.assertEqual((None, None), (lines[1].stockrecord_id, lines[1].product_id))
+
+    def test_num_queries_do_not_depend_on_number_of_orders(self):
+        def count_queries(numbers):
+            resources = [self.get_order_resource(number) for number in numbers]
+            with CaptureQueriesContext(connection) as context:
+                _, errors = orders_to_db(resources, clean_instances=False)
+            self.assertEqual(0, len(errors))
+            return len(context)
+
+        self.assertEqual(
+            count_queries(["200001", "200002"]),
+            count_queries(["300001", "300002", "300003", "300004", "300005"]),
+        )
+        self.assertEqual(7, Order.objects.filter(number__gte="200001").count())
+        self.assertEqual(14, Line.objects.filter(order__number__gte="200001").count())
+
+
+@mock.patch.object(
+    Order,
+    "pipeline",
+    {"Pending": ("Shipped", "Cancelled"), "Shipped": ("Delivered",), "Delivered": ()},
+)
+@mock.patch.object(Order, "cascade", {"Shipped": "Shipped"})
+@mock.patch.object(
+    Line, "pipeline", {"Pending": ("Shipped", "Cancelled"), "Shipped": ()}
+)
+class OrderStatusesToDbTest(TestCase):
+    fixtures = [
+        "oscar_odin/auth",
+        "oscar_odin/catalogue",
+        "oscar_odin/partner",
+        "oscar_odin/offer",
+        "oscar_odin/address",
+        "oscar_odin/order",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        resource = order_to_resource(Order.objects.get(number="100001"))
+        for number in ["100002", "100003"]:
+            resource.number = number
+            orders_to_db([resource])
+
+    def test_set_statuses(self):
+        line = Line.objects.filter(order__number="100002").first()
+
+        orders, errors = order_statuses_to_db(
+            [
+                OrderStatusResource(number="100001", status="Shipped"),
+                OrderStatusResource(
+                    number="100002",
+                    status="Pending",
+                    lines=[LineStatusResource(line_id=line.pk, status="Cancelled")],
+                ),
+            ]
+        )
+        self.assertEqual(0, len(errors))
+        self.assertEqual({"100001", "100002"}, {order.number for order in orders})
+
+        order = Order.objects.get(number="100001")
+        self.assertEqual("Shipped", order.status)
+        # The status cascades to the lines
+        self.assertEqual({"Shipped"}, {line.status for line in order.lines.all()})
+        status_change = OrderStatusChange.objects.get(order=order)
+        self.assertEqual("Pending", status_change.old_status)
+        self.assertEqual("Shipped", status_change.new_status)
+
+        line.refresh_from_db()
+        self.assertEqual("Cancelled", line.status)
+        self.assertEqual("Pending", line.order.status)
+        self.assertFalse(OrderStatusChange.objects.filter(order=line.order).exists())
+
+    def test_repeated_order_number(self):
+        orders, errors = order_statuses_to_db(
+            [
+                OrderStatusResource(number="100001", status="Shipped"),
+                OrderStatusResource(number="100001", status="Delivered"),
+                OrderStatusResource(number="100001", status="Cancelled"),
+            ]
+        )
+        # The transitions are checked against the status of the record before it
+        self.assertEqual(1, len(errors))
+        self.assertIn("current status: 'Delivered'", str(errors[0]))
+        self.assertEqual(["100001"], [order.number for order in orders])
+
+        order = Order.objects.get(number="100001")
+        self.assertEqual("Delivered", order.status)
+        self.assertEqual(
+            [("Pending", "Shipped"), ("Shipped", "Delivered")],
+            list(
+                order.status_changes.order_by("pk").values_list(
+                    "old_status", "new_status"
+                )
+            ),
+        )
+        # The lines are cascaded by the first record
+        self.assertEqual({"Shipped"}, {line.status for line in order.lines.all()})
+
+    def test_invalid_statuses_are_errors(self):
+        orders, errors = order_statuses_to_db(
+            [
+                OrderStatusResource(number="100001", status="Unknown"),
+                OrderStatusResource(number="999999", status="Shipped"),
+                OrderStatusResource(
+                    number="100003",
+                    status="Pending",
+                    lines=[LineStatusResource(line_id=0, status="Shipped")],
+                ),
+                OrderStatusResource(number="100002", status="Cancelled"),
+            ]
+        )
+        self.assertEqual(3, len(errors))
+        self.assertListEqual(
+            [["100001"], ["999999"], ["100003"]],
+            [error.identifier_values for error in errors],
+        )
+        self.assertEqual(["100002"], [order.number for order in orders])
+        self.assertEqual("Pending", Order.objects.get(number="100001").status)
+
+    def test_num_queries(self):
+        statuses = [
+            OrderStatusResource(number=number, status="Shipped")
+            for number in ["100001", "100002", "100003"]
+        ]
+        # Select the orders and lines, update the orders and lines and insert the
+        # status changes, within a savepoint.
+        with self.assertNumQueries(7):
+            _, errors = order_statuses_to_db(statuses)
+        self.assertEqual(0, len(errors))
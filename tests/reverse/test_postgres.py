@@ -0,0 +1,137 @@
+from decimal import Decimal as D
+from unittest import skipUnless
+
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.catalogue import products_to_db
+from oscar_odin.mappings.context import CopyProductModelMapperContext
+from oscar_odin.postgres import copy_insert, format_copy_value
+from oscar_odin.resources.catalogue import (
+    CategoryResource,
+    ProductClassResource,
+    ProductResource,
+)
+
+Product = get_model("catalogue", "Product")
+ProductClass = get_model("catalogue", "ProductClass")
+ProductAttribute = get_model("catalogue", "ProductAttribute")
+Category = get_model("catalogue", "Category")
+Partner = get_model("partner", "Partner")
+
+
+class FormatCopyValueTest(SimpleTestCase):
+    def test_format_copy_value(self):
+        self.assertEqual("\\N", format_copy_value(None))
+        self.assertEqual("t", format_copy_value(True))
+        self.assertEqual("12.50", format_copy_value(D("12.50")))
+        self.assertEqual("tab\\tnew\\nline\\\\", format_copy_value("tab\tnew\nline\\"))
+
+
+class CopyProductsToDbTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        product_class = ProductClass.objects.create(name="Klaas", slug="klaas")
+        ProductAttribute.objects.create(
+            name="Henk",
+            code="henk",
+            type=ProductAttribute.TEXT,
+            product_class=product_class,
+        )
+        Category.add_root(name="Hatsie", slug="batsie", is_public=True, code="1")
+        self.partner = Partner.objects.create(name="klaas", code="klaas")
+
+    def get_product_resource(self, upc, title, price):
+        return ProductResource(
+            upc=upc,
+            title=title,
+            slug=f"product-{upc}",
+            structure=Product.STANDALONE,
+            price=price,
+            availability=2,
+            currency="EUR",
+            partner=self.partner,
+            product_class=ProductClassResource(slug="klaas"),
+            categories=[CategoryResource(code="1")],
+            attributes={"henk": title},
+        )
+
+    def test_products_to_db(self):
+        """The products are saved by COPY on PostgreSQL, the regular way otherwise"""
+        products_to_db(
+            [self.get_product_resource("1", "Henk", D("10"))],
+            context_mapper=CopyProductModelMapperContext,
+        )
+        products, errors = products_to_db(
+            [
+                self.get_product_resource("1", "Harrie", D("11")),
+                self.get_product_resource("2", "Klaas", D("12")),
+            ],
+            context_mapper=CopyProductModelMapperContext,
+        )
+        self.assertEqual(len(errors), 0)
+        self.assertEqual(products.count(), 2)
+
+        product = Product.objects.get(upc="1")
+        self.assertEqual(product.title, "Harrie")
+        self.assertEqual(product.attr.henk, "Harrie")
+        self.assertEqual(product.stockrecords.get().price, D("11"))
+        self.assertEqual(product.categories.get().code, "1")
+        self.assertEqual(Product.objects.get(upc="2").stockrecords.get().price, 12)
+
+    @skipUnless(connection.vendor == "postgresql", "COPY needs PostgreSQL")
+    def test_products_are_copied(self):
+        with CaptureQueriesContext(connection) as context:
+            _, errors = products_to_db(
+                [self.get_product_resource("1", "Henk", D("10"))],
+                context_mapper=CopyProductModelMapperContext,
+            )
+        self.assertEqual(len(errors), 0)
+
+        statements = [query["sql"] for query in context]
+        inserts = [sql for sql in statements if sql.startswith("INSERT INTO")]
+        self.assertTrue(inserts)
+        for sql in inserts:
+            self.assertIn("SELECT", sql)
+            self.assertNotIn("VALUES", sql)
+        self.assertTrue(
+            [sql for sql in statements if sql.startswith("CREATE TEMPORARY TABLE")]
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "COPY needs PostgreSQL")
+    def test_copied_rows_are_linked_by_pk(self):
+        resources = [
+            self.get_product_resource(str(upc), f"Product {upc}", D(upc))
+            for upc in range(1, 21)
+        ]
+        products, errors = products_to_db(
+            resources, context_mapper=CopyProductModelMapperContext
+        )
+        self.assertEqual(len(errors), 0)
+        self.assertEqual(products.count(), 20)
+
+        # The stockrecords are linked to the products the pks were taken for
+        for product in Product.objects.prefetch_related("stockrecords"):
+            self.assertEqual(product.title, f"Product {product.upc}")
+            self.assertEqual(
+                product.stockrecords.get().price, D(product.upc).quantize(D("0.01"))
+            )
+
+    @skipUnless(connection.vendor == "postgresql", "COPY needs PostgreSQL")
+    def test_failed_copy_keeps_pks_empty(self):
+        product_class = ProductClass.objects.get(slug="klaas")
+        Product.objects.create(upc="1", title="Henk", product_class=product_class)
+        products = [
+            Product(upc=upc, title="Harrie", slug="harrie", product_class=product_class)
+            for upc in ("2", "1")
+        ]
+
+        with self.assertRaises(IntegrityError):
+            copy_insert(Product, products)
+
+        for product in products:
+            self.assertIsNone(product.pk)
+            self.assertTrue(product._state.adding)
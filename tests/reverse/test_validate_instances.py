@@ -0,0 +1,90 @@
+from django.core.exceptions import NON_FIELD_ERRORS
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from oscar.core.loading import get_model
+
+from oscar_odin.mappings.constants import MODEL_IDENTIFIERS_MAPPING
+from oscar_odin.mappings.context import ModelMapperContext
+
+Partner = get_model("partner", "Partner")
+StockRecord = get_model("partner", "StockRecord")
+Product = get_model("catalogue", "Product")
+ProductClass = get_model("catalogue", "ProductClass")
+
+
+class ValidateInstancesTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        product_class = ProductClass.objects.create(name="Klaas", slug="klaas")
+        self.partner = Partner.objects.create(name="henk", code="henk")
+        self.products = [
+            Product.objects.create(
+                upc=f"upc-{index}", title=f"{index}", product_class=product_class
+            )
+            for index in range(10)
+        ]
+        self.stockrecords = [
+            StockRecord.objects.create(
+                product=product, partner=self.partner, partner_sku=product.upc
+            )
+            for product in self.products[:5]
+        ]
+
+    def get_context(self):
+        context = ModelMapperContext(StockRecord, error_identifiers=["partner_sku"])
+        context.identifier_mapping = MODEL_IDENTIFIERS_MAPPING
+        return context
+
+    def validate(self, instances, **kwargs):
+        context = self.get_context()
+        return context.validate_instances(instances, **kwargs), context.errors
+
+    def test_unique_together(self):
+        instances = [
+            StockRecord(product=product, partner=self.partner, partner_sku=sku)
+            for product, sku in [
+                (self.products[5], "upc-0"),
+                (self.products[6], "upc-6"),
+                (self.products[7], "upc-1"),
+            ]
+        ]
+        validated_instances, errors = self.validate(instances)
+
+        self.assertEqual([instances[1]], validated_instances)
+        self.assertEqual(2, len(errors))
+        self.assertEqual(
+            [["upc-0"], ["upc-1"]], [error.identifier_values for error in errors]
+        )
+        self.assertIn(NON_FIELD_ERRORS, errors[0].error_dict)
+
+    def test_existing_instances_are_not_duplicates_of_themselves(self):
+        validated_instances, errors = self.validate(self.stockrecords)
+        self.assertEqual(5, len(validated_instances))
+        self.assertEqual(0, len(errors))
+
+    def test_field_and_unique_errors_are_combined(self):
+        instance = StockRecord(partner=self.partner, partner_sku="upc-0")
+
+        _, errors = self.validate([instance])
+        self.assertEqual(1, len(errors))
+        self.assertEqual(
+            {"product", NON_FIELD_ERRORS}, set(errors[0].error_dict.keys())
+        )
+
+    def test_unique_checks_do_not_depend_on_number_of_instances(self):
+        def count_queries(products, validate_unique):
+            instances = [
+                StockRecord(product=product, partner=self.partner, partner_sku=index)
+                for index, product in enumerate(products)
+            ]
+            with CaptureQueriesContext(connection) as context:
+                self.validate(instances, validate_unique=validate_unique)
+            return len(context)
+
+        # One query for the partner and sku of all instances
+        for products in [self.products[5:6], self.products[5:]]:
+            self.assertEqual(
+                count_queries(products, False) + 1, count_queries(products, True)
+            )
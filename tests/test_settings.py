@@ -1,4 +1,5 @@
 import os
+import tempfile
 from oscar.defaults import *
 
 # Path helper
@@ -13,9 +14,29 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": ":memory:",
+        # The worker processes of the export tests open their own connections. The
+        # name is unique per run, so test runs on the same machine don't share it.
+        "TEST": {
+            "NAME": os.path.join(
+                tempfile.gettempdir(), "oscar_odin_tests_%s.sqlite3" % os.getpid()
+            )
+        },
     }
 }
 
+# Run the tests against PostgreSQL, eg. for the COPY loader
+if os.environ.get("POSTGRES_HOST"):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("POSTGRES_DB", "oscar_odin"),
+            "USER": os.environ.get("POSTGRES_USER", "postgres"),
+            "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+            "HOST": os.environ["POSTGRES_HOST"],
+            "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+        }
+    }
+
 SECRET_KEY = "123"
 
 TEMPLATES = [